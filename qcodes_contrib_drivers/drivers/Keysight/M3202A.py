@@ -7,9 +7,9 @@ class M3202A(SD_AWG_Async):
 
     M3202A channel numbers start with 1.
 
-    This driver is derived from SD_AWG_Async which uses a thread per module to
-    upload waveforms concurrently. The sychronous methods like load_waveform are
-    not available in this class.
+    This driver is derived from SD_AWG_Async which uploads waveforms in the
+    background on a worker pool shared by all modules in the chassis. The
+    sychronous methods like load_waveform are not available in this class.
 
     Example:
         awg1 = M3202A('awg1', 0, 2)
@@ -1,7 +1,7 @@
 # -*- coding: utf-8 -*-
 import threading
-import queue
 import sys
+import hashlib
 from typing import Dict, List, Union, Optional, TypeVar, Callable, Any, cast
 import time
 import logging
@@ -12,6 +12,7 @@ import numpy as np
 from .SD_Module import keysightSD1, result_parser
 from .SD_AWG import SD_AWG
 from .memory_manager import MemoryManager
+from .upload_scheduler import UploadScheduler
 
 
 F = TypeVar('F', bound=Callable[..., Any])
@@ -57,6 +58,12 @@ class Task:
     verbose = False
     ''' Enables verbose logging '''
 
+    priority: Optional[int] = None
+    ''' Upload priority for the scheduler. None executes the task in order of submission. '''
+
+    n_samples: int = 0
+    ''' Number of samples uploaded by the task. '''
+
     def __init__(self, f:F, instance: Any, *args, **kwargs) -> None:
         self._event = threading.Event()
         self._f = f
@@ -105,7 +112,7 @@ def threaded(wait: bool = False) -> Callable[[F], F]:
         def func_wrapper(self, *args, **kwargs):
 
             task = Task(func, self, *args, **kwargs)
-            self._task_queue.put(task)
+            self._scheduler.submit(self.module_id, task)
             if wait:
                 result = task.result
                 self._start_time = None
@@ -179,16 +186,27 @@ class _WaveformReferenceInternal(WaveformReference):
         self._upload_error: Optional[str] = None
         self._released: bool = False
         self._queued_count: int = 0
+        self._task: Optional[Task] = None
+        self._reference_count: int = 1
+        self._on_released: Optional[Callable[[], None]] = None
 
 
     def release(self) -> None:
         """
         Releases the memory for reuse.
+        If the reference has been shared by the waveform cache, the memory
+        is only released when all holders have released it.
         """
         if self._released:
             raise Exception('Reference already released')
 
+        self._reference_count -= 1
+        if self._reference_count > 0:
+            return
+
         self._released = True
+        if self._on_released:
+            self._on_released()
         self._try_release_slot()
 
 
@@ -219,6 +237,10 @@ class _WaveformReferenceInternal(WaveformReference):
         return self._uploaded.is_set()
 
 
+    def shared(self) -> None:
+        self._reference_count += 1
+
+
     def enqueued(self) -> None:
         self._queued_count += 1
 
@@ -245,10 +267,18 @@ class SD_AWG_Async(SD_AWG):
     """
     Generic asynchronous driver with waveform memory management for Keysight SD AWG modules.
 
-    This driver is derived from SD_AWG and uses a thread to upload waveforms.
+    This driver is derived from SD_AWG and uploads waveforms in the background.
     This class creates reusable memory slots of different sizes in AWG.
     It assigns waveforms to the smallest available memory slot.
 
+    The uploads of all modules in a chassis are scheduled on a shared pool of
+    worker threads, see `UploadScheduler`. Waveforms needed by `awg_queue_waveform`
+    are uploaded before waveforms that are prefetched.
+
+    Waveforms can be uploaded as float values in the range [-1.0, 1.0] with `upload_waveform`,
+    or as 16 bit DAC codes with `upload_waveform_int16`. The int16 data is passed to the SD1
+    library without scaling.
+
     Only one instance of this class per AWG module is allowed.
     By default the maximum size of a waveform is limited to 1e6 samples.
     This limit can be increased up to 1e8 samples at the cost of a longer startup time of the threads.
@@ -265,6 +295,8 @@ class SD_AWG_Async(SD_AWG):
         ref_1 = awg1.upload_waveform(wave1)
         ref_2 = awg2.upload_waveform(wave2)
         ref_3 = awg3.upload_waveform(wave3)
+        # waveform for a later sequence
+        ref_4 = awg1.upload_waveform(wave4, prefetch=True)
 
         trigger_mode = keysightSD1.SD_TriggerModes.EXTTRIG
         # method awg_queue_waveform blocks until reference waveform has been uploaded.
@@ -283,18 +315,31 @@ class SD_AWG_Async(SD_AWG):
             should be used. (Legacy numbering starts with channel 0)
         waveform_size_limit (int): maximum size of waveform that can be uploaded
         asynchronous (bool): if False the memory manager and asynchronous functionality are disabled.
+        waveform_cache (bool): if True identical waveforms share a single upload and memory slot.
+        memory_sizes (Optional[List[Tuple[int, int]]]): slot sizes and numbers of slots for the
+            memory manager. Default: `MemoryManager.memory_sizes`
+        upload_scheduler (Optional[UploadScheduler]): scheduler for the uploads.
+            Default: the scheduler shared by all modules in the chassis.
     """
 
     _modules: Dict[str, 'SD_AWG_Async'] = {}
     """ All async modules by unique module id. """
 
     def __init__(self, name, chassis, slot, channels, triggers, waveform_size_limit=1e6,
-                 asynchronous=True, **kwargs) -> None:
+                 asynchronous=True, memory_sizes=None, waveform_cache=False,
+                 upload_scheduler: Optional[UploadScheduler] = None,
+                 **kwargs) -> None:
         super().__init__(name, chassis, slot, channels, triggers, **kwargs)
 
         self._asynchronous = False
         self._waveform_size_limit = waveform_size_limit
+        self._memory_sizes = memory_sizes
+        self._waveform_cache_enabled = waveform_cache
+        self._waveform_cache: Dict[str, _WaveformReferenceInternal] = {}
         self._start_time = None
+        if upload_scheduler is None:
+            upload_scheduler = UploadScheduler.for_chassis(chassis)
+        self._scheduler = upload_scheduler
 
         module_id = self._get_module_id()
         if module_id in SD_AWG_Async._modules:
@@ -551,6 +596,8 @@ class SD_AWG_Async(SD_AWG):
 
             self.log.debug(f'Enqueue {waveform_ref.wave_number}')
             if not waveform_ref.is_uploaded():
+                if waveform_ref._task:
+                    self._scheduler.promote(waveform_ref._task, UploadScheduler.URGENT)
                 start = time.perf_counter()
                 self.log.debug(f'Waiting till wave {waveform_ref.wave_number} is uploaded')
                 waveform_ref.wait_uploaded()
@@ -582,25 +629,126 @@ class SD_AWG_Async(SD_AWG):
 
 
     @switchable(asynchronous, enabled=True)
-    def upload_waveform(self, wave: Union[List[float], List[int], np.ndarray]
-                        ) -> _WaveformReferenceInternal:
+    def upload_waveform(self, wave: Union[List[float], List[int], np.ndarray],
+                        prefetch: bool = False) -> _WaveformReferenceInternal:
         """
         Upload the wave using the uploader thread for this AWG.
+
+        When the waveform cache is enabled and an identical wave is already
+        in AWG memory, the reference to that wave is returned instead. The
+        reference must then be released once more.
+
         Args:
-            wave: wave data to upload.
+            wave: wave data to upload. Values must be in the range [-1.0, 1.0].
+            prefetch: if True the wave is uploaded after the waves that are
+                not prefetched. The upload is expedited when the wave is queued.
         Returns:
             reference to the wave
         """
+        return self._upload_waveform(wave, prefetch)
+
+
+    @switchable(asynchronous, enabled=True)
+    def upload_waveform_int16(self, wave: np.ndarray,
+                              prefetch: bool = False) -> _WaveformReferenceInternal:
+        """
+        Upload the wave with 16 bit DAC codes using the uploader thread for this AWG.
+        This is the asynchronous counterpart of `load_waveform_int16`.
+
+        The data is handed to the SD1 library without scaling.
+        The array must not be modified until the upload has finished.
+
+        Args:
+            wave: int16 array with wave data. -32767..32767 corresponds to -1.0..1.0.
+            prefetch: if True the wave is uploaded after the waves that are
+                not prefetched. The upload is expedited when the wave is queued.
+        Returns:
+            reference to the wave
+        """
+        if not isinstance(wave, np.ndarray) or wave.dtype != np.int16:
+            raise Exception(f'Wave must be a numpy array of int16, not {getattr(wave, "dtype", type(wave))}')
+        return self._upload_waveform(np.ascontiguousarray(wave), prefetch)
+
+
+    def _upload_waveform(self, wave: Union[List[float], List[int], np.ndarray],
+                         prefetch: bool) -> _WaveformReferenceInternal:
         if len(wave) < 2000:
             raise Exception(f'{len(wave)} is less than 2000 samples required for proper functioning of AWG')
 
+        priority = UploadScheduler.PREFETCH if prefetch else UploadScheduler.NORMAL
+        key = None
+        if self._waveform_cache_enabled:
+            key = self._waveform_key(wave)
+            cached = self._waveform_cache.get(key)
+            if cached is not None and not cached._upload_error:
+                cached.shared()
+                if cached._task:
+                    self._scheduler.promote(cached._task, priority)
+                self.log.debug(f'reuse: {cached.wave_number}')
+                return cached
+
         allocated_slot = self._memory_manager.allocate(len(wave))
         ref = _WaveformReferenceInternal(allocated_slot, self.name)
+        if key is not None:
+            self._waveform_cache[key] = ref
+            ref._on_released = lambda: self._forget_waveform(key, ref)
         self.log.debug(f'upload: {ref.wave_number}')
-        self._upload(wave, ref)
+        task = Task(SD_AWG_Async._upload, self, wave, ref)
+        task.priority = priority
+        task.n_samples = len(wave)
+        ref._task = task
+        self._scheduler.submit(self.module_id, task)
         return ref
 
 
+    def upload_stats(self) -> Dict[str, Any]:
+        """
+        Returns queue depth and throughput of the uploads of this module.
+        See `UploadScheduler.stats()`.
+        """
+        return self._scheduler.stats()[self.module_id]
+
+
+    def set_waveform_cache(self, enabled: bool) -> None:
+        """
+        Enables or disables sharing of identical waveforms.
+
+        Waves already in AWG memory are forgotten by the cache when it is
+        disabled, but stay valid until released.
+
+        Args:
+            enabled: new state of the waveform cache.
+        """
+        self._waveform_cache_enabled = enabled
+        if not enabled:
+            self._waveform_cache = {}
+
+
+    def waveform_cache_size(self) -> int:
+        """
+        Returns the number of distinct waves in the waveform cache.
+        """
+        return len(self._waveform_cache)
+
+
+    @staticmethod
+    def _waveform_key(wave: Union[List[float], List[int], np.ndarray]) -> str:
+        # The type and length are part of the key, because int16 and float data
+        # of different lengths can have the same bytes.
+        if isinstance(wave, np.ndarray) and wave.dtype == np.int16:
+            data = wave
+            wave_type = 'int16'
+        else:
+            data = np.ascontiguousarray(wave, dtype=float)
+            wave_type = 'float'
+        return f'{wave_type}:{len(data)}:{hashlib.sha1(data.tobytes()).hexdigest()}'
+
+
+    def _forget_waveform(self, key: str, ref: _WaveformReferenceInternal) -> None:
+        if self._waveform_cache.get(key) is ref:
+            del self._waveform_cache[key]
+
+
     def close(self) -> None:
         """
         Closes the module and stops background thread.
@@ -626,33 +774,27 @@ class SD_AWG_Async(SD_AWG):
         Starts the asynchronous upload thread and memory manager.
         """
         super().flush_waveform()
-        self._memory_manager: MemoryManager = MemoryManager(self.log, self._waveform_size_limit)
+        self._memory_manager: MemoryManager = MemoryManager(self.log, self._waveform_size_limit,
+                                                            self._memory_sizes)
         self._enqueued_waverefs:Dict[int, List[_WaveformReferenceInternal]] = {}
         for i in range(self.channels):
             self._enqueued_waverefs[i+1] = []
 
-        self._task_queue: queue.Queue = queue.Queue()
+        self._scheduler.register(self.module_id)
         self._init_awg_memory()
-        self._thread: threading.Thread = threading.Thread(target=self._run, name=f'uploader-{self.module_id}')
-        self._thread.start()
 
 
     def _stop_asynchronous(self) -> None:
         """
-        Stops the asynchronous upload thread and memory manager.
+        Stops the asynchronous uploads and memory manager.
         """
-        if self._task_queue:
-            self._task_queue.put('STOP')
-
         # wait at most 15 seconds. Should be more enough for normal scenarios
-        self._thread.join(15)
-        if self._thread.is_alive():
-            self.log.error(f'AWG upload thread {self.module_id} stop failed. Thread still running.')
+        if not self._scheduler.unregister(self.module_id, 15):
+            self.log.error(f'AWG uploads {self.module_id} stop failed. Uploads still running.')
 
         self._release_waverefs()
+        self._waveform_cache = {}
         del self._memory_manager
-        del self._task_queue
-        del self._thread
 
 
     def _release_waverefs(self) -> None:
@@ -696,7 +838,6 @@ class SD_AWG_Async(SD_AWG):
         self.log.info(f'Awg memory reserved: {len(new_slots)} slots, {total_size/1e6} MSa in '
                       f'{total_duration*1000:5.2f} ms ({total_size/total_duration/1e6:5.2f} MSa/s)')
 
-    @threaded()
     def _upload(self,
                 wave_data: Union[List[float], List[int], np.ndarray],
                 wave_ref: _WaveformReferenceInternal) -> None:
@@ -704,37 +845,37 @@ class SD_AWG_Async(SD_AWG):
         try:
             start = time.perf_counter()
 
-            wave = keysightSD1.SD_Wave()
-            result_parser(wave.newFromArrayDouble(keysightSD1.SD_WaveformTypes.WAVE_ANALOG, wave_data))
-            super().reload_waveform(wave, wave_ref.wave_number)
+            if isinstance(wave_data, np.ndarray) and wave_data.dtype == np.int16:
+                self._reload_waveform_int16_array(wave_data, wave_ref.wave_number)
+            else:
+                wave = keysightSD1.SD_Wave()
+                result_parser(wave.newFromArrayDouble(keysightSD1.SD_WaveformTypes.WAVE_ANALOG, wave_data))
+                super().reload_waveform(wave, wave_ref.wave_number)
 
             duration = time.perf_counter() - start
             speed = len(wave_data)/duration
             self.log.debug(f'Uploaded {wave_ref.wave_number} in {duration*1000:5.2f} ms ({speed/1e6:5.2f} MSa/s)')
         except Exception as ex:
             msg = f'{type(ex).__name__}:{ex}'
+            is_int16 = isinstance(wave_data, np.ndarray) and wave_data.dtype == np.int16
             min_value = np.min(wave_data)
             max_value = np.max(wave_data)
-            if min_value < -1.0 or max_value > 1.0:
+            if not is_int16 and (min_value < -1.0 or max_value > 1.0):
                 msg += ': Voltage out of range'
             self.log.error(f'Failure load waveform {wave_ref.wave_number}: {msg}' )
             wave_ref._upload_error = msg
 
         # signal upload done, either successful or with error
+        wave_ref._task = None
         wave_ref._uploaded.set()
 
 
-    def _run(self) -> None:
-        self.log.info('Uploader ready')
-
-        while True:
-            task: Task = self._task_queue.get()
-            if task == 'STOP':
-                break
-            try:
-                task.run()
-            except:
-                logging.error('Task thread error', exc_info=True)
-            del task
-
-        self.log.info('Uploader terminated')
+    def _reload_waveform_int16_array(self, wave_data: np.ndarray, waveform_number: int) -> None:
+        """
+        Replaces the waveform in AWG memory with the int16 data in `wave_data`
+        using the public SD1 call waveformReLoadArrayInt16.
+        SD1 copies the data element by element into a ctypes array, so it is
+        passed as a list, which SD1 converts faster than a numpy array.
+        """
+        wave_type = keysightSD1.SD_WaveformTypes.WAVE_ANALOG
+        super().reload_waveform_int16(wave_type, wave_data.tolist(), waveform_number)
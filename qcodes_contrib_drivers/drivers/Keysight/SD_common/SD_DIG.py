@@ -2,6 +2,7 @@ from qcodes.utils.validators import Numbers, Enum, Ints
 from functools import partial
 
 from .SD_Module import *
+from .daq_stream import DaqStream
 
 
 class SD_DIG(SD_Module):
@@ -353,6 +354,61 @@ class SD_DIG(SD_Module):
         value_name = 'DAQ_flush_multiple mask {:#b}'.format(daq_mask)
         return result_parser(value, value_name, verbose)
 
+    def daq_buffer_pool_config(self, daq, n_points, timeout=0, verbose=False):
+        """ Configure the buffer pool of the specified DAQ for continuous acquisition
+
+        Args:
+            daq (int)       : the DAQ you are configuring
+            n_points (int)  : the number of points per buffer
+            timeout (int)   : the timeout in ms to return a partially filled buffer
+        """
+        value = self.SD_AIN.DAQbufferPoolConfig(daq, n_points, timeout)
+        value_name = 'DAQ_buffer_pool_config channel {}'.format(daq)
+        return result_parser(value, value_name, verbose)
+
+    def daq_buffer_get(self, daq, verbose=False):
+        """ Get the next filled buffer of the buffer pool of the specified DAQ
+
+        Args:
+            daq (int)       : the DAQ you are reading from
+        """
+        value = self.SD_AIN.DAQbufferGet(daq)
+        value_name = 'DAQ_buffer_get channel {}'.format(daq)
+        return result_parser(value, value_name, verbose)
+
+    def daq_buffer_pool_release(self, daq, verbose=False):
+        """ Release the buffer pool of the specified DAQ
+
+        Args:
+            daq (int)       : the DAQ you are releasing
+        """
+        value = self.SD_AIN.DAQbufferPoolRelease(daq)
+        value_name = 'DAQ_buffer_pool_release channel {}'.format(daq)
+        return result_parser(value, value_name, verbose)
+
+    def start_stream(self, daqs, block_size, n_blocks=4, callback=None, timeout=100):
+        """ Start continuous acquisition of the specified DAQs in the background
+
+        The DAQs are read into preallocated ring buffers from a background thread
+        using the SD1 buffer pool, or daq_read if the pool is not available.
+        Blocks are delivered to the callback or by iterating over the stream.
+        See DaqStream.
+
+        Args:
+            daqs (list)     : the DAQs you are acquiring
+            block_size (int): the number of points per block
+            n_blocks (int)  : the number of blocks in the ring buffer per DAQ
+            callback        : function called with every DaqBlock, or None
+            timeout (int)   : the read timeout in ms
+
+        Returns:
+            the started DaqStream. Used as context manager it is stopped on exit.
+        """
+        stream = DaqStream(self, daqs, block_size, n_blocks, callback, timeout,
+                           use_buffer_pool=hasattr(self.SD_AIN, 'DAQbufferPoolConfig'))
+        stream.start()
+        return stream
+
     def set_trigger_io(self, val, verbose=False):
         """ Write a value to the IO trigger port
 
@@ -0,0 +1,289 @@
+# -*- coding: utf-8 -*-
+import threading
+import queue
+import logging
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Iterator, List, NamedTuple, Optional, Sequence
+
+import numpy as np
+
+
+class DaqBlock(NamedTuple):
+    """
+    Block of samples acquired by a DAQ.
+
+    Blocks are numbered per DAQ. A gap in the numbers indicates dropped blocks.
+    The data is a view on the ring buffer of the stream and is only valid until
+    the block is released.
+    """
+    daq: int
+    number: int
+    data: np.ndarray
+    slot: int
+
+
+class DaqStream:
+    """
+    Continuous acquisition of one or more DAQs of a digitizer.
+
+    A background thread reads the data of the DAQs and copies it to preallocated ring
+    buffers of `n_blocks` blocks of `block_size` samples per DAQ. Completed blocks are
+    delivered to the callback, or to the iterator of the stream. The block is released
+    when the callback returns or when the iterator continues with the next block.
+    When all blocks of a DAQ are in use by the consumer, the newly acquired data is
+    dropped and counted.
+
+    The data is read with the SD1 DAQ buffer pool, or with `daq_read` when the pool
+    is not available. The DAQs are started together with `daq_start_multiple`.
+    Configure the DAQs for continuous acquisition before starting the stream.
+    The digitizer must not be read by other code while the stream is running.
+
+    Example:
+        stream = dig.start_stream([0, 1], block_size=100_000)
+        for block in stream:
+            process(block.daq, block.data)
+            if done:
+                stream.stop()
+        print(stream.stats())
+
+    Args:
+        digitizer: SD_DIG instance.
+        daqs: DAQs to acquire.
+        block_size: number of samples per block.
+        n_blocks: number of blocks in the ring buffer of every DAQ.
+        callback: function called with every DaqBlock from a delivery thread.
+            If None, the blocks are delivered by iterating over the stream.
+        timeout_ms: timeout of a single read in ms.
+        use_buffer_pool: if True the SD1 DAQ buffer pool is used, else `daq_read`.
+    """
+
+    @dataclass
+    class _Ring:
+        buffer: np.ndarray
+        free_slots: 'queue.Queue[int]'
+        slot: Optional[int] = None
+        fill: int = 0
+        number: int = 0
+        n_delivered: int = 0
+        n_dropped: int = 0
+        n_samples: int = 0
+
+    def __init__(self, digitizer: Any, daqs: Sequence[int], block_size: int,
+                 n_blocks: int = 4,
+                 callback: Optional[Callable[[DaqBlock], None]] = None,
+                 timeout_ms: int = 100,
+                 use_buffer_pool: bool = True) -> None:
+        if not daqs:
+            raise Exception('At least one DAQ is required')
+        if n_blocks < 2:
+            raise Exception(f'Stream needs at least 2 blocks per DAQ, not {n_blocks}')
+        if block_size <= 0:
+            raise Exception(f'Block size must be positive, not {block_size}')
+
+        self._digitizer = digitizer
+        self._daqs = list(daqs)
+        self._daq_mask = sum(1 << daq for daq in self._daqs)
+        self._block_size = block_size
+        self._callback = callback
+        self._timeout_ms = timeout_ms
+        self._use_buffer_pool = use_buffer_pool
+
+        self._rings: Dict[int, DaqStream._Ring] = {}
+        for daq in self._daqs:
+            free_slots: 'queue.Queue[int]' = queue.Queue()
+            for slot in range(n_blocks):
+                free_slots.put(slot)
+            self._rings[daq] = DaqStream._Ring(np.zeros((n_blocks, block_size), np.int16),
+                                               free_slots)
+        # data of dropped blocks is read into the scratch buffer
+        self._scratch = np.zeros(block_size, np.int16)
+
+        self._ready: 'queue.Queue[Optional[DaqBlock]]' = queue.Queue()
+        self._stop_event = threading.Event()
+        self._error: Optional[Exception] = None
+        self._stopped = False
+        self._reader: Optional[threading.Thread] = None
+        self._delivery: Optional[threading.Thread] = None
+
+    @property
+    def daqs(self) -> List[int]:
+        return list(self._daqs)
+
+    @property
+    def block_size(self) -> int:
+        return self._block_size
+
+    @property
+    def running(self) -> bool:
+        return self._reader is not None and self._reader.is_alive()
+
+    def start(self) -> None:
+        """
+        Configures the buffers, starts the DAQs and the acquisition thread.
+        The buffer pools already configured are released when the start fails.
+        """
+        if self._reader is not None:
+            raise Exception('Stream already started')
+
+        configured: List[int] = []
+        try:
+            for daq in self._daqs:
+                if self._use_buffer_pool:
+                    self._digitizer.daq_buffer_pool_config(daq, self._block_size, self._timeout_ms)
+                    configured.append(daq)
+                else:
+                    self._digitizer.set_n_points(self._block_size, daq)
+                    self._digitizer.set_timeout(self._timeout_ms, daq)
+
+            self._digitizer.daq_start_multiple(self._daq_mask)
+        except:
+            for daq in configured:
+                self._digitizer.daq_buffer_pool_release(daq)
+            raise
+
+        self._reader = threading.Thread(target=self._run_reader, name='daq-stream-reader')
+        self._reader.start()
+        if self._callback:
+            self._delivery = threading.Thread(target=self._run_delivery,
+                                              name='daq-stream-delivery')
+            self._delivery.start()
+
+    def stop(self) -> None:
+        """
+        Stops the acquisition and the DAQs.
+        Blocks acquired before the stop are still delivered.
+        Raises the exception that stopped the acquisition thread, if any.
+        Stopping the stream again does not stop the DAQs or raise again.
+        """
+        first_stop = not self._stopped
+        self._stopped = True
+        self._stop_event.set()
+        if self._reader is not None and self._reader is not threading.current_thread():
+            self._reader.join()
+            if first_stop:
+                self._digitizer.daq_stop_multiple(self._daq_mask)
+                if self._use_buffer_pool:
+                    for daq in self._daqs:
+                        self._digitizer.daq_buffer_pool_release(daq)
+        if self._delivery is not None and self._delivery is not threading.current_thread():
+            self._delivery.join()
+        if first_stop and self._error:
+            raise self._error
+
+    def release(self, block: DaqBlock) -> None:
+        """
+        Returns the block to the ring buffer.
+        Only needed when blocks are taken with `get_block`.
+        """
+        self._rings[block.daq].free_slots.put(block.slot)
+
+    def get_block(self, timeout: Optional[float] = None) -> Optional[DaqBlock]:
+        """
+        Returns the next block, or None when the stream has ended.
+        The block must be returned with `release`.
+
+        Args:
+            timeout: maximum time to wait in seconds.
+        """
+        if self._callback:
+            raise Exception('Blocks are delivered to the callback')
+        try:
+            block = self._ready.get(timeout=timeout)
+        except queue.Empty:
+            raise TimeoutError(f'No DAQ block received within {timeout} s')
+        if block is None:
+            # keep the end marker for other consumers
+            self._ready.put(None)
+            if self._error:
+                raise self._error
+        return block
+
+    def __iter__(self) -> Iterator[DaqBlock]:
+        while True:
+            block = self.get_block()
+            if block is None:
+                return
+            try:
+                yield block
+            finally:
+                self.release(block)
+
+    def __enter__(self) -> 'DaqStream':
+        # streams from `SD_DIG.start_stream` have already been started
+        if self._reader is None:
+            self.start()
+        return self
+
+    def __exit__(self, exc_type: Any, exc_val: Any, exc_tb: Any) -> None:
+        self.stop()
+
+    def stats(self) -> Dict[int, Dict[str, int]]:
+        '''
+        Returns statistics per DAQ.
+
+        * n_blocks: number of blocks delivered
+        * n_dropped: number of blocks dropped because the consumer was too slow
+        * n_samples: number of samples acquired, including dropped samples
+        '''
+        return {daq: {'n_blocks': ring.n_delivered,
+                      'n_dropped': ring.n_dropped,
+                      'n_samples': ring.n_samples}
+                for daq, ring in self._rings.items()}
+
+    def _read(self, daq: int) -> np.ndarray:
+        if self._use_buffer_pool:
+            data = self._digitizer.daq_buffer_get(daq)
+        else:
+            data = self._digitizer.daq_read(daq)
+        if data is None:
+            return self._scratch[:0]
+        return np.asarray(data)
+
+    def _store(self, daq: int, data: np.ndarray) -> None:
+        ring = self._rings[daq]
+        ring.n_samples += len(data)
+        position = 0
+        while position < len(data):
+            if ring.fill == 0:
+                try:
+                    ring.slot = ring.free_slots.get_nowait()
+                except queue.Empty:
+                    ring.slot = None
+
+            target = ring.buffer[ring.slot] if ring.slot is not None else self._scratch
+            n = min(len(data) - position, self._block_size - ring.fill)
+            target[ring.fill:ring.fill + n] = data[position:position + n]
+            ring.fill += n
+            position += n
+
+            if ring.fill == self._block_size:
+                if ring.slot is not None:
+                    ring.n_delivered += 1
+                    self._ready.put(DaqBlock(daq, ring.number, target, ring.slot))
+                else:
+                    ring.n_dropped += 1
+                ring.number += 1
+                ring.fill = 0
+
+    def _run_reader(self) -> None:
+        try:
+            while not self._stop_event.is_set():
+                for daq in self._daqs:
+                    self._store(daq, self._read(daq))
+        except Exception as ex:
+            logging.error('DAQ stream failed', exc_info=True)
+            self._error = ex
+        finally:
+            self._ready.put(None)
+
+    def _run_delivery(self) -> None:
+        assert self._callback is not None
+        while True:
+            block = self._ready.get()
+            if block is None:
+                break
+            try:
+                self._callback(block)
+            except:
+                logging.error('DAQ stream callback error', exc_info=True)
+            self.release(block)
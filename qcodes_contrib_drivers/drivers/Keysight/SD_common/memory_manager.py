@@ -1,6 +1,9 @@
 # -*- coding: utf-8 -*-
+from bisect import bisect_left
+from collections import deque
 from dataclasses import dataclass
-from typing import List, Dict
+from math import ceil
+from typing import List, Dict, Deque, Optional, Sequence, Tuple, Any
 import logging
 from datetime import datetime
 
@@ -11,15 +14,23 @@ class MemoryManager:
     AWG memory is reserved in slots of sizes from 1e4 till 1e8 samples.
     Allocation of memory takes time. So, only request a high maximum waveform size when it is needed.
 
-    Memory slots (number: size):
+    Default memory slots (number: size):
         400: 1e4 samples
         100: 1e5 samples
         20: 1e6 samples
         8: 1e7 samples
         4: 1e8 samples
 
+    A waveform is assigned to a slot of the smallest size that fits. When
+    all slots of that size are in use, a slot of the next larger size is used.
+
+    The manager keeps a histogram of the requested waveform sizes. Use
+    `suggest_memory_sizes()` to derive a slot mix that matches the observed
+    demand, and pass it as `memory_sizes` to the next memory manager.
+
     Args:
         waveform_size_limit: maximum waveform size to support.
+        memory_sizes: list of (slot size, number of slots). Default: `MemoryManager.memory_sizes`
     """
     verbose = False
 
@@ -43,6 +54,8 @@ class MemoryManager:
         Used to check for incorrect or missing release calls.
         '''
         allocation_time: str = ''
+        requested_size: int = 0
+        '''Number of samples requested by the current allocation.'''
 
     # Note (M3202A): size must be multiples of 10 and >= 2000
     memory_sizes = [
@@ -53,16 +66,29 @@ class MemoryManager:
             (int(1e8), 4) # Uploading 4e8 samples takes 7.3s.
             ]
 
-    def __init__(self, log, waveform_size_limit: int = int(1e6)) -> None:
+    def __init__(self, log, waveform_size_limit: int = int(1e6),
+                 memory_sizes: Optional[Sequence[Tuple[int, int]]] = None) -> None:
         self._log = log
         self._allocation_ref_count: int = 0
         self._created_size: int = 0
         self._max_waveform_size: int = 0
 
-        self._free_memory_slots: Dict[int, List[int]] = {}
+        if memory_sizes is None:
+            memory_sizes = MemoryManager.memory_sizes
+        self._check_memory_sizes(memory_sizes)
+        self._memory_sizes = sorted(memory_sizes)
+
+        self._free_memory_slots: Dict[int, Deque[int]] = {}
         self._slots: List[MemoryManager._MemorySlot] = []
-        self._slot_sizes = sorted([size for size, _ in
-                                   MemoryManager.memory_sizes])
+        self._slot_sizes = [size for size, _ in self._memory_sizes]
+
+        # Statistics
+        self._n_allocations: int = 0
+        self._n_fallbacks: int = 0
+        self._n_failures: int = 0
+        self._requested_histogram: Dict[int, int] = {size: 0 for size in self._slot_sizes}
+        self._demand: Dict[int, int] = {size: 0 for size in self._slot_sizes}
+        self._peak_demand: Dict[int, int] = {size: 0 for size in self._slot_sizes}
 
         self.set_waveform_limit(waveform_size_limit)
 
@@ -101,6 +127,9 @@ class MemoryManager:
         """
         Allocates a memory slot with at least the specified wave size.
 
+        If all slots of the smallest fitting size are in use, a slot of the
+        next larger size is allocated.
+
         Args:
             wave_size: number of samples of the waveform
         Returns:
@@ -111,22 +140,22 @@ class MemoryManager:
                             f'Max size={self._max_waveform_size}. Increase '
                             f'waveform size limit with set_waveform_limit().')
 
-        for slot_size in self._slot_sizes:
-            if wave_size > slot_size:
-                continue
+        first_index = bisect_left(self._slot_sizes, wave_size)
+        requested_class = self._slot_sizes[first_index]
+        self._requested_histogram[requested_class] += 1
+
+        for slot_size in self._slot_sizes[first_index:]:
             if slot_size > self._created_size:
                 # slots of this size are not initialized.
                 break
-            if len(self._free_memory_slots[slot_size]) > 0:
-                slot = self._free_memory_slots[slot_size].pop(0)
-                self._allocation_ref_count += 1
-                self._slots[slot].allocation_ref = self._allocation_ref_count
-                self._slots[slot].allocated = True
-                self._slots[slot].allocation_time = datetime.now().strftime('%H:%M:%S.%f')
-                if MemoryManager.verbose:
-                    self._log.debug(f'Allocated slot {slot}')
-                return MemoryManager.AllocatedSlot(slot, self._slots[slot].allocation_ref, self)
-
+            free_slots = self._free_memory_slots[slot_size]
+            if free_slots:
+                slot = free_slots.popleft()
+                if slot_size != requested_class:
+                    self._n_fallbacks += 1
+                return self._take_slot(slot, wave_size, requested_class)
+
+        self._n_failures += 1
         raise Exception(f'No free memory slots left for waveform with'
                         f' {wave_size} samples.')
 
@@ -145,8 +174,10 @@ class MemoryManager:
                             f'mismatch:{slot.allocation_ref} is not equal to '
                             f'{allocated_slot.allocation_ref}')
 
+        self._demand[self._get_slot_size(slot.requested_size)] -= 1
         slot.allocated = False
         slot.allocation_ref = 0
+        slot.requested_size = 0
         self._free_memory_slots[slot.size].append(slot_number)
 
         if MemoryManager.verbose:
@@ -156,6 +187,23 @@ class MemoryManager:
                 # self._log throws exception when instrument has been closed.
                 logging.debug(f'Released slot {slot_number}')
 
+    def _take_slot(self, slot: int, wave_size: int,
+                   requested_class: int) -> 'MemoryManager.AllocatedSlot':
+        self._allocation_ref_count += 1
+        memory_slot = self._slots[slot]
+        memory_slot.allocation_ref = self._allocation_ref_count
+        memory_slot.allocated = True
+        memory_slot.requested_size = wave_size
+        memory_slot.allocation_time = datetime.now().strftime('%H:%M:%S.%f')
+
+        self._n_allocations += 1
+        self._demand[requested_class] += 1
+        self._peak_demand[requested_class] = max(self._peak_demand[requested_class],
+                                                 self._demand[requested_class])
+        if MemoryManager.verbose:
+            self._log.debug(f'Allocated slot {slot}')
+        return MemoryManager.AllocatedSlot(slot, memory_slot.allocation_ref, self)
+
     def _create_memory_slots(self, max_size: int) -> None:
 
         creation_limit = self._get_slot_size(max_size)
@@ -163,13 +211,13 @@ class MemoryManager:
         free_slots = self._free_memory_slots
         slots = self._slots
 
-        for size, amount in sorted(MemoryManager.memory_sizes):
+        for size, amount in self._memory_sizes:
             if size > creation_limit:
                 break
             if size <= self._created_size:
                 continue
 
-            free_slots[size] = []
+            free_slots[size] = deque()
             for i in range(amount):
                 number = len(slots)
                 free_slots[size].append(number)
@@ -180,12 +228,27 @@ class MemoryManager:
         self._created_size = creation_limit
 
     def _get_slot_size(self, size: int) -> int:
-        for slot_size in self._slot_sizes:
-            if slot_size >= size:
-                return slot_size
+        index = bisect_left(self._slot_sizes, size)
+        if index < len(self._slot_sizes):
+            return self._slot_sizes[index]
 
         raise Exception(f'Requested waveform size {size} is too big')
 
+    @staticmethod
+    def _check_memory_sizes(memory_sizes: Sequence[Tuple[int, int]]) -> None:
+        sizes = [size for size, _ in memory_sizes]
+        if not sizes:
+            raise Exception('At least one memory slot size is required')
+        if len(set(sizes)) != len(sizes):
+            raise Exception(f'Memory slot sizes must be unique: {sizes}')
+        for size, amount in memory_sizes:
+            if size < 2000 or size % 10 != 0:
+                raise Exception(f'Memory slot size {size} must be a multiple '
+                                f'of 10 and at least 2000')
+            if amount < 0:
+                raise Exception(f'Number of memory slots of size {size} '
+                                f'must not be negative')
+
     def mem_usage(self):
         '''
         Example:
@@ -202,6 +265,84 @@ class MemoryManager:
         result['Free'] = {size:len(slots) for size,slots in self._free_memory_slots.items()}
         return result
 
+    def memory_stats(self) -> Dict[str, Any]:
+        '''
+        Returns utilisation and fragmentation statistics.
+
+        * reserved_samples: samples reserved in AWG memory
+        * allocated_samples: samples in allocated slots
+        * requested_samples: samples of the waveforms in allocated slots
+        * utilisation: allocated / reserved samples
+        * fragmentation: fraction of allocated samples not used by the
+          waveforms (internal fragmentation)
+        * n_allocations, n_fallbacks, n_failures: number of allocations,
+          of allocations that used a larger slot size because the fitting
+          size was exhausted, and of allocations that failed
+        * requested_histogram: number of requests per fitting slot size
+        * peak_demand: max number of simultaneous allocations per fitting
+          slot size
+
+        Example:
+            pprint(awg._memory_manager.memory_stats(), sort_dicts=False)
+        '''
+        reserved = sum(slot.size for slot in self._slots)
+        allocated = sum(slot.size for slot in self._slots if slot.allocated)
+        requested = sum(slot.requested_size for slot in self._slots if slot.allocated)
+        return {
+            'reserved_samples': reserved,
+            'allocated_samples': allocated,
+            'requested_samples': requested,
+            'utilisation': allocated / reserved if reserved else 0.0,
+            'fragmentation': 1.0 - requested / allocated if allocated else 0.0,
+            'n_allocations': self._n_allocations,
+            'n_fallbacks': self._n_fallbacks,
+            'n_failures': self._n_failures,
+            'requested_histogram': dict(self._requested_histogram),
+            'peak_demand': dict(self._peak_demand),
+        }
+
+    def suggest_memory_sizes(self, headroom: float = 1.25) -> List[Tuple[int, int]]:
+        '''
+        Suggests a slot mix matching the observed waveform sizes.
+
+        Slot sizes that have been requested get `headroom` times the peak
+        number of simultaneous allocations. The remaining memory of the
+        current configuration is kept for the sizes that have not been
+        requested, as far as it fits.
+
+        The suggestion never reserves more memory than the current
+        configuration. When the observed demand does not fit, every requested
+        size first gets one slot, then its peak demand and then the headroom,
+        as far as the memory allows, and a warning is logged.
+
+        Args:
+            headroom: factor on the observed peak demand
+        Returns:
+            list of (slot size, number of slots) for the `memory_sizes` argument
+        '''
+        budget = sum(size * amount for size, amount in self._memory_sizes)
+        requested = [size for size in self._slot_sizes if self._requested_histogram[size]]
+        targets = [
+            {size: 1 for size in requested},
+            {size: self._peak_demand[size] for size in requested},
+            {size: max(1, ceil(self._peak_demand[size] * headroom)) for size in requested},
+            ]
+        suggestion: Dict[int, int] = {size: 0 for size in requested}
+        for i, target in enumerate(targets):
+            # the largest sizes are the hardest to fit, so they get their first slot first
+            for size in reversed(requested) if i == 0 else requested:
+                amount = min(max(0, target[size] - suggestion[size]), budget // size)
+                suggestion[size] += amount
+                budget -= size * amount
+        if any(suggestion[size] < targets[-1][size] for size in requested):
+            self._log.warning('Observed waveform demand exceeds the AWG memory. '
+                              f'Suggested slots are limited to {suggestion}')
+        for size, amount in self._memory_sizes:
+            if size not in suggestion:
+                suggestion[size] = max(0, min(amount, budget // size))
+                budget -= size * suggestion[size]
+        return sorted(suggestion.items())
+
     def allocation_state(self):
         '''
         Example:
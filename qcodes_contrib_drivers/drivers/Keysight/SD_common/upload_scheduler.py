@@ -0,0 +1,255 @@
+# -*- coding: utf-8 -*-
+import threading
+import time
+import logging
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple, Any
+
+
+class UploadScheduler:
+    """
+    Schedules the upload tasks of multiple AWG modules on a shared pool of worker threads.
+
+    Every module has its own queue. The tasks of a module are executed one at a time,
+    because the SD1 library does not support concurrent calls on a module.
+    Tasks of different modules are executed concurrently by at most `n_workers` threads.
+
+    Upload tasks have a priority. A worker picks the upload with the highest priority
+    of all idle modules. Tasks without priority (e.g. memory reservation) act as a
+    barrier: they are executed in order with respect to all other tasks of the module.
+
+    Priorities (lower value is more urgent):
+        URGENT: waveform is needed by `awg_queue_waveform` now
+        NORMAL: waveform is uploaded for use in the next sequence
+        PREFETCH: waveform is uploaded ahead of time
+
+    Example:
+        scheduler = UploadScheduler.for_chassis(1)
+        pprint(scheduler.stats(), sort_dicts=False)
+
+    Args:
+        n_workers: maximum number of concurrent uploads. Default: `default_n_workers`
+    """
+    URGENT = 0
+    NORMAL = 1
+    PREFETCH = 2
+
+    default_n_workers = 4
+    ''' Number of workers of schedulers created without `n_workers`, e.g. by `for_chassis`. '''
+
+    _chassis_schedulers: Dict[int, 'UploadScheduler'] = {}
+    _chassis_lock = threading.Lock()
+
+    @dataclass
+    class _ModuleQueue:
+        name: str
+        tasks: List[Any]
+        busy: bool = False
+        n_tasks: int = 0
+        n_samples: int = 0
+        busy_time: float = 0.0
+        peak_depth: int = 0
+
+    def __init__(self, n_workers: Optional[int] = None) -> None:
+        if n_workers is None:
+            n_workers = UploadScheduler.default_n_workers
+        if n_workers < 1:
+            raise Exception(f'Number of workers must be at least 1, not {n_workers}')
+        self._n_workers = n_workers
+        self._condition = threading.Condition()
+        self._modules: Dict[str, UploadScheduler._ModuleQueue] = {}
+        self._workers: List[threading.Thread] = []
+        self._stop_event = threading.Event()
+        self._sequence_number = 0
+
+    @classmethod
+    def for_chassis(cls, chassis: int) -> 'UploadScheduler':
+        """
+        Returns the scheduler shared by all modules in the chassis.
+        """
+        with cls._chassis_lock:
+            scheduler = cls._chassis_schedulers.get(chassis)
+            if scheduler is None:
+                scheduler = UploadScheduler()
+                cls._chassis_schedulers[chassis] = scheduler
+            return scheduler
+
+    @property
+    def n_workers(self) -> int:
+        return self._n_workers
+
+    def register(self, module_id: str) -> None:
+        """
+        Adds a queue for the module and starts the workers if needed.
+
+        Args:
+            module_id: unique id of the module
+        """
+        with self._condition:
+            if module_id in self._modules:
+                raise Exception(f'Module {module_id} already registered')
+            self._modules[module_id] = UploadScheduler._ModuleQueue(module_id, [])
+            if not self._workers:
+                self._start_workers()
+
+    def unregister(self, module_id: str, timeout: Optional[float] = None) -> bool:
+        """
+        Waits till all tasks of the module have been executed and removes the queue.
+        The workers are stopped when no modules are left.
+
+        Args:
+            module_id: unique id of the module
+            timeout: maximum time to wait in seconds
+        Returns:
+            True if all tasks were executed before the timeout
+        """
+        with self._condition:
+            completed = self.wait_idle(module_id, timeout)
+            del self._modules[module_id]
+            workers = []
+            if not self._modules:
+                self._stop_event.set()
+                self._condition.notify_all()
+                workers = self._workers
+                self._workers = []
+
+        for worker in workers:
+            worker.join(timeout)
+        return completed
+
+    def wait_idle(self, module_id: str, timeout: Optional[float] = None) -> bool:
+        """
+        Waits till all tasks of the module have been executed.
+
+        Args:
+            module_id: unique id of the module
+            timeout: maximum time to wait in seconds
+        Returns:
+            True if all tasks were executed before the timeout
+        """
+        with self._condition:
+            module = self._modules[module_id]
+            return self._condition.wait_for(
+                    lambda: not module.tasks and not module.busy, timeout)
+
+    def submit(self, module_id: str, task: Any) -> None:
+        """
+        Adds a task to the queue of the module.
+
+        The task must have a method `run()` and attributes `priority`
+        (None for a barrier task) and `n_samples`.
+
+        Args:
+            module_id: unique id of the module
+            task: task to execute
+        """
+        with self._condition:
+            module = self._modules[module_id]
+            self._sequence_number += 1
+            task.sequence_number = self._sequence_number
+            module.tasks.append(task)
+            module.peak_depth = max(module.peak_depth, len(module.tasks))
+            self._condition.notify()
+
+    def promote(self, task: Any, priority: int = URGENT) -> None:
+        """
+        Raises the priority of a queued upload task.
+
+        Args:
+            task: task submitted earlier
+            priority: new priority
+        """
+        with self._condition:
+            if task.priority is not None and priority < task.priority:
+                task.priority = priority
+
+    def stats(self) -> Dict[str, Any]:
+        '''
+        Returns queue depth and throughput statistics per module.
+
+        * queue_depth: number of tasks waiting
+        * peak_queue_depth: maximum number of tasks waiting
+        * n_tasks: number of executed tasks
+        * n_samples: number of uploaded samples
+        * busy_s: time spent executing tasks
+        * throughput_MSa_s: uploaded samples per busy second
+        '''
+        with self._condition:
+            result: Dict[str, Any] = {'n_workers': self._n_workers}
+            for module_id, module in self._modules.items():
+                result[module_id] = {
+                    'queue_depth': len(module.tasks),
+                    'peak_queue_depth': module.peak_depth,
+                    'n_tasks': module.n_tasks,
+                    'n_samples': module.n_samples,
+                    'busy_s': module.busy_time,
+                    'throughput_MSa_s': (module.n_samples / module.busy_time / 1e6
+                                         if module.busy_time else 0.0),
+                    }
+            return result
+
+    def _start_workers(self) -> None:
+        # every generation of workers has its own stop event
+        self._stop_event = threading.Event()
+        for i in range(self._n_workers):
+            worker = threading.Thread(target=self._run, args=(self._stop_event,),
+                                      name=f'uploader-{id(self):x}-{i}')
+            self._workers.append(worker)
+            worker.start()
+
+    def _next_task(self) -> Optional[Tuple['UploadScheduler._ModuleQueue', Any]]:
+        # Selects the most urgent task of the idle modules.
+        # Only the tasks before the first barrier of a module are candidates.
+        best: Optional[Tuple[UploadScheduler._ModuleQueue, Any]] = None
+        best_key = None
+        for module in self._modules.values():
+            if module.busy or not module.tasks:
+                continue
+            if module.tasks[0].priority is None:
+                candidates = [module.tasks[0]]
+            else:
+                candidates = []
+                for task in module.tasks:
+                    if task.priority is None:
+                        break
+                    candidates.append(task)
+            for task in candidates:
+                priority = task.priority if task.priority is not None else UploadScheduler.URGENT
+                key = (priority, task.sequence_number)
+                if best_key is None or key < best_key:
+                    best_key = key
+                    best = (module, task)
+        return best
+
+    def _run(self, stop_event: threading.Event) -> None:
+        logging.info(f'{threading.current_thread().name} ready')
+        while True:
+            with self._condition:
+                selected = None
+                while not stop_event.is_set():
+                    selected = self._next_task()
+                    if selected is not None:
+                        break
+                    self._condition.wait()
+                if selected is None:
+                    break
+                module, task = selected
+                module.tasks.remove(task)
+                module.busy = True
+
+            start = time.perf_counter()
+            try:
+                task.run()
+            except:
+                logging.error('Task thread error', exc_info=True)
+            duration = time.perf_counter() - start
+
+            with self._condition:
+                module.busy = False
+                module.n_tasks += 1
+                module.n_samples += task.n_samples
+                module.busy_time += duration
+                self._condition.notify_all()
+            del task
+
+        logging.info(f'{threading.current_thread().name} terminated')
@@ -3,11 +3,14 @@
 # Version 2.2 QDevil 2023-02-20
 
 import logging
+import threading
 import time
-from collections import namedtuple
+from collections import deque, namedtuple
+from contextlib import contextmanager
 from enum import Enum
 from functools import partial
-from typing import Any, Dict, Optional, Sequence, Tuple, Union
+from typing import (Any, Deque, Dict, Iterator, List, Optional, Sequence, Tuple,
+                    Union)
 
 import pyvisa
 import pyvisa.constants
@@ -237,6 +240,15 @@ class QDac(VisaInstrument):
         handle.data_bits = 8
         self.set_terminator('\n')
         handle.write_termination = '\n'
+        self._lock = threading.RLock()
+        # Pipelines are per thread, so that eg. a background refresher is
+        # neither held up by nor mixed into the pipeline of another thread
+        self._pipeline_local = threading.local()
+        self._pipeline_line_length = 250
+        self._pipeline_lines_in_flight = 4
+        self._cache_times: Dict[int, float] = {}
+        self._refresher: Optional[threading.Thread] = None
+        self._stop_refresh = threading.Event()
         self._write_response = ''
         firmware_version = self._get_firmware_version()
         if firmware_version < 1.07:
@@ -427,7 +439,9 @@ class QDac(VisaInstrument):
     ) -> Dict[Any, Any]:
         update_currents = self._update_currents and update is True
         if update:
-            self._update_cache(update_currents=update_currents)
+            # A background refresher keeps the cache up to date
+            if not self._refresher:
+                self._update_cache(update_currents=update_currents)
             self._get_status_performed = True
         # call _update_cache rather than getting the status individually for
         # each parameter. We set _get_status_performed to True
@@ -444,16 +458,43 @@ class QDac(VisaInstrument):
     # Channel gets/sets
     #########################
 
-    def _get_voltage(self, chan: int) -> str:
+    def _get_voltage(self, chan: int, live: bool = False) -> str:
         """
         Clear the output from the instrument and ask for the current voltage
 
         Args:
             chan (int): The 1-indexed channel number
+            live (bool): Always ask the instrument, also when a background
+                refresher is running.
+
+        While a background refresher is running, the cached voltage of a
+        channel that is not ramping is returned if it is not older than
+        max_status_age.
+        """
+        with self._lock:
+            if (not live and self._refresher and not self._is_ramping(chan)
+                    and self.cache_age_s(chan) <= self.max_status_age):
+                return str(self.channels[chan-1].v.cache.get(get_if_invalid=False))
+            self.clear_read_queue()
+            self.write(f'set {chan}')
+            return self._write_response
+
+    def _read_voltage(self, chan: int) -> float:
+        """
+        Read the voltage of a channel from the instrument (never from the
+        cache) and update the cache
         """
-        self.clear_read_queue()
-        self.write(f'set {chan}')
-        return self._write_response
+        voltage = float(self._get_voltage(chan, live=True))
+        self.channels[chan-1].v.cache.set(voltage)
+        return voltage
+
+    def _is_ramping(self, chan: int) -> bool:
+        """
+        Whether the channel has a slope or a running function generator
+        """
+        generator = self._assigned_fgs.get(chan)
+        return (chan in self._slopes
+                or (generator is not None and generator.t_end > time.time()))
 
     def _set_voltage(self, chan: int, v_set: float) -> None:
         """
@@ -472,12 +513,12 @@ class QDac(VisaInstrument):
             self.write('wav {ch} 0 0 0;set {ch} {voltage:.6f}'
                        .format(ch=chan, voltage=v_set))
             return
-        # We need .get and not cache/get_latest in case a ramp
+        # We need a live read and not the cache in case a ramp
         # was interrupted
-        v_start = self.channels[chan-1].v.get()
+        v_start = self._read_voltage(chan)
         v_span = v_set - v_start
         v_amplitude = abs(v_span)
-        s_duration = v_amplitude / slope
+        s_duration = v_amplitude / float(slope)
         LOG.info(f'Slope: {slope}, time: {s_duration}')
         if v_amplitude <= 10:
             # SYNCing happens inside ramp_voltages
@@ -554,7 +595,7 @@ class QDac(VisaInstrument):
             # Current sensor relay on->off before voltage relay off->on:
             if new_irange < old_irange and new_vrange > old_vrange:
                 message += f'cur {chan} {new_irange};'
-            old_voltage = self.channels[chan-1].v.get()
+            old_voltage = self._read_voltage(chan)
             # Check if voltage is non-zero and mode_force is off
             if ((self.mode_force() is False) and
                     (abs(old_voltage) > max_zero_voltage[old_vrange])):
@@ -605,7 +646,22 @@ class QDac(VisaInstrument):
         """
         return 1e-6*self._num_verbose(s)
 
-    def _update_cache(self, update_currents: bool = False) -> None:
+    def _update_cache(self, update_currents: bool = False,
+                      channels: Optional[Sequence[int]] = None) -> None:
+        """
+        Update the cached voltages and modes (and optionally currents) of all
+        channels, or only the voltages (and currents) of the given channels.
+        """
+        with self._lock:
+            if channels is None:
+                self._update_status()
+                channels = self._chan_range
+            else:
+                self._update_voltages(channels)
+            if update_currents:
+                self._update_currents_cache(channels)
+
+    def _update_status(self) -> None:
         """
         Function to query the instrument and get the status of all channels.
         Takes a while to finish.
@@ -653,11 +709,113 @@ class QDac(VisaInstrument):
             self.channels[chan-1].mode.cache.set(mode)
             self.channels[chan-1].v.cache.set(float(v))
             self.channels[chan-1].v.vals = self._v_vals(chan, vrange_int)
+            self._cache_times[chan] = time.time()
             chans_left.remove(chan)
 
-        if update_currents:
-            for chan in self._chan_range:
-                self.channels[chan-1].i.get()
+    def _update_voltages(self, channels: Sequence[int]) -> None:
+        """
+        Read the voltages of the given channels with pipelined queries
+        """
+        responses = self._ask_many([f'set {chan}' for chan in channels])
+        now = time.time()
+        for chan, response in zip(channels, responses):
+            self.channels[chan-1].v.cache.set(float(response))
+            self._cache_times[chan] = now
+
+    def _update_currents_cache(self, channels: Sequence[int]) -> None:
+        """
+        Read the currents of the given channels with pipelined queries
+        """
+        responses = self._ask_many([f'get {chan}' for chan in channels])
+        for chan, response in zip(channels, responses):
+            self.channels[chan-1].i.cache.set(self._current_parser(response))
+
+    def refresh_cache(self, channels: Optional[Sequence[int]] = None,
+                      update_currents: bool = False) -> None:
+        """
+        Update the cached channel settings from the instrument.
+
+        Refreshing all channels reads the full status, ie. the voltages and
+        the modes (and so the voltage validators).  Refreshing a subset of
+        the channels only reads their voltages, as the QDAC has no per
+        channel query of the mode; their cached modes and validators are
+        left as they are, which is fine as long as the modes are only
+        changed through this driver.
+
+        Args:
+            channels: Channel numbers to refresh the voltages of. Default:
+                all channels, in which case the modes are refreshed as well.
+            update_currents: Whether to also refresh the currents.
+        """
+        if channels is not None:
+            for chan in channels:
+                self.channel_validator.validate(chan)
+        self._update_cache(update_currents=update_currents, channels=channels)
+
+    def cache_age_s(self, chan: int) -> float:
+        """
+        Returns:
+            Seconds since the cached voltage of the channel was read from
+            the instrument (infinite if never).
+        """
+        read_at = self._cache_times.get(chan)
+        if read_at is None:
+            return float('inf')
+        return time.time() - read_at
+
+    def start_background_refresh(
+            self, interval_s: float = 1.0, update_currents: bool = False,
+            channels: Optional[Sequence[int]] = None) -> None:
+        """
+        Keep the cached channel settings fresh from a background thread.
+
+        While the refresher is running, voltage reads of channels that are
+        not ramping are answered from the cache (if not older than
+        max_status_age), and snapshots and
+        print_overview() do not query the instrument.  Use cache_age_s() to
+        find out how old a cached value is.
+
+        Args:
+            interval_s: Time between refreshes. Default: 1 s.
+            update_currents: Whether to also refresh the currents.
+            channels: Channels to refresh. Default: all channels (and modes,
+                see refresh_cache()).
+        """
+        self.stop_background_refresh()
+        self._stop_refresh.clear()
+        self._refresher = threading.Thread(
+            target=self._refresh_in_background,
+            args=(interval_s, update_currents, channels),
+            name=f'{self.name}-refresh', daemon=True)
+        self._refresher.start()
+
+    def stop_background_refresh(self) -> None:
+        """
+        Stop the background refresher, if running.
+        """
+        refresher = self._refresher
+        if not refresher:
+            return
+        self._stop_refresh.set()
+        if refresher is not threading.current_thread():
+            refresher.join()
+        self._refresher = None
+
+    def _refresh_in_background(
+            self, interval_s: float, update_currents: bool,
+            channels: Optional[Sequence[int]]) -> None:
+        while True:
+            try:
+                self._update_cache(update_currents, channels)
+            except Exception as error:
+                LOG.warning(f'Background refresh of {self.name} failed: '
+                            f'{error}')
+            if self._stop_refresh.wait(interval_s):
+                return
+
+    def close(self) -> None:
+        self.stop_background_refresh()
+        super().close()
 
     def _setsync(self, chan: int, sync: int) -> None:
         """
@@ -729,7 +887,7 @@ class QDac(VisaInstrument):
 
         if slope == 'Inf':
             # Set the channel in DC mode
-            v_set = self.channels[chan-1].v.get()
+            v_set = self._read_voltage(chan)
             self.write('set {ch} {voltage:.6f};wav {ch} 0 0 0'
                        .format(ch=chan, voltage=v_set))
 
@@ -804,21 +962,156 @@ class QDac(VisaInstrument):
         commands as count(';') + 1 e.g. 'wav 1 1 1 0;fun 2 1 100 1 1' is two
         commands. Note that only the response of the last command will be
         available in `_write_response`
+
+        Inside a pipeline() the command is only queued.
+        """
+        pipeline = self._pipeline()
+        if pipeline is not None:
+            pipeline.append(cmd)
+            return
+        with self._lock:
+            LOG.debug(f"Writing to instrument {self.name}: {cmd}")
+            self.visa_handle.write(cmd)
+            self._drain_responses(cmd.count(';')+1)
+
+    @contextmanager
+    def pipeline(self, max_line_length: int = 250,
+                 max_lines_in_flight: int = 4) -> Iterator[None]:
+        """
+        Context manager for pipelined writes.
+
+        While the context is active, commands are queued instead of being
+        sent.  When the context exits, the queued commands are joined by `;`
+        into as few lines as possible and sent.  At most max_lines_in_flight
+        lines are sent ahead of the responses read back, so that neither the
+        input buffer of the QDAC nor the serial buffer of the host can
+        overflow.  Responses starting with `Error:` are logged as warnings
+        as usual.
+
+        Reading a response, eg. from a parameter get, sends the queued
+        commands first, so the order of commands is preserved.  Nested
+        pipelines are absorbed by the outermost one.  The pipeline only
+        queues the commands of the calling thread; other threads, eg. a
+        background refresher, can talk to the instrument meanwhile.
+
+        Args:
+            max_line_length: Max number of characters per line sent (the
+                QDAC has a limited input buffer). Default: 250.
+            max_lines_in_flight: Max number of lines sent before reading
+                their responses. Default: 4.
+        """
+        if max_lines_in_flight < 1:
+            raise ValueError('max_lines_in_flight must be at least 1')
+        local = self._pipeline_local
+        if self._pipeline() is not None:
+            yield
+            return
+        local.commands = list()
+        local.max_line_length = max_line_length
+        local.max_lines_in_flight = max_lines_in_flight
+        try:
+            yield
+        finally:
+            try:
+                self._flush_pipeline()
+            finally:
+                local.commands = None
+
+    def set_voltages(self, voltages: Dict[int, float]) -> None:
         """
+        Set the voltages of several channels in one go.
+
+        The voltages are sent as a single pipelined transfer, except for
+        channels that have a finite slope, which are ramped as usual.
 
-        LOG.debug(f"Writing to instrument {self.name}: {cmd}")
-        self.visa_handle.write(cmd)
-        for _ in range(cmd.count(';')+1):
-            self._write_response = self.visa_handle.read()
-            if self._write_response.startswith('Error: '):
-                LOG.warning(self._write_response)
+        Args:
+            voltages: Voltage for each channel number (1-24 or 1-48)
+        """
+        for chan in voltages:
+            self.channel_validator.validate(chan)
+        with self.pipeline():
+            for chan, voltage in voltages.items():
+                self.channels[chan-1].v.set(voltage)
+
+    def _pipeline(self) -> Optional[List[str]]:
+        # Commands queued by the pipeline of the calling thread, if any
+        return getattr(self._pipeline_local, 'commands', None)
+
+    def _flush_pipeline(self) -> None:
+        local = self._pipeline_local
+        commands = self._pipeline()
+        if not commands:
+            return
+        local.commands = list()
+        with self._lock:
+            self._send_pipelined(commands, local.max_line_length,
+                                 local.max_lines_in_flight)
+
+    def _ask_many(self, queries: Sequence[str]) -> List[str]:
+        """
+        Send several queries as pipelined lines and return all the responses
+        """
+        with self._lock:
+            self.clear_read_queue()
+            return self._send_pipelined(queries, self._pipeline_line_length,
+                                        self._pipeline_lines_in_flight)
+
+    def _send_pipelined(self, commands: Sequence[str], max_line_length: int,
+                        max_lines_in_flight: int) -> List[str]:
+        lines: List[str] = list()
+        for cmd in commands:
+            if lines and len(lines[-1]) + 1 + len(cmd) <= max_line_length:
+                lines[-1] += ';' + cmd
+            else:
+                lines.append(cmd)
+        responses: List[str] = list()
+        in_flight: Deque[str] = deque()
+        for line in lines:
+            if len(in_flight) >= max_lines_in_flight:
+                responses += self._drain_responses(
+                    in_flight.popleft().count(';')+1)
+            LOG.debug(f"Writing to instrument {self.name}: {line}")
+            self.visa_handle.write(line)
+            in_flight.append(line)
+        responses += self._drain_responses(
+            sum(line.count(';')+1 for line in in_flight))
+        return responses
+
+    def _drain_responses(self, n_responses: int) -> List[str]:
+        responses = list()
+        for _ in range(n_responses):
+            self._last_response = self.visa_handle.read()
+            if self._last_response.startswith('Error: '):
+                LOG.warning(self._last_response)
+            responses.append(self._last_response)
+        return responses
+
+    @property
+    def _write_response(self) -> str:
+        # Queued commands are sent first, so that the response is from the
+        # command written last
+        self._flush_pipeline()
+        return self._last_response
+
+    @_write_response.setter
+    def _write_response(self, response: str) -> None:
+        self._last_response = response
+
+    def ask_raw(self, cmd: str) -> str:
+        with self._lock:
+            self._flush_pipeline()
+            return super().ask_raw(cmd)
 
     def read(self) -> str:
-        return self.visa_handle.read()
+        with self._lock:
+            self._flush_pipeline()
+            return self.visa_handle.read()
 
     def _wait_and_clear(self, delay: float = 0.5) -> None:
-        time.sleep(delay)
-        self.visa_handle.clear()
+        with self._lock:
+            self._flush_pipeline()
+            time.sleep(delay)
+            self.visa_handle.clear()
 
     def clear_read_queue(self) -> Sequence[str]:
         """
@@ -829,15 +1122,17 @@ class QDac(VisaInstrument):
         Returns:
             Sequence[str]: Messages lingering in queue
         """
-        lingering = list()
-        with self.timeout.set_to(0.001):
-            while True:
-                try:
-                    message = self.visa_handle.read()
-                except pyvisa.VisaIOError:
-                    break
-                else:
-                    lingering.append(message)
+        with self._lock:
+            self._flush_pipeline()
+            lingering = list()
+            with self.timeout.set_to(0.001):
+                while True:
+                    try:
+                        message = self.visa_handle.read()
+                    except pyvisa.VisaIOError:
+                        break
+                    else:
+                        lingering.append(message)
         return lingering
 
     def connect_message(self,
@@ -878,9 +1173,11 @@ class QDac(VisaInstrument):
     def print_overview(self, update_currents: bool =  False) -> None:
         """
         Pretty-prints the status of the QDac
-        """
 
-        self._update_cache(update_currents=update_currents)
+        While a background refresher is running, the cached values are shown.
+        """
+        if not self._refresher:
+            self._update_cache(update_currents=update_currents)
 
         for ii in range(self.num_chans):
             line = f"Channel {ii+1} \n"
@@ -1081,9 +1378,9 @@ class QDac(VisaInstrument):
 
         # Get start voltages if not provided
         if not slow_vstart:
-            slow_vstart = [self.channels[ch-1].v.get() for ch in slow_chans]
+            slow_vstart = [self._read_voltage(ch) for ch in slow_chans]
         if not fast_vstart:
-            fast_vstart = [self.channels[ch-1].v.get() for ch in fast_chans]
+            fast_vstart = [self._read_voltage(ch) for ch in fast_chans]
 
         v_startlist = [*slow_vstart, *fast_vstart]
         if no_channels != len(v_startlist):
@@ -1,14 +1,22 @@
 import numpy as np
+import hashlib
 import itertools
+import re
+import threading
 import uuid
-from time import sleep as sleep_s
+from collections import OrderedDict
+from time import sleep as sleep_s, monotonic as monotonic_s
 from qcodes.instrument.channel import InstrumentChannel, ChannelList
 from qcodes.instrument.visa import VisaInstrument
 from pyvisa.errors import VisaIOError
+from .QDevil_Profile import Scpi_Profile
 from qcodes.utils import validators
-from typing import NewType, Tuple, Sequence, List, Dict, Optional
+from typing import NewType, Tuple, Sequence, List, Dict, Optional, Iterator, \
+    Callable, Set, Any
 from packaging.version import parse
 import abc
+import contextlib
+import functools
 
 # Version 2.0.0
 #
@@ -59,9 +67,13 @@ import abc
 #     Triangle_Context
 #     Awg_Context
 #   Measurement_Context
+# Measurement_Stream_Context
 # Virtual_Sweep_Context
 # Arrangement_Context
 # QDac2Trigger_Context
+# Batch_Context
+# Trace_Context
+# Trace_Library
 #
 # Calling close() on any context manager will clean up any triggers or
 # markers that were set up by the context.  Use with-statements to
@@ -70,6 +82,10 @@ import abc
 
 pseudo_trigger_voltage = 5
 
+# Instruments (identified by *IDN?) that have already passed the
+# compatibility checks in this session
+_verified_instruments: Set[Tuple[str, ...]] = set()
+
 
 error_ambiguous_wave = 'Only one of frequency_Hz or period_s can be ' \
                        'specified for a wave form'
@@ -79,11 +95,29 @@ def ints_to_comma_separated_list(array: Sequence[int]) -> str:
     return ','.join([str(x) for x in array])
 
 
+def _binary_message_size(cmd: str, n_bytes: int) -> int:
+    # Command, IEEE block header, data and terminator
+    return len(cmd) + 2 + len(str(n_bytes)) + n_bytes + 1
+
+
+def channel_list_suffix(channels: Sequence[int]) -> str:
+    return f'(@{ints_to_comma_separated_list(channels)})'
+
+
 def floats_to_comma_separated_list(array: Sequence[float]) -> str:
     rounded = [format(x, 'g') for x in array]
     return ','.join(rounded)
 
 
+def trace_name_from_values(values: Sequence[float]) -> str:
+    """Name a trace after a hash of its values"""
+    samples = np.ascontiguousarray(values, dtype=np.float64)
+    return 'h' + hashlib.sha1(samples.tobytes()).hexdigest()[:24]
+
+
+_library_trace_name = re.compile(r'h[0-9a-f]{24}')
+
+
 def comma_sequence_to_list(sequence: str) -> Sequence[str]:
     if not sequence:
         return []
@@ -108,6 +142,72 @@ def split_version_string_into_components(version: str) -> List[str]:
     return version.split('-')
 
 
+# Settings that only change when written to, and thus can be shadowed by the
+# driver.  Headers without a channel number take a channel list, like
+# 'sens:rang low,(@1,2,3)'.
+_shadowed_setting = re.compile(
+    r'(sens\d*:(rang|nplc|aper|del|coun|trig:sour)'
+    r'|sour\d*:(rang|filt|volt:slew|(dc|squ|sine|tri|awg):trig:sour)'
+    r'|outp:trig\d+:(sour|widt|pol|del))')
+_channel_list = re.compile(r'(?P<value>.*),\(@(?P<channels>[\d,:]+)\)')
+_channel_list_anywhere = re.compile(r'\(@(?P<channels>[\d,:]+)\)')
+_channel_node = re.compile(r'(sour|sens)[a-z]*(?P<channel>\d+)')
+# Settings that implicitly change another setting on the same channel
+_coupled_settings = {'aper': 'nplc', 'nplc': 'aper'}
+
+
+def channel_list_to_numbers(channels: str) -> List[int]:
+    """Expand a SCPI channel list like '1,3:5' into channel numbers"""
+    numbers: List[int] = list()
+    for item in channels.split(','):
+        first, _, last = item.partition(':')
+        numbers.extend(range(int(first), int(last or first) + 1))
+    return numbers
+
+
+def command_to_channels(cmd: str) -> List[int]:
+    """Channels addressed by a SCPI command
+
+    Args:
+        cmd (str): SCPI command
+
+    Returns:
+        List[int]: Channel numbers from the header or the channel list
+    """
+    header, _, value = cmd.strip().partition(' ')
+    node = _channel_node.fullmatch(header.partition(':')[0].lower())
+    if node:
+        return [int(node['channel'])]
+    match = _channel_list_anywhere.search(value)
+    if not match:
+        return list()
+    return channel_list_to_numbers(match['channels'])
+
+
+def setting_to_registers(cmd: str) -> Optional[Dict[str, str]]:
+    """Split a SCPI setting into per-channel register values
+
+    Args:
+        cmd (str): SCPI command
+
+    Returns:
+        Optional[Dict[str, str]]: Register to value, or None if not a setting
+    """
+    header, _, value = cmd.strip().partition(' ')
+    header = header.lower()
+    value = value.strip()
+    if not value or not _shadowed_setting.fullmatch(header):
+        return None
+    node, _, rest = header.partition(':')
+    if node[-1].isdigit() or node == 'outp':
+        return {header: value}
+    match = _channel_list.fullmatch(value)
+    if not match:
+        return None
+    return {f'{node}{channel}:{rest}': match['value'].strip()
+            for channel in channel_list_to_numbers(match['channels'])}
+
+
 """External input trigger
 
 There are four 3V3 non-isolated triggers on the back (1, 2, 3, 4).
@@ -147,6 +247,113 @@ def _trigger_context_to_value(trigger: QDac2Trigger_Context) -> int:
     return trigger.value
 
 
+def _is_reset(cmd: str) -> bool:
+    # Does the (possibly joined) command contain *rst?
+    return any(part.strip().lower() == '*rst' for part in cmd.split(';'))
+
+
+def _fetch_measurements(measurements: Sequence['Measurement_Context'],
+                        n_values: int, poll_interval_s: float,
+                        timeout_s: float) -> List[Sequence[float]]:
+    # Wait until each measurement has all its values, or the time is up, and
+    # remove whatever is available.
+    deadline_s = monotonic_s() + timeout_s
+    currents: List[Sequence[float]] = list()
+    for measurement in measurements:
+        n_available = measurement.n_available()
+        while n_available < n_values and monotonic_s() < deadline_s:
+            sleep_s(poll_interval_s)
+            n_available = measurement.n_available()
+        if n_available == 0:
+            currents.append(list())
+            continue
+        currents.append(measurement._ask_channel_floats('sens{0}:data:rem?'))
+    return currents
+
+
+def _join_scpi_commands(commands: Sequence[str]) -> str:
+    # Each command after the first is prefixed with a colon so that it is
+    # interpreted from the root of the SCPI tree and not relative to the
+    # header of the previous command.  Common commands (*xxx) are exempt.
+    joined = [commands[0]]
+    for command in commands[1:]:
+        if command.startswith(('*', ':')):
+            joined.append(command)
+        else:
+            joined.append(f':{command}')
+    return ';'.join(joined)
+
+
+class Batch_Context:
+    """Write-coalescing transaction
+
+    While the context is active, all SCPI commands written to the instrument
+    by the same thread are buffered and then sent as semicolon-joined
+    messages when the context exits.  Any query flushes the buffer first, so
+    that the order of commands is preserved.  Commands from other threads
+    are not affected by the transaction.
+
+    If the context exits because of an exception, the commands still
+    buffered are discarded, and the voltages of the channels they address
+    are no longer trusted, so arrangements send them again.  Commands
+    already flushed by a query cannot be taken back.  Only commands actually
+    sent are recorded by start_recording_scpi().
+    """
+
+    def __init__(self, parent: 'QDac2', max_message_length: int):
+        self._parent = parent
+        self._max_message_length = max_message_length
+        self._pending: List[str] = list()
+        self._n_commands = 0
+        self._n_messages = 0
+        # Position of the first command of a nested transaction in the
+        # buffer of the outermost transaction
+        self._start = 0
+
+    def __enter__(self):
+        self._parent._begin_batch(self)
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self._parent._end_batch(self, discard=exc_type is not None)
+        # Propagate exceptions
+        return False
+
+    def close(self) -> None:
+        self.__exit__(None, None, None)
+
+    @property
+    def n_commands(self) -> int:
+        """Number of commands buffered by the transaction"""
+        return self._n_commands
+
+    @property
+    def n_messages(self) -> int:
+        """Number of messages actually sent to the instrument
+
+        Nested transactions do not send messages themselves, so this is
+        always zero for them.
+        """
+        return self._n_messages
+
+    def _messages(self) -> List[str]:
+        messages: List[str] = list()
+        chunk: List[str] = list()
+        length = 0
+        for cmd in self._pending:
+            if chunk and length + len(cmd) + 2 > self._max_message_length:
+                messages.append(_join_scpi_commands(chunk))
+                chunk = list()
+                length = 0
+            chunk.append(cmd)
+            length += len(cmd) + 2
+        if chunk:
+            messages.append(_join_scpi_commands(chunk))
+        self._pending = list()
+        self._n_messages += len(messages)
+        return messages
+
+
 class QDac2ExternalTrigger(InstrumentChannel):
     """External output trigger
 
@@ -254,6 +461,9 @@ class _Channel_Context(metaclass=abc.ABCMeta):
     def _ask_channel(self, cmd: str) -> str:
         return self._channel.ask_channel(cmd)
 
+    def _ask_channel_floats(self, cmd: str) -> Sequence[float]:
+        return self._channel.ask_channel_floats(cmd)
+
     def _channel_message(self, template: str) -> None:
         return self._channel._channel_message(template)
 
@@ -573,10 +783,7 @@ class List_Context(_Dc_Context):
         Returns:
             Sequence[float]: List of voltages
         """
-        # return comma_sequence_to_list_of_floats(
-        #     self._ask_channel('sour{0}:list:volt?'))
-        return comma_sequence_to_list_of_floats(
-            self._ask_channel('sour{0}:list:volt?'))
+        return self._ask_channel_floats('sour{0}:list:volt?')
 
 
 class _Waveform_Context(_Channel_Context):
@@ -1116,6 +1323,10 @@ class Awg_Context(_Waveform_Context):
                  slew_V_s: Optional[float]):
         super().__init__(channel)
         self._repetitions = repetitions
+        self._trace_name: Optional[str] = trace_name
+        library = channel._parent._trace_library
+        if library:
+            library._acquire(trace_name)
         self._write_channel('sour{0}:awg:trig:sour hold')
         self._write_channel(f'sour{"{0}"}:awg:def "{trace_name}"')
         self._write_channel(f'sour{"{0}"}:awg:scal {scale}')
@@ -1125,12 +1336,13 @@ class Awg_Context(_Waveform_Context):
         self._set_triggering()
 
     def __exit__(self, exc_type, exc_val, exc_tb):
-        super()._cleanup('awg')
+        self.close()
         # Propagate exceptions
         return False
 
     def close(self) -> None:
         super()._cleanup('awg')
+        self._release_trace()
 
     def start(self) -> None:
         """Start the AWG
@@ -1153,6 +1365,12 @@ class Awg_Context(_Waveform_Context):
         self._write_channel('sour{0}:awg:trig:sour bus')
         self._make_ready_to_start('awg')
 
+    def _release_trace(self) -> None:
+        library = self._channel._parent._trace_library
+        if library and self._trace_name:
+            library._release(self._trace_name)
+        self._trace_name = None
+
     def end_marker(self) -> QDac2Trigger_Context:
         """Internal trigger that will mark the end of the AWG
 
@@ -1226,6 +1444,163 @@ class Awg_Context(_Waveform_Context):
         return super()._start_once_on_external(trigger, 'awg')
 
 
+class Measurement_Stream_Context:
+    """Current measurements streamed by a background reader
+
+    A reader thread, shared by all streams on the instrument, repeatedly
+    moves the available measurements from the instrument into a ring buffer.
+    The reader only removes measurements from the instrument when there is
+    room for all of them, so a slow consumer leaves them queued on the
+    instrument instead of losing them.  Only when the available measurements
+    would not fit even in an empty ring buffer, or more arrive between
+    counting and removing them, are the excess measurements dropped and
+    counted as overruns.
+    """
+
+    def __init__(self, measurement: 'Measurement_Context', buffer_size: int,
+                 poll_interval_s: float):
+        if buffer_size < 1:
+            raise ValueError('buffer_size must be positive')
+        self._measurement = measurement
+        self._qdac = measurement._channel._parent
+        self._buffer = np.empty(buffer_size)
+        self._first = 0
+        self._n_buffered = 0
+        self._n_received = 0
+        self._n_overruns = 0
+        self._poll_interval_s = poll_interval_s
+        self._error: Optional[Exception] = None
+        self._stopped = False
+        self._condition = threading.Condition()
+        self._poll_lock = threading.Lock()
+        self._qdac._register_stream(self)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
+        # Propagate exceptions
+        return False
+
+    def close(self) -> None:
+        self.__exit__(None, None, None)
+
+    def __iter__(self) -> Iterator[np.ndarray]:
+        """Blocks of measurements, until the stream is stopped and empty"""
+        while True:
+            block = self.read()
+            if len(block) == 0:
+                return
+            yield block
+
+    def stop(self) -> None:
+        """Stop the background reading
+
+        Measurements already in the ring buffer can still be read.
+        """
+        with self._condition:
+            self._stopped = True
+            self._condition.notify_all()
+        # Wait for any ongoing transfer to finish
+        with self._poll_lock:
+            pass
+        self._qdac._unregister_stream(self)
+
+    def read(self, timeout_s: Optional[float] = None) -> np.ndarray:
+        """Remove all buffered measurements
+
+        Waits for measurements to arrive if the buffer is empty.
+
+        Args:
+            timeout_s (float, optional): Max seconds to wait (default forever)
+
+        Returns:
+            np.ndarray: Currents in Amperes, empty if stopped or timed out
+
+        Raises:
+            Exception: any error raised by the background reader
+        """
+        with self._condition:
+            self._condition.wait_for(
+                lambda: self._n_buffered or self._stopped, timeout_s)
+            if self._error:
+                raise self._error
+            return self._take()
+
+    @property
+    def is_running(self) -> bool:
+        """Is the background reader still filling the buffer"""
+        return not self._stopped
+
+    @property
+    def n_buffered(self) -> int:
+        """Number of measurements waiting in the ring buffer"""
+        return self._n_buffered
+
+    @property
+    def n_received(self) -> int:
+        """Number of measurements received from the instrument"""
+        return self._n_received
+
+    @property
+    def n_overruns(self) -> int:
+        """Number of measurements dropped because the buffer was full"""
+        return self._n_overruns
+
+    def _room(self) -> int:
+        return len(self._buffer) - self._n_buffered
+
+    def _poll(self) -> None:
+        with self._poll_lock:
+            if self._stopped or not self._room():
+                return
+            try:
+                n_available = self._measurement.n_available()
+                if n_available == 0:
+                    return
+                # Leave the measurements on the instrument until they fit,
+                # unless they never will.
+                if n_available > self._room() and self._n_buffered:
+                    return
+                currents = self._measurement._ask_channel_floats(
+                    'sens{0}:data:rem?')
+            except Exception as error:
+                with self._condition:
+                    self._error = error
+                    self._stopped = True
+                    self._condition.notify_all()
+                # Let the reader go idle unless other streams need it
+                self._qdac._unregister_stream(self)
+                return
+            self._put(np.asarray(currents, dtype=float))
+
+    def _put(self, values: np.ndarray) -> None:
+        if len(values) == 0:
+            return
+        with self._condition:
+            self._n_received += len(values)
+            size = len(self._buffer)
+            room = size - self._n_buffered
+            if len(values) > room:
+                self._n_overruns += len(values) - room
+                values = values[:room]
+            start = (self._first + self._n_buffered) % size
+            first_part = min(len(values), size - start)
+            self._buffer[start:start + first_part] = values[:first_part]
+            self._buffer[:len(values) - first_part] = values[first_part:]
+            self._n_buffered += len(values)
+            self._condition.notify_all()
+
+    def _take(self) -> np.ndarray:
+        size = len(self._buffer)
+        indices = (self._first + np.arange(self._n_buffered)) % size
+        block = self._buffer[indices]
+        self._first = (self._first + self._n_buffered) % size
+        self._n_buffered = 0
+        return block
+
+
 class Measurement_Context(_Channel_Context):
 
     def __init__(self, channel: 'QDac2Channel', delay_s: float,
@@ -1233,6 +1608,7 @@ class Measurement_Context(_Channel_Context):
                  aperture_s: Optional[float], nplc: Optional[int]):
         super().__init__(channel)
         self._trigger: Optional[QDac2Trigger_Context] = None
+        self._stream: Optional[Measurement_Stream_Context] = None
         self._write_channel(f'sens{"{0}"}:del {delay_s}')
         self._write_channel(f'sens{"{0}"}:rang {current_range}')
         self._set_aperture(aperture_s, nplc)
@@ -1243,6 +1619,8 @@ class Measurement_Context(_Channel_Context):
         return self
 
     def __exit__(self, exc_type, exc_val, exc_tb):
+        if self._stream:
+            self._stream.stop()
         self.abort()
         if self._trigger:
             self._channel._parent.free_trigger(self._trigger)
@@ -1336,8 +1714,35 @@ class Measurement_Context(_Channel_Context):
         # Bug circumvention
         if self.n_available() == 0:
             return list()
-        return comma_sequence_to_list_of_floats(
-            self._ask_channel('sens{0}:data:rem?'))
+        return self._ask_channel_floats('sens{0}:data:rem?')
+
+    def stream(self, buffer_size: int = 100000,
+               poll_interval_s: float = 0.01) -> Measurement_Stream_Context:
+        """Continuously move available measurements into a ring buffer
+
+        The measurements are read by a background thread, so that the
+        instrument buffer does not overflow during long measurements.  The
+        stream is stopped when this measurement context exits.
+
+        Example:
+            with qdac.ch01.measurement(repetitions=-1) as measurement:
+                stream = measurement.stream()
+                measurement.start()
+                for currents_A in stream:
+                    ...
+
+        Args:
+            buffer_size (int, optional): Capacity of ring buffer (default 100000)
+            poll_interval_s (float, optional): Seconds between polls (default 10ms)
+
+        Returns:
+            Measurement_Stream_Context: context manager
+        """
+        if self._stream:
+            self._stream.stop()
+        self._stream = Measurement_Stream_Context(self, buffer_size,
+                                                  poll_interval_s)
+        return self._stream
 
     def peek_A(self) -> float:
         """Peek at the first available current measurement
@@ -1358,6 +1763,10 @@ class Measurement_Context(_Channel_Context):
         self._write_channel('sens{0}:init')
 
 
+# Range of dc_constant_V, also used for channels that are not constructed yet
+_dc_constant_V_vals = validators.Numbers(-10.0, 10.0)
+
+
 class QDac2Channel(InstrumentChannel):
 
     def __init__(self, parent: 'QDac2', name: str, channum: int):
@@ -1485,7 +1894,7 @@ class QDac2Channel(InstrumentChannel):
             set_cmd=self._set_fixed_voltage_immediately,
             get_cmd=f'sour{channum}:volt?',
             get_parser=float,
-            vals=validators.Numbers(-10.0, 10.0)
+            vals=_dc_constant_V_vals
         )
         self.add_parameter(
             name='dc_last_V',
@@ -1515,16 +1924,14 @@ class QDac2Channel(InstrumentChannel):
             # Perform immediate current measurement on channel
             label=f'ch{channum}',
             unit='A',
-            get_cmd=f'read{channum}?',
-            get_parser=comma_sequence_to_list_of_floats
+            get_cmd=lambda: self.ask_channel_floats('read{0}?')
         )
         self.add_parameter(
             name='fetch_current_A',
             # Retrieve all available current measurements on channel
             label=f'ch{channum}',
             unit='A',
-            get_cmd=f'fetc{channum}?',
-            get_parser=comma_sequence_to_list_of_floats
+            get_cmd=lambda: self.ask_channel_floats('fetc{0}?')
         )
         self.add_parameter(
             name='dc_mode',
@@ -1562,8 +1969,7 @@ class QDac2Channel(InstrumentChannel):
         # Bug circumvention
         if int(self.ask_channel('sens{0}:data:poin?')) == 0:
             return list()
-        return comma_sequence_to_list_of_floats(
-            self.ask_channel('sens{0}:data:rem?'))
+        return self.ask_channel_floats('sens{0}:data:rem?')
 
     def measurement(self, delay_s: float = 0.0, repetitions: int = 1,
                     current_range: str = 'high',
@@ -1778,6 +2184,17 @@ class QDac2Channel(InstrumentChannel):
         """
         return self.ask(self._channel_message(cmd))
 
+    def ask_channel_floats(self, cmd: str) -> Sequence[float]:
+        """Inject channel number into SCPI query answered by a list of numbers
+
+        Arguments:
+            cmd (str): Must contain a '{0}' placeholder for the channel number
+
+        Returns:
+            Sequence[float]: Numbers, see QDac2.ask_floats()
+        """
+        return self._parent.ask_floats(self._channel_message(cmd))
+
     def write_channel(self, cmd: str) -> None:
         """Inject channel number into SCPI command
 
@@ -1795,6 +2212,7 @@ class QDac2Channel(InstrumentChannel):
             cmd (str): Must contain a '{0}' placeholder for channel number
             values (Sequence[float]): Sequence of numbers
         """
+        self._parent._note_channel_write(self._channum)
         self._parent.write_floats(self._channel_message(cmd), values)
 
     def write(self, cmd: str) -> None:
@@ -1803,6 +2221,7 @@ class QDac2Channel(InstrumentChannel):
         Args:
             cmd (str): SCPI command
         """
+        self._parent._note_channel_write(self._channum)
         self._parent.write(cmd)
 
     def _channel_message(self, template: str):
@@ -1830,11 +2249,20 @@ class Trace_Context:
         """Name of trace"""
         return self._name
 
-    def waveform(self, values: Sequence[float]) -> None:
+    def waveform(self, values: Sequence[float],
+                 chunk_size: Optional[int] = None,
+                 progress: Optional[Callable[[int, int], None]] = None
+                 ) -> None:
         """Fill values into trace
 
+        Very long traces can be transferred in chunks, so that progress can
+        be reported while uploading.
+
         Args:
             values (Sequence[float]): Sequence of values
+            chunk_size (int, optional): Max number of values per transfer
+            progress (Callable[[int, int], None], optional): Called with the
+                number of values sent so far and the total number of values
 
         Raises:
             ValueError: size mismatch
@@ -1842,19 +2270,219 @@ class Trace_Context:
         if len(values) != self.size:
             raise ValueError(f'trace length {len(values)} does not match '
                              f'allocated length {self.size}')
-        self._parent.write_floats(f'trac:data "{self.name}",', values)
+        cmd = f'trac:data "{self.name}",'
+        if chunk_size is None and progress is None:
+            return self._parent.write_floats(cmd, values)
+        self._parent._write_floats_in_chunks(cmd, values,
+                                             chunk_size or len(values),
+                                             progress)
+
+
+class Trace_Library:
+    """Content-addressed cache of traces on the instrument
+
+    Traces are named after a hash of their values, so asking for a trace
+    with the same values again reuses the trace already on the instrument
+    instead of uploading it again.  When there is not room for a new trace,
+    the least recently used traces are removed, except for those in use by
+    arbitrary-wave generators (Awg_Context).
+
+    The instrument does not report how much trace memory is free, so the
+    room is given by max_values.  Traces already on the instrument when the
+    library is created count towards it: those named by a library are reused
+    or removed like any other, while traces named by the user are left alone.
+    """
+
+    def __init__(self, parent: 'QDac2', max_values: int, chunk_size: int,
+                 progress: Optional[Callable[[int, int], None]]):
+        self._parent = parent
+        self._sizes: 'OrderedDict[str, int]' = OrderedDict()
+        self._references: Dict[str, int] = dict()
+        # Values taken up by traces that the library must not remove
+        self._n_foreign_values = 0
+        self._load_catalogue()
+        self._n_hits = 0
+        self._n_uploads = 0
+        self._n_evictions = 0
+        self._configure(max_values, chunk_size, progress)
+
+    def trace(self, values: Sequence[float]) -> str:
+        """Make sure that a trace with the values is on the instrument
+
+        Args:
+            values (Sequence[float]): Sequence of values
+
+        Returns:
+            str: Name of the trace, to be used with arbitrary_wave()
+
+        Raises:
+            ValueError: no room for the trace
+        """
+        if len(values) == 0:
+            raise ValueError('A trace must have at least one value')
+        name = trace_name_from_values(values)
+        with self._parent._lock:
+            if name in self._sizes:
+                self._sizes.move_to_end(name)
+                self._n_hits += 1
+                return name
+            self._make_room(len(values))
+            trace = Trace_Context(self._parent, name, len(values))
+            trace.waveform(values, self._chunk_size, self._progress)
+            self._n_uploads += 1
+            self._sizes[name] = len(values)
+        return name
+
+    def names(self) -> Sequence[str]:
+        """
+        Returns:
+            Sequence[str]: Traces in the library, least recently used first
+        """
+        return list(self._sizes)
+
+    @property
+    def n_values(self) -> int:
+        """Number of values in all traces on the instrument"""
+        return sum(self._sizes.values()) + self._n_foreign_values
+
+    @property
+    def n_hits(self) -> int:
+        """Number of times a trace was found on the instrument"""
+        return self._n_hits
+
+    @property
+    def n_uploads(self) -> int:
+        """Number of traces uploaded to the instrument"""
+        return self._n_uploads
+
+    @property
+    def n_evictions(self) -> int:
+        """Number of traces removed to make room for others"""
+        return self._n_evictions
+
+    def n_references(self, name: str) -> int:
+        """
+        Args:
+            name (str): Name of trace
+
+        Returns:
+            int: Number of arbitrary-wave generators using the trace
+        """
+        return self._references.get(name, 0)
+
+    def _configure(self, max_values: int, chunk_size: int,
+                   progress: Optional[Callable[[int, int], None]]) -> None:
+        if max_values < 1:
+            raise ValueError(f'max_values must be positive, not {max_values}')
+        self._max_values = max_values
+        self._chunk_size = chunk_size
+        self._progress = progress
+
+    def _load_catalogue(self) -> None:
+        # Traces left on the instrument, eg. by an earlier session, are the
+        # least recently used.
+        for name in self._parent.traces():
+            size = int(self._parent.ask(f'trac:poin? "{name}"'))
+            if _library_trace_name.fullmatch(name):
+                self._sizes[name] = size
+            else:
+                self._n_foreign_values += size
+
+    def _make_room(self, size: int) -> None:
+        if size > self._max_values:
+            raise ValueError(f'Trace of {size} values is larger than the '
+                             f'library ({self._max_values} values)')
+        n_values = self.n_values
+        for name in list(self._sizes):
+            if n_values + size <= self._max_values:
+                return
+            if self._references.get(name):
+                continue
+            self._parent.write(f'trac:rem "{name}"')
+            n_values -= self._sizes.pop(name)
+            self._n_evictions += 1
+        if n_values + size > self._max_values:
+            raise ValueError(f'No room for trace of {size} values, all '
+                             'traces in the library are in use')
+
+    def _acquire(self, name: str) -> None:
+        if name in self._sizes:
+            self._references[name] = self._references.get(name, 0) + 1
+
+    def _release(self, name: str) -> None:
+        count = self._references.get(name, 0)
+        if count > 1:
+            self._references[name] = count - 1
+        else:
+            self._references.pop(name, None)
+
+    def _forget(self) -> None:
+        self._sizes.clear()
+        self._references.clear()
+        self._n_foreign_values = 0
+
+
+def _divisors(n: int) -> List[int]:
+    small = [d for d in range(1, int(np.sqrt(n)) + 1) if n % d == 0]
+    large = [n // d for d in reversed(small) if d * d != n]
+    return small + large
+
+
+def compress_sweep_column(column: np.ndarray, hold: bool = True,
+                          tolerance_V: float = 1e-9
+                          ) -> Tuple[np.ndarray, int, int]:
+    """Describe a column of sweep voltages as a repeated list
+
+    The column is equal to the returned voltages, each held for a number of
+    steps, with the whole list repeated a number of times.
+
+    Args:
+        column (np.ndarray): Voltages, one per step
+        hold (bool, optional): Allow voltages to be held for several steps
+        tolerance_V (float, optional): Max difference between equal voltages
+
+    Returns:
+        Tuple[np.ndarray, int, int]: Voltages, steps per voltage, repetitions
+    """
+    n_steps = len(column)
+    if n_steps == 0:
+        return column, 1, 1
+    n_hold = 1
+    if hold:
+        for n_hold in reversed(_divisors(n_steps)):
+            runs = column.reshape(-1, n_hold)
+            if np.all(np.abs(runs - runs[:, :1]) <= tolerance_V):
+                break
+    voltages = column[::n_hold]
+    for period in _divisors(len(voltages)):
+        periods = voltages.reshape(-1, period)
+        if np.all(np.abs(periods - periods[0]) <= tolerance_V):
+            break
+    return voltages[:period], n_hold, len(voltages) // period
+
+
+def _is_linear(voltages: np.ndarray, tolerance_V: float = 1e-9) -> bool:
+    if len(voltages) < 3:
+        return False
+    ramp = np.linspace(voltages[0], voltages[-1], len(voltages))
+    return bool(np.all(np.abs(voltages - ramp) <= tolerance_V))
 
 
 class Virtual_Sweep_Context:
 
     def __init__(self, arrangement: 'Arrangement_Context', sweep: np.ndarray,
                  start_trigger: Optional[str], step_time_s: float,
-                 step_trigger: Optional[str], repetitions: Optional[int]):
+                 step_trigger: Optional[str], repetitions: Optional[int],
+                 compress: bool = False):
         self._arrangement = arrangement
         self._sweep = sweep
         self._step_trigger = step_trigger
         self._step_time_s = step_time_s
         self._repetitions = repetitions
+        self._marker_index = 0
+        self._columns: Optional[List[Tuple[np.ndarray, int, int]]] = None
+        if compress:
+            self._compress_columns()
         self._allocate_triggers(start_trigger)
         self._qdac_ready = False
 
@@ -1864,7 +2492,7 @@ class Virtual_Sweep_Context:
 
     def __exit__(self, exc_type, exc_val, exc_tb):
         # Stop markers
-        channel = self._get_channel(0)
+        channel = self._get_channel(self._marker_index)
         channel.write_channel(f'sour{"{0}"}:dc:mark:sst 0')
         # Stop any lists
         for contact_index in range(self._arrangement.shape):
@@ -1915,9 +2543,9 @@ class Virtual_Sweep_Context:
         if not self._step_trigger:
             return
         trigger = self._arrangement.get_trigger_by_name(self._step_trigger)
-        # All channels change in sync, so just use the first channel to make the
-        # external trigger.
-        channel = self._get_channel(0)
+        # All channels change in sync, so just use the first channel that
+        # changes on every step to make the external trigger.
+        channel = self._get_channel(self._marker_index)
         channel.write_channel(f'sour{"{0}"}:dc:mark:sst '
                               f'{_trigger_context_to_value(trigger)}')
 
@@ -1927,16 +2555,54 @@ class Virtual_Sweep_Context:
         return qdac.channel(channel_number)
 
     def _send_lists_to_qdac(self) -> None:
+        # The channels will no longer hold the voltages last sent
+        self._arrangement.forget_sent_voltages()
         for contact_index in range(self._arrangement.shape):
             self._send_list_to_qdac(contact_index, self._sweep[:, contact_index])
 
     def _send_list_to_qdac(self, contact_index, voltages):
+        if self._columns:
+            voltages, n_hold, n_repeats = self._columns[contact_index]
+            return self._send_compressed_list_to_qdac(contact_index, voltages,
+                                                      n_hold, n_repeats)
         channel = self._get_channel(contact_index)
         dc_list = channel.dc_list(voltages=voltages, dwell_s=self._step_time_s,
                                   repetitions=self._repetitions)
         trigger = self._arrangement.get_trigger_by_name(self._start_trigger_name)
         dc_list.start_on(trigger)
 
+    def _compress_columns(self) -> None:
+        columns = [compress_sweep_column(self._sweep[:, index])
+                   for index in range(self._arrangement.shape)]
+        holding = [n_hold > 1 for _, n_hold, _ in columns]
+        if all(holding):
+            # The step marker needs a channel that changes on every step
+            columns[0] = compress_sweep_column(self._sweep[:, 0], hold=False)
+            holding[0] = False
+        self._marker_index = holding.index(False)
+        self._columns = columns
+
+    def _send_compressed_list_to_qdac(self, contact_index: int,
+                                      voltages: np.ndarray, n_hold: int,
+                                      n_repeats: int) -> None:
+        repetitions = 1 if self._repetitions is None else self._repetitions
+        if repetitions > 0:
+            repetitions *= n_repeats
+        # Avoid sending rounding noise like 3.9999999999999996e-05
+        dwell_s = float(f'{n_hold * self._step_time_s:.12g}')
+        channel = self._get_channel(contact_index)
+        dc: _Dc_Context
+        if _is_linear(voltages):
+            dc = channel.dc_sweep(start_V=float(voltages[0]),
+                                  stop_V=float(voltages[-1]),
+                                  points=len(voltages),
+                                  repetitions=repetitions, dwell_s=dwell_s)
+        else:
+            dc = channel.dc_list(voltages=list(voltages), dwell_s=dwell_s,
+                                 repetitions=repetitions)
+        trigger = self._arrangement.get_trigger_by_name(self._start_trigger_name)
+        dc.start_on(trigger)
+
     def _make_ready_to_start(self):  # Bug circumvention
         for contact_index in range(self._arrangement.shape):
             channel = self._get_channel(contact_index)
@@ -1947,13 +2613,17 @@ class Arrangement_Context:
     def __init__(self, qdac: 'QDac2', contacts: Dict[str, int],
                  output_triggers: Optional[Dict[str, int]],
                  internal_triggers: Optional[Sequence[str]],
-                 outer_trigger_channel: Optional[int]):
+                 outer_trigger_channel: Optional[int],
+                 resolution_V: float = 0.0):
         self._qdac = qdac
         self._fix_contact_order(contacts)
         self._allocate_triggers(internal_triggers, output_triggers)
         self._outer_trigger_channel = outer_trigger_channel
         self._outer_trigger_context: Optional[Sine_Context] = None
         self._correction = np.identity(self.shape)
+        self._resolution_V = resolution_V
+        self._update_actual_voltages()
+        self.forget_sent_voltages()
 
     def __enter__(self):
         return self
@@ -2005,6 +2675,7 @@ class Arrangement_Context:
         """
         index = self._contact_index(contact)
         self._correction[index] = factors
+        self._update_actual_voltages()
 
     def set_virtual_voltage(self, contact: str, voltage: float) -> None:
         """Set virtual voltage on specific contact
@@ -2039,14 +2710,59 @@ class Arrangement_Context:
             self._virtual_voltages[index] = voltage
         self._effectuate_virtual_voltages()
 
+    def forget_sent_voltages(self) -> None:
+        """Make the next voltage update resend all contacts
+
+        The arrangement only sends voltages to the contacts whose actual
+        voltage has changed since it was last sent.  Channels written to
+        through their channel object or set_dc_voltages() are resent
+        automatically, but call this if the channels have been changed by
+        raw SCPI commands to the instrument.
+        """
+        self._sent_voltages = np.full(self.shape, np.nan)
+        self._sent_writes = np.full(self.shape, -1)
+
     def _effectuate_virtual_voltage(self, index: int, voltage: float) -> None:
+        delta_V = voltage - self._virtual_voltages[index]
         self._virtual_voltages[index] = voltage
-        self._effectuate_virtual_voltages()
+        # Only the column of the changed contact contributes to the change
+        self._actual_voltages += delta_V * self._correction[:, index]
+        self._send_changed_voltages()
 
     def _effectuate_virtual_voltages(self) -> None:
-        for index, channel_number in enumerate(self._channels):
-            actual_V = self.actual_voltages()[index]
-            self._qdac.channel(channel_number).dc_constant_V(actual_V)
+        self._update_actual_voltages()
+        self._send_changed_voltages()
+
+    def _update_actual_voltages(self) -> None:
+        self._actual_voltages = np.matmul(self._correction,
+                                          self._virtual_voltages)
+
+    def _channel_writes(self) -> np.ndarray:
+        counts = self._qdac._channel_writes
+        return np.fromiter((counts.get(channel, 0) for channel in self._channels),
+                           dtype=int, count=self.shape)
+
+    def _send_changed_voltages(self) -> None:
+        # Channels written to by others no longer hold the voltage sent
+        written_by_others = self._channel_writes() != self._sent_writes
+        self._sent_voltages[written_by_others] = np.nan
+        change_V = np.abs(self._actual_voltages - self._sent_voltages)
+        # Unsent contacts are NaN and thus never within resolution
+        changed = np.flatnonzero(~(change_V <= self._resolution_V))
+        if not len(changed):
+            return
+        # Recalculate the changed contacts from scratch to avoid accumulating
+        # rounding errors from the incremental updates
+        self._actual_voltages[changed] = np.matmul(
+            self._correction[changed], self._virtual_voltages)
+        actual_Vs = self._actual_voltages
+        if self._qdac._round_off:
+            actual_Vs = np.round(actual_Vs, self._qdac._round_off)
+        for index in changed:
+            channel = self._qdac.channel(self._channels[index])
+            channel.dc_constant_V(actual_Vs[index])
+        self._sent_voltages[changed] = self._actual_voltages[changed]
+        self._sent_writes[changed] = self._channel_writes()[changed]
 
     def add_correction(self, contact: str, factors: Sequence[float]) -> None:
         """Update how much a particular contact influences the other contacts
@@ -2065,6 +2781,7 @@ class Arrangement_Context:
         multiplier = np.identity(self.shape)
         multiplier[index] = factors
         self._correction = np.matmul(multiplier, self._correction)
+        self._update_actual_voltages()
 
     def _fix_contact_order(self, contacts: Dict[str, int]) -> None:
         self._contact_names = list()
@@ -2125,8 +2842,7 @@ class Arrangement_Context:
             raise
 
     def _all_channels_as_suffix(self) -> str:
-        channels_str = ints_to_comma_separated_list(self.channel_numbers)
-        return f'(@{channels_str})'
+        return channel_list_suffix(self.channel_numbers)
 
     def currents_A(self, nplc: int = 1, current_range: str = "low") -> Sequence[float]:
         """Measure currents on all contacts
@@ -2136,21 +2852,27 @@ class Arrangement_Context:
             current_range (str, optional): Current range (default low)
         """
         channels_suffix = self._all_channels_as_suffix()
-        self._qdac.write(f'sens:rang {current_range},{channels_suffix}')
-        # Wait for relays to finish switching by doing a query
-        self._qdac.ask('*stb?')
-        self._qdac.write(f'sens:nplc {nplc},{channels_suffix}')
-        # Wait for the current sensors to stabilize and then read
-        slowest_line_freq_Hz = 50
-        sleep_s((nplc + 1) / slowest_line_freq_Hz)
-        currents = self._qdac.ask(f'read? {channels_suffix}')
-        return comma_sequence_to_list_of_floats(currents)
+        range_cmd = f'sens:rang {current_range},{channels_suffix}'
+        nplc_cmd = f'sens:nplc {nplc},{channels_suffix}'
+        range_unchanged = self._qdac._is_shadowed(range_cmd)
+        nplc_unchanged = self._qdac._is_shadowed(nplc_cmd)
+        self._qdac.write(range_cmd)
+        if not range_unchanged:
+            # Wait for relays to finish switching by doing a query
+            self._qdac.ask('*stb?')
+        self._qdac.write(nplc_cmd)
+        if not (range_unchanged and nplc_unchanged):
+            # Wait for the current sensors to stabilize and then read
+            slowest_line_freq_Hz = 50
+            sleep_s((nplc + 1) / slowest_line_freq_Hz)
+        return self._qdac.ask_floats(f'read? {channels_suffix}')
 
     def virtual_sweep(self, contact: str, voltages: Sequence[float],
                       start_sweep_trigger: Optional[str] = None,
                       step_time_s: float = 1e-5,
                       step_trigger: Optional[str] = None,
-                      repetitions: int = 1) -> Virtual_Sweep_Context:
+                      repetitions: int = 1,
+                      compress: bool = False) -> Virtual_Sweep_Context:
         """Sweep a contact to create a 1D sweep
 
         Args:
@@ -2161,24 +2883,34 @@ class Arrangement_Context:
             step_time_s (float, optional): Delay between voltage changes
             step_trigger (None, optional): Trigger that marks each step
             repetitions (int, Optional): Number of back-and-forth sweeps, or -1 for infinite
+            compress (bool, Optional): Send linear or repetitive voltages as
+                DC sweeps or repeated lists instead of full lists
 
         Returns:
             Virtual_Sweep_Context: context manager
         """
         sweep = self._calculate_1d_values(contact, voltages)
         return Virtual_Sweep_Context(self, sweep, start_sweep_trigger,
-                                     step_time_s, step_trigger, repetitions)
+                                     step_time_s, step_trigger, repetitions,
+                                     compress)
 
     def _calculate_1d_values(self, contact: str, voltages: Sequence[float]
                              ) -> np.ndarray:
-        original_voltage = self.virtual_voltage(contact)
         index = self._contact_index(contact)
-        sweep = list()
-        for v in voltages:
-            self._virtual_voltages[index] = v
-            sweep.append(self.actual_voltages())
-        self._virtual_voltages[index] = original_voltage
-        return np.array(sweep)
+        grid = self._virtual_grid(len(voltages))
+        grid[:, index] = voltages
+        return self._correct_virtual_grid(grid)
+
+    def _virtual_grid(self, n_points: int) -> np.ndarray:
+        # One row of virtual voltages per point, initially the current ones
+        return np.tile(self._virtual_voltages, (n_points, 1))
+
+    def _correct_virtual_grid(self, grid: np.ndarray) -> np.ndarray:
+        # Corrected voltages for each row of virtual voltages
+        sweep = np.matmul(grid, np.transpose(self._correction))
+        if self._qdac._round_off:
+            sweep = np.round(sweep, self._qdac._round_off)
+        return sweep
 
     def virtual_sweep2d(self, inner_contact: str, inner_voltages: Sequence[float],
                         outer_contact: str, outer_voltages: Sequence[float],
@@ -2186,7 +2918,8 @@ class Arrangement_Context:
                         inner_step_time_s: float = 1e-5,
                         inner_step_trigger: Optional[str] = None,
                         outer_step_trigger: Optional[str] = None,
-                        repetitions: int = 1) -> Virtual_Sweep_Context:
+                        repetitions: int = 1,
+                        compress: bool = False) -> Virtual_Sweep_Context:
         """Sweep two contacts to create a 2D sweep
 
         Args:
@@ -2199,6 +2932,9 @@ class Arrangement_Context:
             inner_step_trigger (None, optional): Trigger that marks each step
             outer_step_trigger (None, optional): Name of trigger that marks outer step
             repetitions (int, Optional): Number of back-and-forth sweeps, or -1 for infinite
+            compress (bool, Optional): Send linear or repetitive voltages as
+                DC sweeps or repeated lists instead of full lists, which
+                typically means that only corrected contacts need full lists
 
         Returns:
             Virtual_Sweep_Context: context manager
@@ -2210,7 +2946,7 @@ class Arrangement_Context:
                                           outer_contact, outer_voltages)
         ctx = Virtual_Sweep_Context(self, sweep, start_sweep_trigger,
                                     inner_step_time_s, inner_step_trigger,
-                                    repetitions)
+                                    repetitions, compress)
         if outer_step_trigger:
             self._setup_outer_trigger(outer_step_trigger, start_sweep_trigger,
                                       len(inner_voltages)*inner_step_time_s,
@@ -2236,26 +2972,22 @@ class Arrangement_Context:
                              inner_voltages: Sequence[float],
                              outer_contact: str,
                              outer_voltages: Sequence[float]) -> np.ndarray:
-        original_fast_voltage = self.virtual_voltage(inner_contact)
-        original_slow_voltage = self.virtual_voltage(outer_contact)
         outer_index = self._contact_index(outer_contact)
         inner_index = self._contact_index(inner_contact)
-        sweep = list()
-        for slow_V in outer_voltages:
-            self._virtual_voltages[outer_index] = slow_V
-            for fast_V in inner_voltages:
-                self._virtual_voltages[inner_index] = fast_V
-                sweep.append(self.actual_voltages())
-        self._virtual_voltages[inner_index] = original_fast_voltage
-        self._virtual_voltages[outer_index] = original_slow_voltage
-        return np.array(sweep)
+        n_inner = len(inner_voltages)
+        n_outer = len(outer_voltages)
+        grid = self._virtual_grid(n_inner * n_outer)
+        grid[:, outer_index] = np.repeat(outer_voltages, n_inner)
+        grid[:, inner_index] = np.tile(inner_voltages, n_outer)
+        return self._correct_virtual_grid(grid)
 
     def virtual_detune(self, contacts: Sequence[str], start_V: Sequence[float],
                        end_V: Sequence[float], steps: int,
                        start_trigger: Optional[str] = None,
                        step_time_s: float = 1e-5,
                        step_trigger: Optional[str] = None,
-                       repetitions: int = 1) -> Virtual_Sweep_Context:
+                       repetitions: int = 1,
+                       compress: bool = False) -> Virtual_Sweep_Context:
         """Sweep any number of contacts linearly from one set of values to another set of values
 
         Args:
@@ -2267,11 +2999,13 @@ class Arrangement_Context:
             step_time_s (float, Optional): Seconds between each step
             step_trigger (None, optional): Trigger that marks each step
             repetitions (int, Optional): Number of back-and-forth sweeps, or -1 for infinite
+            compress (bool, Optional): Send repetitive voltages as repeated
+                lists instead of full lists
         """
         self._check_same_lengths(contacts, start_V, end_V)
         sweep = self._calculate_detune_values(contacts, start_V, end_V, steps)
         return Virtual_Sweep_Context(self, sweep, start_trigger, step_time_s,
-                                     step_trigger, repetitions)
+                                     step_trigger, repetitions, compress)
 
     @staticmethod
     def _check_same_lengths(contacts, start_V, end_V) -> None:
@@ -2283,33 +3017,43 @@ class Arrangement_Context:
 
     def _calculate_detune_values(self, contacts: Sequence[str], start_V: Sequence[float],
                                  end_V: Sequence[float], steps: int):
-        original_voltages = [self.virtual_voltage(contact) for contact in contacts]
         indices = [self._contact_index(contact) for contact in contacts]
-        sweep = list()
-        forward_V = [forward_and_back(start_V[i], end_V[i], steps) for i in range(len(contacts))]
-        for voltages in zip(*forward_V):
-            for index, voltage in zip(indices, voltages):
-                self._virtual_voltages[index] = voltage
-            sweep.append(self.actual_voltages())
-        for index, voltage in zip(indices, original_voltages):
-            self._virtual_voltages[index] = voltage
-        return np.array(sweep)
-
-    def leakage(self, modulation_V: float, nplc: int = 2) -> np.ndarray:
+        forward_V = [list(forward_and_back(start_V[i], end_V[i], steps))
+                     for i in range(len(contacts))]
+        grid = self._virtual_grid(len(forward_V[0]) if forward_V else 0)
+        for index, voltages in zip(indices, forward_V):
+            grid[:, index] = voltages
+        return self._correct_virtual_grid(grid)
+
+    def leakage(self, modulation_V: float, nplc: int = 2,
+                triggered: bool = False, settle_time_s: float = 1e-3
+                ) -> np.ndarray:
         """Run a simple leakage test between the contacts
 
         Each contact is changed in turn and the resulting change in current
         from steady-state is recorded.  The resulting resistance matrix is
         calculated as modulation_voltage divided by current_change.
 
+        When triggered, the whole modulation pattern is uploaded as DC lists
+        that are stepped by the instrument itself, and each step triggers a
+        measurement on all contacts, so the matrix is acquired in a single
+        run and read back with one query per contact.
+
         Args:
             modulation_V (float): Virtual voltage added to each contact
             nplc (int, Optional): Powerline cycles to wait for each measurement
+            triggered (bool, Optional): Let the instrument step through the pattern (default False)
+            settle_time_s (float, Optional): Seconds to settle before each triggered measurement (default 1ms)
 
         Returns:
             ndarray: contact-to-contact resistance in Ohms
         """
-        steady_state_A, currents_matrix = self._leakage_currents(modulation_V, nplc, 'low')
+        if triggered:
+            steady_state_A, currents_matrix = self._leakage_currents_triggered(
+                modulation_V, nplc, 'low', settle_time_s)
+        else:
+            steady_state_A, currents_matrix = self._leakage_currents(
+                modulation_V, nplc, 'low')
         with np.errstate(divide='ignore'):
             return np.abs(modulation_V / diff_matrix(steady_state_A, currents_matrix))
 
@@ -2326,6 +3070,55 @@ class Arrangement_Context:
             currents_matrix.append(currents)
         return steady_state_A, currents_matrix
 
+    def _leakage_currents_triggered(self, modulation_V: float, nplc: int,
+                                    current_range: str, settle_time_s: float
+                                    ) -> Tuple[Sequence[float], Sequence[Sequence[float]]]:
+        # First step is steady state, then each contact is modulated in turn
+        n_steps = self.shape + 1
+        modulations = np.vstack((np.zeros(self.shape),
+                                 modulation_V * np.identity(self.shape)))
+        sweep = self._correct_virtual_grid(self._virtual_grid(n_steps)
+                                           + modulations)
+        slowest_line_freq_Hz = 50
+        step_time_s = settle_time_s + (nplc + 1) / slowest_line_freq_Hz
+        # Generous margin for relay switching and communication
+        timeout_s = 2 * n_steps * step_time_s + 1
+        step_trigger = uuid.uuid4().hex
+        with contextlib.ExitStack() as stack:
+            # Return to steady state
+            stack.callback(self._effectuate_virtual_voltages)
+            self._allocate_internal_triggers([step_trigger])
+            stack.callback(self._forget_internal_trigger, step_trigger)
+            trigger = self.get_trigger_by_name(step_trigger)
+            measurements = list()
+            for channel_number in self._channels:
+                measurement = stack.enter_context(
+                    self._qdac.channel(channel_number).measurement(
+                        delay_s=settle_time_s, current_range=current_range,
+                        nplc=nplc))
+                measurement.start_on(trigger)
+                measurements.append(measurement)
+            # Wait for relays to finish switching by doing a query
+            self._qdac.ask('*stb?')
+            sweep_ctx = Virtual_Sweep_Context(self, sweep, None, step_time_s,
+                                              step_trigger, 1)
+            stack.callback(self._forget_internal_trigger,
+                           sweep_ctx._start_trigger_name)
+            with sweep_ctx:
+                sweep_ctx.start()
+                currents = _fetch_measurements(measurements, n_steps,
+                                               step_time_s, timeout_s)
+        for channel_number, values in zip(self._channels, currents):
+            if len(values) != n_steps:
+                raise ValueError(f'Expected {n_steps} measurements on channel '
+                                 f'{channel_number}, got {len(values)}')
+        currents_matrix = np.transpose(currents).tolist()
+        return currents_matrix[0], currents_matrix[1:]
+
+    def _forget_internal_trigger(self, name: str) -> None:
+        trigger = self._internal_triggers.pop(name)
+        self._qdac.free_trigger(trigger)
+
     def _contact_index(self, contact: str) -> int:
         return self._contacts[contact]
 
@@ -2362,33 +3155,49 @@ def forward_and_back(start: float, end: float, steps: int):
 
 class QDac2(VisaInstrument):
 
-    def __init__(self, name: str, address: str, **kwargs) -> None:
+    def __init__(self, name: str, address: str, lazy: bool = False,
+                 **kwargs) -> None:
         """Connect to a QDAC-II
 
+        When lazy, each channel and external trigger (and their parameters)
+        is only constructed the first time it is used, which makes
+        connecting much faster.  Until then it is not part of snapshots.
+
         Args:
             name (str): Name for instrument
             address (str): Visa identification string
+            lazy (bool, optional): Construct channels on first use (default False)
             **kwargs: additional argument to the Visa driver
         """
         self._check_instrument_name(name)
+        self._lazy_submodules: Dict[str, Callable[[], None]] = dict()
         super().__init__(name, address, terminator='\n', **kwargs)
         self._set_up_serial()
         self._set_up_debug_settings()
         self._set_up_channels()
         self._set_up_external_triggers()
+        if not lazy:
+            self._construct_all_submodules()
         self._set_up_internal_triggers()
         self._set_up_simple_functions()
         self.connect_message()
-        self._check_for_wrong_model()
-        self._check_for_incompatiable_firmware()
+        self._check_instrument()
         self._set_up_manual_triggers()
 
-    def n_channels(self) -> int:
+    def __getattr__(self, key: str) -> Any:
+        # Construct lazy channels and triggers on first use
+        if key in self.__dict__.get('_lazy_submodules', ()):
+            self._construct_submodule(key)
+            return self.submodules[key]
+        return super().__getattr__(key)
+
+    @staticmethod
+    def n_channels() -> int:
         """
         Returns:
             int: Number of channels
         """
-        return len(self.submodules['channels'])
+        return 24
 
     def channel(self, ch: int) -> QDac2Channel:
         """
@@ -2416,12 +3225,13 @@ class QDac2(VisaInstrument):
         """
         return 4
 
-    def n_external_outputs(self) -> int:
+    @staticmethod
+    def n_external_outputs() -> int:
         """
         Returns:
             int: Number of external output triggers
         """
-        return len(self.submodules['external_triggers'])
+        return 5
 
     def allocate_trigger(self) -> QDac2Trigger_Context:
         """Allocate an internal trigger
@@ -2473,9 +3283,53 @@ class QDac2(VisaInstrument):
         self.write(f'outp:trig{port}:widt {width_s}')
 
     def reset(self) -> None:
+        """Reset the instrument to its power-on state
+
+        This also returns data transfers to ASCII, see use_binary_readback().
+        """
         self.write('*rst')
         sleep_s(5)
 
+    def use_shadow_registers(self, enable: bool = True) -> None:
+        """Skip writing settings that would not change the instrument
+
+        The driver remembers the last value written to each setting (range,
+        NPLC, trigger source, etc) on each channel, and does not send the
+        setting again if the value is unchanged.  This also avoids waiting
+        for relays and sensors to settle when nothing changed.  The
+        registers are forgotten on reset (``*rst``).
+
+        Only use this when the instrument is not being changed by other
+        means, like the front panel or another connection.
+
+        Args:
+            enable (bool, optional): Use (default) or bypass shadow registers
+        """
+        with self._lock:
+            self._shadow_enabled = enable
+            self.forget_shadow_registers()
+
+    def forget_shadow_registers(self) -> None:
+        """Forget all settings remembered by the shadow registers"""
+        with self._lock:
+            self._shadow_registers: Dict[str, str] = dict()
+            self._shadow_hits = 0
+            self._shadow_misses = 0
+
+    def n_shadow_hits(self) -> int:
+        """
+        Returns:
+            int: Number of writes skipped by the shadow registers
+        """
+        return self._shadow_hits
+
+    def n_shadow_misses(self) -> int:
+        """
+        Returns:
+            int: Number of settings written despite the shadow registers
+        """
+        return self._shadow_misses
+
     def errors(self) -> str:
         """Retrieve and clear all previous errors
 
@@ -2514,6 +3368,8 @@ class QDac2(VisaInstrument):
         This means that all AWGs loose their data.
         """
         self.write('trac:rem:all')
+        if self._trace_library:
+            self._trace_library._forget()
 
     def traces(self) -> Sequence[str]:
         """List all defined traces
@@ -2535,6 +3391,56 @@ class QDac2(VisaInstrument):
         """
         return Trace_Context(self, name, size)
 
+    def trace_library(self, max_values: int = 1000000,
+                      chunk_size: int = 100000,
+                      progress: Optional[Callable[[int, int], None]] = None
+                      ) -> Trace_Library:
+        """Cache of traces identified by their values
+
+        The library is shared by everything using the instrument, so calling
+        this again returns the same library, with updated settings.
+
+        Args:
+            max_values (int, optional): Max total number of values in traces
+                kept on the instrument (default 1000000)
+            chunk_size (int, optional): Upload longer traces in chunks of
+                this many values (default 100000)
+            progress (Callable[[int, int], None], optional): Called with the
+                number of values sent so far and the total number of values
+                while uploading a trace
+
+        Returns:
+            Trace_Library: library
+        """
+        with self._lock:
+            library = self._trace_library
+            if library:
+                library._configure(max_values, chunk_size, progress)
+            else:
+                library = Trace_Library(self, max_values, chunk_size,
+                                        progress)
+            self._trace_library: Optional[Trace_Library] = library
+            return library
+
+    def use_binary_readback(self, enable: bool = True) -> None:
+        """Transfer lists of measurements as binary data
+
+        When enabled, the instrument answers data queries (eg. sens:data:rem?
+        and read?) with an IEEE-488.2 binary block of 64-bit floats, which is
+        decoded directly into a numpy array instead of parsing a comma
+        separated list.  This is much faster for long measurement buffers.
+
+        The instrument reverts to ASCII on reset (``*rst``).
+
+        Args:
+            enable (bool, optional): Binary (default) or ASCII transfer
+        """
+        if enable:
+            self.write('form:data real,64')
+        else:
+            self.write('form:data asc')
+        self._binary_readback = enable
+
     def mac(self) -> str:
         """
         Returns:
@@ -2547,7 +3453,8 @@ class QDac2(VisaInstrument):
     def arrange(self, contacts: Dict[str, int],
                 output_triggers: Optional[Dict[str, int]] = None,
                 internal_triggers: Optional[Sequence[str]] = None,
-                outer_trigger_channel: Optional[int] = None
+                outer_trigger_channel: Optional[int] = None,
+                resolution_V: float = 0.0
                 ) -> Arrangement_Context:
         """An arrangement of contacts and triggers for virtual gates
 
@@ -2564,17 +3471,108 @@ class QDac2(VisaInstrument):
         the correction matrix is the identity matrix, ie. the row for
         each contact has a value of [0, ..., 0, 1, 0, ..., 0].
 
+        The corrected voltages are cached, so that changing the virtual
+        voltage of a single contact only resends the contacts whose actual
+        voltage changes by more than resolution_V.
+
         Args:
             contacts (Dict[str, int]): Name/channel pairs
             output_triggers (Sequence[Tuple[str,int]], optional): Name/number pairs of output triggers
             internal_triggers (Sequence[str], optional): List of names of internal triggers to allocate
             outer_trigger_channel (int, optional): Additional channel if outer trigger is needed
+            resolution_V (float, optional): Smallest change worth sending to a contact (default 0)
 
         Returns:
             Arrangement_Context: context manager
         """
         return Arrangement_Context(self, contacts, output_triggers,
-                                   internal_triggers, outer_trigger_channel)
+                                   internal_triggers, outer_trigger_channel,
+                                   resolution_V)
+
+    def batch(self, max_message_length: int = 4000) -> Batch_Context:
+        """Coalesce SCPI commands into as few messages as possible
+
+        All commands written while the context is active, also by channels,
+        contexts and arrangements, are buffered and sent as semicolon-joined
+        messages when the context exits.  Queries flush the buffer before
+        being sent.  Nested transactions are absorbed by the outermost one.
+
+        The transaction only buffers commands from the thread that opened
+        it, so other threads (e.g. measurement streams) can still talk to the
+        instrument.  If the context exits because of an exception, the
+        buffered commands are discarded instead of sent.
+
+        Example:
+            with qdac.batch() as transaction:
+                arrangement.set_virtual_voltages({'gate1': 0.1, 'gate2': 0.2})
+            print(transaction.n_commands, transaction.n_messages)
+
+        Args:
+            max_message_length (int, optional): Max characters per message (default 4000)
+
+        Returns:
+            Batch_Context: context manager
+        """
+        return Batch_Context(self, max_message_length)
+
+    def set_dc_voltages(self, voltages: Dict[int, float]) -> None:
+        """Output constant voltages on several channels at once
+
+        Channels that get the same voltage share a single SCPI command, and
+        all commands are sent to the instrument as a single message.
+
+        Args:
+            voltages (Dict[int, float]): Voltage per channel number
+
+        Raises:
+            ValueError: unknown channel or voltage out of range
+        """
+        if not voltages:
+            return
+        self._check_channel_numbers(list(voltages))
+        if self._round_off:
+            voltages = {channel: float(np.round(voltage, self._round_off))
+                        for channel, voltage in voltages.items()}
+        channels_by_voltage: Dict[float, List[int]] = dict()
+        for channel, voltage in voltages.items():
+            try:
+                self._dc_constant_V_vals(channel).validate(voltage)
+            except ValueError as error:
+                raise ValueError(f'Voltage {voltage} on channel {channel} is '
+                                 f'out of range: {error}') from error
+            channels_by_voltage.setdefault(voltage, []).append(channel)
+        for channel in voltages:
+            self._note_channel_write(channel)
+        with self.batch():
+            self.write(f'sour:volt:mode fix,{channel_list_suffix(list(voltages))}')
+            for voltage, channels in channels_by_voltage.items():
+                self.write(f'sour:volt {voltage},{channel_list_suffix(channels)}')
+        self._update_dc_constant_caches(voltages)
+
+    def get_dc_voltages(self, channels: Optional[Sequence[int]] = None
+                        ) -> Dict[int, float]:
+        """Read the DC voltages of several channels with a single query
+
+        Args:
+            channels (Sequence[int], optional): Channel numbers (default all)
+
+        Returns:
+            Dict[int, float]: Voltage per channel number
+
+        Raises:
+            ValueError: unknown channel
+        """
+        if channels is None:
+            channels = range(1, self.n_channels() + 1)
+        channels = list(channels)
+        if not channels:
+            return dict()
+        self._check_channel_numbers(channels)
+        values = self.ask_floats(f'sour:volt? {channel_list_suffix(channels)}')
+        voltages = {channel: float(value)
+                    for channel, value in zip(channels, values)}
+        self._update_dc_constant_caches(voltages)
+        return voltages
 
     # -----------------------------------------------------------------------
     # Instrument-wide functions
@@ -2601,6 +3599,28 @@ class QDac2(VisaInstrument):
         self._scpi_sent = list()
         return commands
 
+    def start_profiling(self) -> Scpi_Profile:
+        """Profile all communication with the instrument
+
+        Every message sent is recorded with its latency, size and the driver
+        operation it came from.  Any previous profile is discarded.
+
+        Returns:
+            Scpi_Profile: The profile being recorded
+        """
+        self._profile: Optional[Scpi_Profile] = Scpi_Profile()
+        return self._profile
+
+    def stop_profiling(self) -> Optional[Scpi_Profile]:
+        """Stop profiling the communication with the instrument
+
+        Returns:
+            Optional[Scpi_Profile]: The recorded profile, if any
+        """
+        profile = self._profile
+        self._profile = None
+        return profile
+
     def clear(self) -> None:
         """Reset the VISA message queue of the instrument
         """
@@ -2637,9 +3657,25 @@ class QDac2(VisaInstrument):
         Args:
             cmd (str): SCPI command
         """
-        if self._record_commands:
-            self._scpi_sent.append(cmd)
-        super().write(cmd)
+        with self._lock:
+            if self._is_shadowed(cmd):
+                self._shadow_hits += 1
+                return
+            if _is_reset(cmd):
+                # The instrument reverts to ASCII transfers
+                self._binary_readback = False
+            if self._batch:
+                self._add_to_batch(cmd)
+            else:
+                if self._record_commands:
+                    self._scpi_sent.append(cmd)
+                try:
+                    self._communicate(cmd, functools.partial(super().write, cmd))
+                except Exception:
+                    self._forget_shadowed(cmd)
+                    raise
+            if self._shadow_enabled:
+                self._update_shadow_registers(cmd)
 
     def ask(self, cmd: str) -> str:
         """Send SCPI query to instrument
@@ -2650,11 +3686,36 @@ class QDac2(VisaInstrument):
         Returns:
             str: SCPI answer
         """
-        if self._record_commands:
-            self._scpi_sent.append(cmd)
-        answer = super().ask(cmd)
+        with self._lock:
+            self._flush_batch()
+            if self._record_commands:
+                self._scpi_sent.append(cmd)
+            answer = self._communicate(cmd, functools.partial(super().ask, cmd))
         return answer
 
+    def ask_floats(self, cmd: str) -> Sequence[float]:
+        """Send SCPI query answered by a list of numbers
+
+        The answer is a comma separated list, unless binary transfer has been
+        enabled by use_binary_readback(), in which case the answer is an
+        IEEE-488.2 binary block decoded into a numpy array.
+
+        Args:
+            cmd (str): SCPI query
+
+        Returns:
+            Sequence[float]: Numbers in the answer
+        """
+        if not self._binary_readback:
+            return comma_sequence_to_list_of_floats(self.ask(cmd))
+        with self._lock:
+            self._flush_batch()
+            if self._record_commands:
+                self._scpi_sent.append(cmd)
+            return self._communicate(cmd, functools.partial(
+                self.visa_handle.query_binary_values,
+                cmd, datatype='d', container=np.ndarray))
+
     def write_floats(self, cmd: str, values: Sequence[float]) -> None:
         """Append a list of values to a SCPI command
 
@@ -2662,14 +3723,192 @@ class QDac2(VisaInstrument):
 
         Remember to include separating space in command if needed.
         """
-        if self._no_binary_values:
-            compiled = f'{cmd}{floats_to_comma_separated_list(values)}'
+        with self._lock:
+            if self._no_binary_values:
+                compiled = f'{cmd}{floats_to_comma_separated_list(values)}'
+                if self._batch:
+                    self._add_to_batch(compiled)
+                    return
+                if self._record_commands:
+                    self._scpi_sent.append(compiled)
+                return self._communicate(
+                    compiled, functools.partial(super().write, compiled))
+            # Binary blocks cannot be joined with other commands
+            self._flush_batch()
+            if self._record_commands:
+                self._scpi_sent.append(f'{cmd}{floats_to_comma_separated_list(values)}')
+            self._communicate(
+                cmd, functools.partial(
+                    self.visa_handle.write_binary_values, cmd, values),
+                _binary_message_size(cmd, 4 * len(values)))
+
+    def _write_floats_in_chunks(
+            self, cmd: str, values: Sequence[float], chunk_size: int,
+            progress: Optional[Callable[[int, int], None]]) -> None:
+        # Send a single binary block, but in several pieces
+        n_values = len(values)
+        with self._lock:
+            if self._no_binary_values or n_values <= chunk_size:
+                self.write_floats(cmd, values)
+                if progress:
+                    progress(n_values, n_values)
+                return
+            self._flush_batch()
             if self._record_commands:
-                self._scpi_sent.append(compiled)
-            return super().write(compiled)
+                self._scpi_sent.append(f'{cmd}{floats_to_comma_separated_list(values)}')
+            data = np.ascontiguousarray(values, dtype='<f4').tobytes()
+            self._communicate(
+                cmd, functools.partial(
+                    self._write_binary_block, cmd, data, chunk_size, progress),
+                _binary_message_size(cmd, len(data)))
+
+    def _write_binary_block(
+            self, cmd: str, data: bytes, chunk_size: int,
+            progress: Optional[Callable[[int, int], None]]) -> None:
+        handle = self.visa_handle
+        n_values = len(data) // 4
+        length = str(len(data))
+        header = f'{cmd}#{len(length)}{length}'
+        # Only the termination may assert END, otherwise the instrument
+        # could take the message to be complete after the first piece.
+        send_end = handle.send_end
+        handle.send_end = False
+        try:
+            handle.write_raw(header.encode(handle.encoding))
+            for start in range(0, n_values, chunk_size):
+                stop = min(start + chunk_size, n_values)
+                handle.write_raw(data[4 * start:4 * stop])
+                if progress:
+                    progress(stop, n_values)
+        finally:
+            handle.send_end = send_end
+        handle.write_raw(handle.write_termination.encode(handle.encoding))
+
+    def _communicate(self, message: str, call: Callable[[], Any],
+                     n_bytes_sent: Optional[int] = None) -> Any:
+        if not self._profile:
+            return call()
+        return self._profile.measure(message, call, n_bytes_sent)
+
+    def _is_shadowed(self, cmd: str) -> bool:
+        # Would the setting be skipped because of the shadow registers?
+        if not self._shadow_enabled:
+            return False
+        registers = setting_to_registers(cmd)
+        if not registers:
+            return False
+        return all(self._shadow_registers.get(register) == value
+                   for register, value in registers.items())
+
+    def _update_shadow_registers(self, cmd: str) -> None:
+        # Remember a setting that has been sent (or batched)
+        registers = setting_to_registers(cmd)
+        if not registers:
+            self._invalidate_shadow_registers(cmd)
+            return
+        self._shadow_misses += 1
+        for register, value in registers.items():
+            prefix, _, setting = register.rpartition(':')
+            coupled = _coupled_settings.get(setting)
+            if coupled:
+                self._shadow_registers.pop(f'{prefix}:{coupled}', None)
+            self._shadow_registers[register] = value
+
+    def _forget_shadowed(self, cmd: str) -> None:
+        # The setting may or may not have reached the instrument
+        registers = setting_to_registers(cmd)
+        if not registers:
+            self._invalidate_shadow_registers(cmd)
+            return
+        for register in registers:
+            self._shadow_registers.pop(register, None)
+
+    def _invalidate_shadow_registers(self, cmd: str) -> None:
+        header = cmd.strip().partition(' ')[0].lower()
+        if header in ('*rst', '*rcl'):
+            self._shadow_registers.clear()
+            return
+        if not _shadowed_setting.fullmatch(header):
+            return
+        # Setting without channel list, so could affect all channels
+        node, _, rest = header.partition(':')
+        for register in list(self._shadow_registers):
+            if register.startswith(node) and register.endswith(f':{rest}'):
+                del self._shadow_registers[register]
+
+    @property
+    def _batch(self) -> Optional[Batch_Context]:
+        # Outermost transaction of the calling thread
+        transactions = self._batch_transactions()
+        return transactions[0] if transactions else None
+
+    def _batch_transactions(self) -> List[Batch_Context]:
+        # Transactions are per thread, innermost last
+        transactions = getattr(self._batch_local, 'transactions', None)
+        if transactions is None:
+            transactions = list()
+            self._batch_local.transactions = transactions
+        return transactions
+
+    def _begin_batch(self, batch: Batch_Context) -> None:
+        transactions = self._batch_transactions()
+        if transactions:
+            batch._start = len(transactions[0]._pending)
+        transactions.append(batch)
+
+    def _end_batch(self, batch: Batch_Context, discard: bool = False) -> None:
+        transactions = self._batch_transactions()
+        if not transactions or transactions[-1] is not batch:
+            return
+        outermost = transactions[0]
+        if discard:
+            discarded = outermost._pending[batch._start:]
+            del outermost._pending[batch._start:]
+            # The discarded settings were remembered when batched
+            self._shadow_registers.clear()
+            self._forget_discarded(discarded)
+        try:
+            if batch is outermost:
+                with self._lock:
+                    self._flush_batch()
+        finally:
+            transactions.pop()
+
+    def _forget_discarded(self, commands: Sequence[str]) -> None:
+        # The discarded commands may have updated caches and sent state
+        # when batched, so make arrangements resend and caches re-read
+        channels: Set[int] = set()
+        for cmd in commands:
+            channels.update(command_to_channels(cmd))
+        for channel in channels:
+            self._note_channel_write(channel)
+            module = self.submodules.get(f'ch{channel:02}')
+            if isinstance(module, QDac2Channel):
+                module.dc_constant_V.cache.invalidate()
+
+    def _add_to_batch(self, cmd: str) -> None:
+        transactions = self._batch_transactions()
+        transactions[0]._pending.append(cmd)
+        for transaction in transactions:
+            transaction._n_commands += 1
+
+    def _flush_batch(self) -> None:
+        transactions = self._batch_transactions()
+        if not transactions:
+            return
         if self._record_commands:
-            self._scpi_sent.append(f'{cmd}{floats_to_comma_separated_list(values)}')
-        self.visa_handle.write_binary_values(cmd, values)
+            # Batched commands are only recorded once actually sent
+            self._scpi_sent.extend(transactions[0]._pending)
+        try:
+            for message in transactions[0]._messages():
+                self._communicate(message, functools.partial(super().write, message))
+        except Exception:
+            # Unknown which of the batched settings reached the instrument
+            self._shadow_registers.clear()
+            raise
+        # Nothing of the nested transactions is left in the buffer
+        for transaction in transactions[1:]:
+            transaction._start = 0
 
     # -----------------------------------------------------------------------
 
@@ -2679,47 +3918,133 @@ class QDac2(VisaInstrument):
         self._message_flush_timeout_ms = 1
         self._round_off = None
         self._no_binary_values = False
+        self._binary_readback = False
+        self._batch_local = threading.local()
+        self._channel_writes: Dict[int, int] = dict()
+        self._lock = threading.RLock()
+        self._streams: List[Measurement_Stream_Context] = list()
+        self._streams_lock = threading.Lock()
+        self._stream_reader: Optional[threading.Thread] = None
+        self._profile = None
+        self._shadow_enabled = False
+        self.forget_shadow_registers()
+        self._trace_library = None
+
+    # -----------------------------------------------------------------------
+    # Background reading of measurement streams.  A single reader thread
+    # serves all streams, and the communication lock keeps it from
+    # interleaving with commands from other threads.
+
+    def _register_stream(self, stream: Measurement_Stream_Context) -> None:
+        with self._streams_lock:
+            self._streams.append(stream)
+            if not self._stream_reader:
+                reader = threading.Thread(target=self._read_streams,
+                                          name=f'{self.name}-streams',
+                                          daemon=True)
+                self._stream_reader = reader
+                reader.start()
+
+    def _unregister_stream(self, stream: Measurement_Stream_Context) -> None:
+        with self._streams_lock:
+            if stream in self._streams:
+                self._streams.remove(stream)
+            reader = self._stream_reader
+        if reader and reader is not threading.current_thread():
+            if not self._streams:
+                reader.join()
+
+    def _read_streams(self) -> None:
+        while True:
+            with self._streams_lock:
+                streams = list(self._streams)
+                if not streams:
+                    self._stream_reader = None
+                    return
+            for stream in streams:
+                with self._lock:
+                    stream._poll()
+            sleep_s(min(s._poll_interval_s for s in streams))
+
+    # -----------------------------------------------------------------------
 
     def _set_up_serial(self) -> None:
         # No harm in setting the speed even if the connection is not serial.
         self.visa_handle.baud_rate = 921600  # type: ignore
 
+    def _check_instrument(self) -> None:
+        # Only check each instrument once per session
+        idn = self.IDN.cache()
+        identity = tuple(str(idn.get(field)) for field in
+                         ('vendor', 'model', 'serial', 'firmware'))
+        if identity in _verified_instruments:
+            return
+        self._check_for_wrong_model()
+        self._check_for_incompatiable_firmware()
+        _verified_instruments.add(identity)
+
     def _check_for_wrong_model(self) -> None:
-        model = self.IDN()['model']
+        model = self.IDN.cache()['model']
         if model != 'QDAC-II':
             raise ValueError(f'Unknown model {model}. Are you using the right'
                              ' driver for your instrument?')
 
     def _check_for_incompatiable_firmware(self) -> None:
         # Only compare the firmware, not the FPGA version
-        firmware = split_version_string_into_components(self.IDN()['firmware'])[1]
+        firmware = split_version_string_into_components(
+            self.IDN.cache()['firmware'])[1]
         least_compatible_fw = '0.17.5'
         if parse(firmware) < parse(least_compatible_fw):
             raise ValueError(f'Incompatible firmware {firmware}. You need at '
                              f'least {least_compatible_fw}')
 
     def _set_up_channels(self) -> None:
+        for i in range(1, self.n_channels() + 1):
+            name = f'ch{i:02}'
+            self._lazy_submodules[name] = functools.partial(
+                self._add_channel, name, i)
+        self._lazy_submodules['channels'] = self._add_channel_list
+
+    def _add_channel(self, name: str, i: int) -> None:
+        self.add_submodule(name, QDac2Channel(self, name, i))
+
+    def _add_channel_list(self) -> None:
         channels = ChannelList(self, 'Channels', QDac2Channel,
                                snapshotable=False)
-        for i in range(1, 24 + 1):
-            name = f'ch{i:02}'
-            channel = QDac2Channel(self, name, i)
-            self.add_submodule(name, channel)
-            channels.append(channel)
+        for i in range(1, self.n_channels() + 1):
+            channels.append(self.channel(i))
         channels.lock()
         self.add_submodule('channels', channels)
 
     def _set_up_external_triggers(self) -> None:
+        for i in range(1, self.n_external_outputs() + 1):
+            name = f'ext{i}'
+            self._lazy_submodules[name] = functools.partial(
+                self._add_external_trigger, name, i)
+        self._lazy_submodules['external_triggers'] = \
+            self._add_external_trigger_list
+
+    def _add_external_trigger(self, name: str, i: int) -> None:
+        self.add_submodule(name, QDac2ExternalTrigger(self, name, i))
+
+    def _add_external_trigger_list(self) -> None:
         triggers = ChannelList(self, 'Channels', QDac2ExternalTrigger,
                                snapshotable=False)
-        for i in range(1, 5 + 1):
-            name = f'ext{i}'
-            trigger = QDac2ExternalTrigger(self, name, i)
-            self.add_submodule(name, trigger)
-            triggers.append(trigger)
+        for i in range(1, self.n_external_outputs() + 1):
+            triggers.append(getattr(self, f'ext{i}'))
         triggers.lock()
         self.add_submodule('external_triggers', triggers)
 
+    def _construct_submodule(self, name: str) -> None:
+        with self._lock:
+            construct = self._lazy_submodules.pop(name, None)
+            if construct:
+                construct()
+
+    def _construct_all_submodules(self) -> None:
+        for name in list(self._lazy_submodules):
+            self._construct_submodule(name)
+
     def _set_up_internal_triggers(self) -> None:
         # A set of the available internal triggers
         self._internal_triggers = set(range(1, self.n_triggers() + 1))
@@ -2735,6 +4060,29 @@ class QDac2(VisaInstrument):
     def _set_up_simple_functions(self) -> None:
         self.add_function('abort', call_cmd='abor')
 
+    def _check_channel_numbers(self, channels: Sequence[int]) -> None:
+        for channel in channels:
+            if not 1 <= channel <= self.n_channels():
+                raise ValueError(f'Unknown channel {channel}')
+
+    def _note_channel_write(self, channel: int) -> None:
+        # Lets arrangements know that a channel has been changed
+        self._channel_writes[channel] = self._channel_writes.get(channel, 0) + 1
+
+    def _dc_constant_V_vals(self, channel: int) -> validators.Validator:
+        # Don't construct lazy channels just to validate their voltage
+        module = self.submodules.get(f'ch{channel:02}')
+        if isinstance(module, QDac2Channel):
+            return module.dc_constant_V.vals
+        return _dc_constant_V_vals
+
+    def _update_dc_constant_caches(self, voltages: Dict[int, float]) -> None:
+        # Don't construct lazy channels just to update their cache
+        for channel, voltage in voltages.items():
+            module = self.submodules.get(f'ch{channel:02}')
+            if isinstance(module, QDac2Channel):
+                module.dc_constant_V.cache.set(voltage)
+
     def _check_instrument_name(self, name: str) -> None:
         if name.isidentifier():
             return
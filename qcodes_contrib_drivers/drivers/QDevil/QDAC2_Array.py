@@ -1,8 +1,10 @@
 from .QDAC2 import QDac2, QDac2Channel, QDac2ExternalTrigger, \
-    QDac2Trigger_Context, Arrangement_Context, ExternalInput, \
-    comma_sequence_to_list_of_floats, diff_matrix
-from typing import Tuple, Dict, Sequence, List, FrozenSet, Optional
+    QDac2Trigger_Context, Arrangement_Context, ExternalInput, diff_matrix
+from typing import Tuple, Dict, Sequence, List, FrozenSet, Optional, \
+    Callable, TypeVar
+from concurrent.futures import ThreadPoolExecutor
 import numpy as np
+import weakref
 from time import sleep as sleep_s
 
 # Version 0.1.1
@@ -12,14 +14,17 @@ from time import sleep as sleep_s
 #
 # 1. Use the underlying QDAC2.py driver as much as possible.
 #
-
-
+# 2. Work that involves several instruments is sent to all of them
+#    concurrently, but in phases, so that any synchronisation between the
+#    instruments (eg. by triggers) is unaffected.
 #
-# Future improvements
-# -------------------
+# 3. Corrections between contacts are done by the array arrangement across
+#    all instruments, so the arrangements on each instrument just receive
+#    the corrected voltages.
 #
-# - An array arrangement should support corrections between contacts
-#   (which the indiviual arrangements on each instrument does).
+
+
+T = TypeVar('T')
 
 
 def _check_for_reserved_outputs(triggers: Dict[str, int]) -> None:
@@ -29,6 +34,15 @@ def _check_for_reserved_outputs(triggers: Dict[str, int]) -> None:
 
 
 class Array_Arrangement_Context:
+    """Arrangement of contacts across several QDAC-IIs
+
+    The virtual voltages and the correction matrix span the contacts of all
+    instruments, and are only kept here.  The arrangement made on each
+    instrument is left without correction and is given the corrected
+    voltages, so its virtual voltages are the actual voltages of its
+    contacts.  Corrections must therefore be made on this arrangement, not
+    on the arrangements of the individual instruments.
+    """
 
     def __init__(self, qdacs: 'QDac2_Array',
                  contacts: Dict[str, Dict[str, int]],
@@ -37,6 +51,8 @@ class Array_Arrangement_Context:
         self._qdacs = qdacs
         self._arrangements: Dict[str, Arrangement_Context] = dict()
         self._contacts: Dict[str, str] = dict()
+        # Indices into the array-wide contact order for each instrument
+        self._indices: Dict[str, List[int]] = dict()
         for qdac in qdacs._qdacs:
             qdac_name = qdac.full_name
             qdac_contacts = contacts.get(qdac_name, dict())
@@ -50,19 +66,35 @@ class Array_Arrangement_Context:
             else:
                 arrangement = qdac.arrange(qdac_contacts, qdac_outputs)
             self._arrangements[qdac_name] = arrangement
+            self._indices[qdac_name] = list()
             for c_name in qdac_contacts.keys():
                 if c_name in self._contacts:
                     raise ValueError(f'Contact name {c_name} used multiple times')
+                self._indices[qdac_name].append(len(self._contacts))
                 self._contacts[c_name] = qdac_name
+        self._contact_indices = {name: index for index, name
+                                 in enumerate(self._contacts)}
+        self._correction = np.identity(self.shape)
+        self._virtual_voltages = np.zeros(self.shape)
 
     def __enter__(self):
         return self
 
     def __exit__(self, exc_type, exc_val, exc_tb):
-        for arrangement in self._arrangements.values():
-            arrangement.__exit__(exc_type, exc_val, exc_tb)
+        self._fan_out(lambda arrangement:
+                      arrangement.__exit__(exc_type, exc_val, exc_tb))
         return False
 
+    @property
+    def shape(self) -> int:
+        """Number of contacts in the arrangement"""
+        return len(self._contacts)
+
+    @property
+    def correction_matrix(self) -> np.ndarray:
+        """Correction matrix across all contacts, in contact order"""
+        return self._correction
+
     @property
     def contact_names(self) -> Sequence[str]:
         """
@@ -94,18 +126,79 @@ class Array_Arrangement_Context:
         Returns:
             float: Voltage before correction
         """
-        qdac = self._get_qdac_for(contact)
-        arrangement = self._arrangements[qdac]
-        return arrangement.virtual_voltage(contact)
+        return self._virtual_voltages[self._contact_index(contact)]
+
+    def actual_voltages(self) -> Sequence[float]:
+        """
+        Returns:
+            Sequence[float]: Corrected voltages for all contacts
+        """
+        return list(np.matmul(self._correction, self._virtual_voltages))
+
+    def initiate_correction(self, contact: str, factors: Sequence[float]) -> None:
+        """Override how much a particular contact influences the other contacts
+
+        The contacts can be on any of the instruments in the array.
+
+        Args:
+            contact (str): Name of contact
+            factors (Sequence[float]): factors between -1.0 and 1.0, one per contact
+        """
+        self._check_factors(factors)
+        self._correction[self._contact_index(contact)] = factors
+
+    def add_correction(self, contact: str, factors: Sequence[float]) -> None:
+        """Update how much a particular contact influences the other contacts
+
+        The factors are extended by the identity matrix and multiplied to the
+        correction matrix.
+
+        Args:
+            contact (str): Name of contact
+            factors (Sequence[float]): factors usually between -1.0 and 1.0, one per contact
+        """
+        self._check_factors(factors)
+        multiplier = np.identity(self.shape)
+        multiplier[self._contact_index(contact)] = factors
+        self._correction = np.matmul(multiplier, self._correction)
+
+    def set_virtual_voltage(self, contact: str, voltage: float) -> None:
+        """Set virtual voltage on specific contact
+
+        The actual voltages depend on the correction matrix, so contacts on
+        other instruments might change as well.
+
+        Args:
+            contact (str): Name of contact
+            voltage (float): Voltage corresponding to no correction
+        """
+        self.set_virtual_voltages({contact: voltage})
 
     def set_virtual_voltages(self, contacts_to_voltages: Dict[str, float]) -> None:
-        for qdac in self.qdac_names():
-            qdac_voltages: Dict[str, float] = dict()
-            for contact, voltage in contacts_to_voltages.items():
-                if self._get_qdac_for(contact) == qdac:
-                    qdac_voltages[contact] = voltage
-            arrangement = self._arrangements[qdac]
-            arrangement.set_virtual_voltages(qdac_voltages)
+        """Set virtual voltages on specific contacts in one go
+
+        The corrected voltages are calculated for all contacts at once, and
+        then each instrument is sent the contacts that changed, as a single
+        message per instrument.
+
+        Args:
+            contacts_to_voltages (Dict[str,float]): contact to voltage map
+        """
+        for contact, voltage in contacts_to_voltages.items():
+            self._virtual_voltages[self._contact_index(contact)] = voltage
+        self._send_actual_voltages()
+
+    def _send_actual_voltages(self) -> None:
+        actual_V = np.matmul(self._correction, self._virtual_voltages)
+
+        def send(arrangement: Arrangement_Context) -> None:
+            indices = self._indices[arrangement._qdac.full_name]
+            # The arrangement on each instrument only resends changed contacts
+            with arrangement._qdac.batch():
+                arrangement.set_virtual_voltages(
+                    dict(zip(arrangement.contact_names, actual_V[indices])))
+
+        self._fan_out(send)
 
     def currents_A(self, nplc: int = 1, current_range: str = "low") -> Sequence[float]:
         """Measure currents on all contacts
@@ -117,25 +210,40 @@ class Array_Arrangement_Context:
             current_range (str, optional): Current range (default low)
         """
         # Setup current measurement on all instruments
-        for qdac in self.qdac_names():
-            arrangement = self._arrangements[qdac]
+        def set_range(arrangement: Arrangement_Context) -> bool:
             channels_suffix = arrangement._all_channels_as_suffix()
-            arrangement._qdac.write(f'sens:rang {current_range},{channels_suffix}')
-        for qdac in self.qdac_names():
-            arrangement = self._arrangements[qdac]
+            range_cmd = f'sens:rang {current_range},{channels_suffix}'
+            switching = not arrangement._qdac._is_shadowed(range_cmd)
+            arrangement._qdac.write(range_cmd)
+            return switching
+
+        relays_switching = self._fan_out(set_range)
+
+        def set_nplc(arrangement: Arrangement_Context, switching: bool) -> bool:
             channels_suffix = arrangement._all_channels_as_suffix()
-            # Wait for relays to finish switching by doing a query
-            arrangement._qdac.ask(f'*stb?')
-            arrangement._qdac.write(f'sens:nplc {nplc},{channels_suffix}')
-        # Wait for the current sensors to stabilize and then read
-        slowest_line_freq_Hz = 50
-        sleep_s((nplc + 1) / slowest_line_freq_Hz)
-        values: List[float] = list()
-        for qdac in self.qdac_names():
-            arrangement = self._arrangements[qdac]
+            if switching:
+                # Wait for relays to finish switching by doing a query
+                arrangement._qdac.ask(f'*stb?')
+            nplc_cmd = f'sens:nplc {nplc},{channels_suffix}'
+            changed = switching or not arrangement._qdac._is_shadowed(nplc_cmd)
+            arrangement._qdac.write(nplc_cmd)
+            return changed
+
+        switching_per_qdac = dict(zip(self.qdac_names(), relays_switching))
+        changed = self._fan_out(lambda arrangement: set_nplc(
+            arrangement, switching_per_qdac[arrangement._qdac.full_name]))
+        if any(changed):
+            # Wait for the current sensors to stabilize and then read
+            slowest_line_freq_Hz = 50
+            sleep_s((nplc + 1) / slowest_line_freq_Hz)
+
+        def read(arrangement: Arrangement_Context) -> List[float]:
             channels_suffix = arrangement._all_channels_as_suffix()
-            currents = arrangement._qdac.ask(f'read? {channels_suffix}')
-            values += comma_sequence_to_list_of_floats(currents)
+            return list(arrangement._qdac.ask_floats(f'read? {channels_suffix}'))
+
+        values: List[float] = list()
+        for currents in self._fan_out(read):
+            values += currents
         return values
 
     def leakage(self, modulation_V: float, nplc: int = 2) -> np.ndarray:
@@ -161,22 +269,38 @@ class Array_Arrangement_Context:
                           ) -> Tuple[Sequence[float], Sequence[Sequence[float]]]:
         steady_state_A = self.currents_A(nplc, 'low')
         currents_matrix = list()
-        for qdac in self.qdac_names():
-            arrangement = self._arrangements[qdac]
-            for index, channel_nr in enumerate(arrangement.channel_numbers):
-                original_V = arrangement._virtual_voltages[index]
-                arrangement._effectuate_virtual_voltage(index, original_V + modulation_V)
-                currents = self.currents_A(nplc, current_range)
-                arrangement._effectuate_virtual_voltage(index, original_V)
-                currents_matrix.append(currents)
+        for index in range(self.shape):
+            original_V = self._virtual_voltages[index]
+            self._virtual_voltages[index] = original_V + modulation_V
+            self._send_actual_voltages()
+            currents = self.currents_A(nplc, current_range)
+            self._virtual_voltages[index] = original_V
+            self._send_actual_voltages()
+            currents_matrix.append(currents)
         return steady_state_A, currents_matrix
 
+    def _contact_index(self, contact: str) -> int:
+        try:
+            return self._contact_indices[contact]
+        except KeyError:
+            raise ValueError(f'No contact named "{contact}"')
+
+    def _check_factors(self, factors: Sequence[float]) -> None:
+        if len(factors) != self.shape:
+            raise ValueError(f'There must be exactly one factor per contact '
+                             f'({self.shape}): {factors}')
+
     def _get_qdac_for(self, contact: str) -> str:
         try:
             return self._contacts[contact]
         except KeyError:
             raise ValueError(f'No contact named "{contact}"')
 
+    def _fan_out(self, work: Callable[[Arrangement_Context], T]) -> List[T]:
+        # Do work on all instruments concurrently, results in instrument order
+        arrangements = [self._arrangements[qdac] for qdac in self.qdac_names()]
+        return self._qdacs._run_concurrently(work, arrangements)
+
 
 
 class QDac2_Array:
@@ -193,6 +317,21 @@ class QDac2_Array:
         self._controller = controller
         self._qdacs = [controller, *listeners]  # Order is important
         self._check_unique_names()
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._executor_finalizer: Optional[weakref.finalize] = None
+
+    def close(self) -> None:
+        """Stop the threads used for talking to several instruments at once
+
+        The threads are also stopped when the array is garbage collected.
+        The instruments themselves are left open.
+        """
+        if self._executor_finalizer:
+            self._executor_finalizer.detach()
+            self._executor_finalizer = None
+        if self._executor:
+            self._executor.shutdown()
+            self._executor = None
 
     @property
     def trigger_out(self) -> int:
@@ -267,9 +406,9 @@ class QDac2_Array:
         The arrangement is a collection of QDac2.arrangement, one for each
         instrument but with a dedicated controller.
 
-        See QDac2.arrangement() for further documentation.  Note that an
-        array arrangement does not (yet) support corrections between contacts
-        (which the indiviual arrangements on each instrument does).
+        See QDac2.arrangement() for further documentation.  The correction
+        matrix of an array arrangement spans the contacts of all
+        instruments, in the order given by contact_names.
 
         Args:
             contacts (Dict[str,Dict[str, int]]): Instrument name to contact-name/channel pairs
@@ -287,11 +426,36 @@ class QDac2_Array:
             self._controller.write(command)
 
     def _listeners_write(self, commands: List[str]) -> None:
-        listeners = self._qdacs[1:]
-        for listener in listeners:
+        def write(listener: QDac2) -> None:
             for command in commands:
                 listener.write(command)
 
+        self._run_concurrently(write, self._qdacs[1:])
+
+    def _run_concurrently(self, work: Callable[..., T],
+                          targets: Sequence) -> List[T]:
+        # Each instrument serialises its own communication, so instruments
+        # can safely be talked to from one thread each.  Batches only buffer
+        # commands from the thread that opened them, so while the calling
+        # thread has one open, the work is done in this thread.
+        if len(targets) < 2 or any(qdac._batch for qdac in self._qdacs):
+            return [work(target) for target in targets]
+        if not self._executor:
+            self._executor = ThreadPoolExecutor(
+                max_workers=len(self._qdacs),
+                thread_name_prefix=f'{self._controller_name}-array')
+            # The worker threads only hold a weak reference to the executor,
+            # so they don't keep the array alive.
+            self._executor_finalizer = weakref.finalize(
+                self, self._executor.shutdown, wait=False)
+        futures = [self._executor.submit(work, target) for target in targets]
+        # Wait for all, then raise the first error in instrument order
+        exceptions = [future.exception() for future in futures]
+        for exception in exceptions:
+            if exception:
+                raise exception
+        return [future.result() for future in futures]
+
     def _check_unique_names(self) -> None:
         self._controller_name = self._controller.full_name
         self._qdac_names = frozenset([qdac.full_name for qdac in self._qdacs])
@@ -0,0 +1,276 @@
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional, Sequence, TypeVar
+from .QDAC2 import QDac2, Arrangement_Context, Measurement_Context
+from .QSwitch import QSwitch, State
+
+# Version 0.1.0
+#
+# Guiding principles for the asyncio front ends
+# ---------------------------------------------
+#
+# 1. Use the underlying QDAC2.py and QSwitch.py drivers for everything, so
+#    that the synchronous and the asynchronous interfaces behave the same.
+#
+# 2. VISA calls are blocking, so each instrument gets its own worker thread
+#    which carries out the calls in the order they were awaited.  The event
+#    loop is never stalled, and instruments are served independently.
+#
+# 3. The front ends do not own the instruments; closing a front end only
+#    stops its worker thread.
+
+
+T = TypeVar('T')
+
+
+class _Async_Instrument:
+    """Asyncio front end running all calls on a dedicated worker thread"""
+
+    def __init__(self, instrument: Any) -> None:
+        self._instrument = instrument
+        self._executor = ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix=instrument.full_name)
+
+    async def run(self, work: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+        """Carry out any blocking call on the worker thread of the instrument
+
+        Args:
+            work (Callable): Function to call, typically a driver method
+            *args: Positional arguments for the function
+            **kwargs: Keyword arguments for the function
+
+        Returns:
+            The result of the function
+        """
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self._executor, functools.partial(work, *args, **kwargs))
+
+    async def write(self, cmd: str) -> None:
+        """Send SCPI command to instrument
+
+        Args:
+            cmd (str): SCPI command
+        """
+        await self.run(self._instrument.write, cmd)
+
+    async def ask(self, cmd: str) -> str:
+        """Send SCPI query to instrument
+
+        Args:
+            cmd (str): SCPI query
+
+        Returns:
+            str: SCPI answer
+        """
+        return await self.run(self._instrument.ask, cmd)
+
+    def close(self) -> None:
+        """Stop the worker thread once outstanding calls have finished
+
+        The instrument itself is left open.
+        """
+        self._executor.shutdown(wait=True)
+
+
+class AsyncQDac2(_Async_Instrument):
+    """Asyncio front end for a QDAC-II
+
+    Example:
+
+        qdac = QDac2('QDAC', visalib='@py', address=...)
+        async_qdac = AsyncQDac2(qdac)
+        arrangement = qdac.arrange({'gate': 1, 'sensor': 2})
+        await async_qdac.set_virtual_voltages(arrangement, {'gate': 0.1})
+        currents_A = await async_qdac.currents_A(arrangement)
+    """
+
+    def __init__(self, qdac: QDac2) -> None:
+        super().__init__(qdac)
+
+    @property
+    def qdac(self) -> QDac2:
+        """The underlying synchronous driver"""
+        return self._instrument
+
+    @classmethod
+    async def open(cls, name: str, address: str, **kwargs: Any) -> 'AsyncQDac2':
+        """Connect to a QDAC-II without blocking the event loop
+
+        Args:
+            name (str): Name for instrument
+            address (str): Visa identification string
+            **kwargs: additional argument to the Visa driver
+
+        Returns:
+            AsyncQDac2: front end for the new instrument
+        """
+        loop = asyncio.get_running_loop()
+        qdac = await loop.run_in_executor(
+            None, functools.partial(QDac2, name, address, **kwargs))
+        return cls(qdac)
+
+    async def write_floats(self, cmd: str, values: Sequence[float]) -> None:
+        """Append a list of values to a SCPI command
+
+        Args:
+            cmd (str): SCPI command
+            values (Sequence[float]): Values to send
+        """
+        await self.run(self._instrument.write_floats, cmd, values)
+
+    async def ask_floats(self, cmd: str) -> Sequence[float]:
+        """Send SCPI query to instrument and parse the answer as floats
+
+        Args:
+            cmd (str): SCPI query
+
+        Returns:
+            Sequence[float]: SCPI answer
+        """
+        return await self.run(self._instrument.ask_floats, cmd)
+
+    async def currents_A(self, arrangement: Arrangement_Context, nplc: int = 1,
+                         current_range: str = "low") -> Sequence[float]:
+        """Measure currents on all contacts of an arrangement
+
+        See Arrangement_Context.currents_A().
+
+        Args:
+            arrangement (Arrangement_Context): Arrangement on this instrument
+            nplc (int, optional): Number of powerline cycles to average over
+            current_range (str, optional): Current range (default low)
+
+        Returns:
+            Sequence[float]: Current per contact
+        """
+        return await self.run(arrangement.currents_A, nplc, current_range)
+
+    async def set_virtual_voltages(self, arrangement: Arrangement_Context,
+                                   contacts_to_voltages: Dict[str, float]
+                                   ) -> None:
+        """Set virtual voltages on specific contacts in one go
+
+        See Arrangement_Context.set_virtual_voltages().
+
+        Args:
+            arrangement (Arrangement_Context): Arrangement on this instrument
+            contacts_to_voltages (Dict[str,float]): contact to voltage map
+        """
+        await self.run(arrangement.set_virtual_voltages, contacts_to_voltages)
+
+    async def available_A(self, measurement: Measurement_Context) -> Sequence[float]:
+        """Retrieve current measurements
+
+        See Measurement_Context.available_A().
+
+        Args:
+            measurement (Measurement_Context): Measurement on this instrument
+
+        Returns:
+            Sequence[float]: list of available current measurements
+        """
+        return await self.run(measurement.available_A)
+
+
+class AsyncQSwitch(_Async_Instrument):
+    """Asyncio front end for a QSwitch
+
+    Example:
+
+        switch = QSwitch('switch', visalib='@py', address=...)
+        async_switch = AsyncQSwitch(switch)
+        await async_switch.arrange(breakouts={'DMM': 5}, lines={'gate': 11})
+        await async_switch.connect('gate')
+
+    The QSwitch has no equivalent of the measurement and arrangement calls of
+    AsyncQDac2, so the front end covers relay changes and the relay state.
+    Transactions cannot span awaits; use run() with a function that opens
+    the transaction instead.
+    """
+
+    def __init__(self, qswitch: QSwitch) -> None:
+        super().__init__(qswitch)
+
+    @property
+    def qswitch(self) -> QSwitch:
+        """The underlying synchronous driver"""
+        return self._instrument
+
+    @classmethod
+    async def open(cls, name: str, address: str, **kwargs: Any
+                   ) -> 'AsyncQSwitch':
+        """Connect to a QSwitch without blocking the event loop
+
+        Args:
+            name (str): Name for instrument
+            address (str): Visa identification string
+            **kwargs: additional argument to the Visa driver
+
+        Returns:
+            AsyncQSwitch: front end for the new instrument
+        """
+        loop = asyncio.get_running_loop()
+        qswitch = await loop.run_in_executor(
+            None, functools.partial(QSwitch, name, address, **kwargs))
+        return cls(qswitch)
+
+    async def arrange(self, breakouts: Optional[Dict[str, int]] = None,
+                      lines: Optional[Dict[str, int]] = None) -> None:
+        """An arrangement of names for lines and breakouts
+
+        Args:
+            breakouts (Dict[str, int]): Name/breakout pairs
+            lines (Dict[str, int]): Name/line pairs
+        """
+        await self.run(self._instrument.arrange, breakouts, lines)
+
+    async def ground(self, lines: QSwitch.OneOrMore) -> None:
+        """Ground one or more lines
+
+        Args:
+            lines (str or Sequence[str]): Line names or numbers
+        """
+        await self.run(self._instrument.ground, lines)
+
+    async def connect(self, lines: QSwitch.OneOrMore) -> None:
+        """Connect one or more lines to the BNC inputs
+
+        Args:
+            lines (str or Sequence[str]): Line names or numbers
+        """
+        await self.run(self._instrument.connect, lines)
+
+    async def breakout(self, line: str, tap: str) -> None:
+        """Connect a line to a breakout
+
+        Args:
+            line (str): Line name or number
+            tap (str): Breakout name or number
+        """
+        await self.run(self._instrument.breakout, line, tap)
+
+    async def close_relays(self, relays: State) -> None:
+        """Close relays
+
+        Args:
+            relays (State): Line/tap pairs
+        """
+        await self.run(self._instrument.close_relays, relays)
+
+    async def open_relays(self, relays: State) -> None:
+        """Open relays
+
+        Args:
+            relays (State): Line/tap pairs
+        """
+        await self.run(self._instrument.open_relays, relays)
+
+    async def closed_relays(self) -> State:
+        """Read the closed relays
+
+        Returns:
+            State: Line/tap pairs
+        """
+        return await self.run(self._instrument.closed_relays)
@@ -0,0 +1,204 @@
+import sys
+import time
+import numpy as np
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, TypeVar
+
+# Version 0.1.0
+#
+# Profiling of the communication between the QDevil drivers and the
+# instruments.  Each message that goes over the wire is recorded together
+# with its round-trip latency, its size and the driver operation that caused
+# it, so that the operations dominating a measurement loop can be found
+# without a packet sniffer.
+
+
+T = TypeVar('T')
+
+_driver_package = __name__.rpartition('.')[0]
+
+
+class Scpi_Record(NamedTuple):
+    """A single message sent to an instrument"""
+    timestamp_s: float
+    latency_s: float
+    message: str
+    n_bytes_sent: int
+    n_bytes_received: int
+    operation: str
+
+
+def _n_bytes(answer: Any) -> int:
+    if answer is None:
+        return 0
+    if isinstance(answer, np.ndarray):
+        return answer.nbytes
+    if isinstance(answer, str):
+        return len(answer.encode()) + 1
+    return len(answer)
+
+
+# QCoDeS methods that parameters and functions are used through
+_qcodes_operations = {
+    'set': 'set',
+    'get': 'get',
+    'set_wrapper': 'set',
+    'get_wrapper': 'get',
+    '__call__': None,
+}
+
+
+def _is_private(name: str) -> bool:
+    # Lambdas and comprehensions are named like <lambda>
+    return name.startswith('<') or \
+        (name.startswith('_') and not name.startswith('__'))
+
+
+def _frame_operation(frame: Any) -> Optional[str]:
+    # Name a stack frame if it is something the user could have called
+    module = frame.f_globals.get('__name__', '')
+    name = frame.f_code.co_name
+    instance = frame.f_locals.get('self')
+    if module.startswith(_driver_package):
+        if _is_private(name):
+            return None
+        if instance is None:
+            return name
+        return f'{type(instance).__name__}.{name}'
+    if module.startswith('qcodes.') and name in _qcodes_operations:
+        full_name = getattr(instance, 'full_name', None)
+        if not full_name:
+            return None
+        action = _qcodes_operations[name]
+        if not action:
+            if not hasattr(instance, 'cache'):
+                return full_name
+            # Parameters are set when called with a value
+            action = 'set' if frame.f_locals.get('args') else 'get'
+        return f'{full_name}.{action}'
+    return None
+
+
+def calling_operation(depth: int = 1) -> str:
+    """Find the outermost driver operation on the call stack
+
+    The stack is followed outwards until it leaves the drivers (and QCoDeS,
+    which parameters go through), so that the operation reported is the one
+    called by the user.
+
+    Args:
+        depth (int, optional): Number of innermost frames to skip
+
+    Returns:
+        str: Name of operation, or '?' if none was found
+    """
+    operation = '?'
+    frame: Any = sys._getframe(depth + 1)
+    while frame:
+        module = frame.f_globals.get('__name__', '')
+        if not (module.startswith(_driver_package) or module.startswith('qcodes.')):
+            break
+        operation = _frame_operation(frame) or operation
+        frame = frame.f_back
+    return operation
+
+
+class Scpi_Profile:
+    """Latency and traffic profile of the communication with an instrument
+
+    Example:
+
+        profile = qdac.start_profiling()
+        arrangement.currents_A()
+        qdac.stop_profiling()
+        print(profile.report())
+    """
+
+    def __init__(self) -> None:
+        self._records: List[Scpi_Record] = list()
+
+    def records(self) -> List[Scpi_Record]:
+        """
+        Returns:
+            List[Scpi_Record]: All messages recorded, in the order they were sent
+        """
+        return list(self._records)
+
+    @property
+    def n_messages(self) -> int:
+        """Number of messages recorded"""
+        return len(self._records)
+
+    def clear(self) -> None:
+        """Forget all recorded messages"""
+        self._records = list()
+
+    def measure(self, message: str, call: Callable[[], T],
+                n_bytes_sent: Optional[int] = None) -> T:
+        """Time a single exchange with the instrument
+
+        Args:
+            message (str): The message sent
+            call (Callable): Function doing the actual communication
+            n_bytes_sent (int, optional): Size on the wire, if not the message length
+
+        Returns:
+            The answer from the instrument, if any
+        """
+        operation = calling_operation(2)
+        timestamp_s = time.time()
+        start = time.perf_counter()
+        answer = call()
+        latency_s = time.perf_counter() - start
+        if n_bytes_sent is None:
+            n_bytes_sent = len(message.encode()) + 1
+        self._records.append(Scpi_Record(
+            timestamp_s, latency_s, message, n_bytes_sent, _n_bytes(answer),
+            operation))
+        return answer
+
+    def summary(self) -> Dict[str, Dict[str, float]]:
+        """Statistics per operation
+
+        Returns:
+            Dict[str, Dict[str, float]]: For each operation, the number of
+            messages, bytes sent and received, total latency and the 50%,
+            90% and 99% latency percentiles.
+        """
+        per_operation: Dict[str, List[Scpi_Record]] = dict()
+        for record in self._records:
+            per_operation.setdefault(record.operation, []).append(record)
+        result: Dict[str, Dict[str, float]] = dict()
+        for operation, records in per_operation.items():
+            latencies_s = np.array([record.latency_s for record in records])
+            p50, p90, p99 = np.percentile(latencies_s, [50, 90, 99])
+            result[operation] = {
+                'n_messages': len(records),
+                'n_bytes_sent': sum(r.n_bytes_sent for r in records),
+                'n_bytes_received': sum(r.n_bytes_received for r in records),
+                'total_s': float(np.sum(latencies_s)),
+                'p50_s': float(p50),
+                'p90_s': float(p90),
+                'p99_s': float(p99),
+            }
+        return result
+
+    def report(self) -> str:
+        """Table of statistics per operation, most time consuming first
+
+        Returns:
+            str: Human readable report
+        """
+        summary = self.summary()
+        ordered = sorted(summary.items(), key=lambda item: -item[1]['total_s'])
+        width = max([len('operation')] + [len(name) for name in summary])
+        lines = [
+            f'{"operation":<{width}} {"msgs":>6} {"sent":>8} {"recv":>8} '
+            f'{"total ms":>9} {"p50 ms":>8} {"p90 ms":>8} {"p99 ms":>8}'
+        ]
+        for name, stats in ordered:
+            lines.append(
+                f'{name:<{width}} {stats["n_messages"]:>6} '
+                f'{stats["n_bytes_sent"]:>8} {stats["n_bytes_received"]:>8} '
+                f'{stats["total_s"] * 1e3:>9.3f} {stats["p50_s"] * 1e3:>8.3f} '
+                f'{stats["p90_s"] * 1e3:>8.3f} {stats["p99_s"] * 1e3:>8.3f}')
+        return '\n'.join(lines)
@@ -1,12 +1,15 @@
 import re
 import itertools
-from time import sleep as sleep_s
+import functools
+import threading
+from time import sleep as sleep_s, monotonic as monotonic_s
 from qcodes.instrument.parameter import DelegateParameter
 from qcodes.instrument.visa import VisaInstrument
 from qcodes.utils import validators
 from pyvisa.errors import VisaIOError
+from .QDevil_Profile import Scpi_Profile
 from typing import (
-    Tuple, Sequence, List, Dict, Set, Union, Optional)
+    Any, Callable, Tuple, Sequence, List, Dict, Set, Union, Optional)
 from packaging.version import parse
 
 # Version 0.5.0
@@ -91,6 +94,58 @@ def state_to_compressed_list(state: State) -> str:
     return '(@' + ','.join(intervals) + ')'
 
 
+def _relay_bit(line: int, tap: int) -> int:
+    # Relays are ordered by tap, so that the lines of a tap are contiguous
+    if not 1 <= line <= relay_lines:
+        raise ValueError(f'Expected line between 1 and {relay_lines}, got {line}')
+    if not 0 <= tap <= relays_per_line:
+        raise ValueError(f'Expected tap between 0 and {relays_per_line}, got {tap}')
+    return 1 << (tap * relay_lines + line - 1)
+
+
+def state_to_bitmask(state: State) -> int:
+    mask = 0
+    for line, tap in state:
+        mask |= _relay_bit(line, tap)
+    return mask
+
+
+def bitmask_to_state(mask: int) -> State:
+    result: List[Tuple[int, int]] = []
+    for tap in range(relays_per_line + 1):
+        lines = (mask >> (tap * relay_lines)) & _all_lines
+        for line in range(1, relay_lines + 1):
+            if lines & (1 << (line - 1)):
+                result.append((line, tap))
+    return result
+
+
+def bitmask_to_compressed_list(mask: int) -> str:
+    intervals = []
+    for tap in range(relays_per_line + 1):
+        lines = (mask >> (tap * relay_lines)) & _all_lines
+        line = 1
+        while lines:
+            if not lines & 1:
+                lines >>= 1
+                line += 1
+                continue
+            start_line = line
+            while lines & 1:
+                lines >>= 1
+                line += 1
+            end_line = line - 1
+            if start_line == end_line:
+                intervals.append(f'{start_line}!{tap}')
+            else:
+                intervals.append(f'{start_line}!{tap}:{end_line}!{tap}')
+    return '(@' + ','.join(intervals) + ')'
+
+
+def channel_list_to_bitmask(channel_list: str) -> int:
+    return state_to_bitmask(channel_list_to_state(channel_list))
+
+
 def expand_channel_list(channel_list: str) -> str:
     return state_to_expanded_list(channel_list_to_state(channel_list))
 
@@ -101,12 +156,50 @@ def compress_channel_list(channel_list: str) -> str:
 
 relay_lines = 24
 relays_per_line = 9
+state_cache_policies = ('off', 'trust', 'ttl', 'on_error')
+_all_lines = (1 << relay_lines) - 1
+
+
+def _bitmask_diff(before: int, after: int) -> Tuple[int, int]:
+    # Relays to close and relays to open
+    return after & ~before, before & ~after
 
 
 def _state_diff(before: State, after: State) -> Tuple[State, State, State]:
-    initial = frozenset(before)
-    target = frozenset(after)
-    return list(target - initial), list(initial - target), list(target)
+    initial = state_to_bitmask(before)
+    target = state_to_bitmask(after)
+    positive, negative = _bitmask_diff(initial, target)
+    return (bitmask_to_state(positive), bitmask_to_state(negative),
+            bitmask_to_state(target))
+
+
+class Transaction_Context:
+    """Relay transaction
+
+    While the context is active, relay changes are only recorded.  When the
+    context exits, the net change is sent to the instrument as at most one
+    command closing relays, followed by at most one command opening relays,
+    so that no line is left floating in between.  Nested transactions are
+    absorbed by the outermost one.  If the context exits because of an
+    exception, the changes are discarded.  Other threads wait for the
+    transaction to finish before talking to the instrument.
+    """
+
+    def __init__(self, parent: 'QSwitch'):
+        self._parent = parent
+        self._target: Optional[int] = None
+
+    def __enter__(self):
+        self._parent._begin_transaction(self)
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self._parent._end_transaction(self, commit=exc_type is None)
+        # Propagate exceptions
+        return False
+
+    def close(self) -> None:
+        self.__exit__(None, None, None)
 
 
 class QSwitch(VisaInstrument):
@@ -187,24 +280,63 @@ class QSwitch(VisaInstrument):
         return self.ask('next?')
 
     def state_force_update(self) -> None:
-        self._set_state_raw(self.ask('stat?'))
+        with self._lock:
+            self._set_state_raw(self.ask('stat?'))
+
+    def cache_state(self, policy: str = 'trust', ttl_s: float = 1.0) -> None:
+        """Decide when reading the state should ask the instrument
+
+        The driver keeps track of all relay changes it makes, so the state
+        can be served from memory instead of being read back every time:
+
+        - 'off': Always read the state from the instrument (default)
+        - 'trust': Never read the state, except on state_force_update()
+        - 'ttl': Read the state when it is older than ttl_s, or after an error
+        - 'on_error': Read the state only after an instrument error
+
+        Relay commands written directly with write() bypass the bookkeeping,
+        so call state_force_update() afterwards.
+
+        Args:
+            policy (str, optional): Cache policy (default 'trust')
+            ttl_s (float, optional): Max age of state for 'ttl' (default 1s)
+
+        Raises:
+            ValueError: Unknown policy or negative time-to-live
+        """
+        if policy not in state_cache_policies:
+            raise ValueError(f'Unknown state cache policy "{policy}", use '
+                             f'one of {state_cache_policies}')
+        if ttl_s < 0:
+            raise ValueError(f'Time-to-live must be positive, got {ttl_s}')
+        self._state_cache_policy = policy
+        self._state_ttl_s = ttl_s
 
     # -----------------------------------------------------------------------
     # Direct manipulation of the relays
     # -----------------------------------------------------------------------
 
+    def transaction(self) -> Transaction_Context:
+        """Collect relay changes and send the net change in one go
+
+        Example:
+            with qswitch.transaction():
+                qswitch.ground(['1', '2'])
+                qswitch.connect('3')
+
+        Returns:
+            Transaction_Context: context manager
+        """
+        return Transaction_Context(self)
+
     def close_relays(self, relays: State) -> None:
-        currently = channel_list_to_state(self._state)
-        union = list(itertools.chain(currently, relays))
-        self._effectuate(union)
+        self._effectuate(self._intended_mask() | state_to_bitmask(relays))
 
     def close_relay(self, line: int, tap: int) -> None:
         self.close_relays([(line, tap)])
 
     def open_relays(self, relays: State) -> None:
-        currently = frozenset(channel_list_to_state(self._state))
-        subtraction = frozenset(relays)
-        self._effectuate(list(currently - subtraction))
+        self._effectuate(self._intended_mask() & ~state_to_bitmask(relays))
 
     def open_relay(self, line: int, tap: int) -> None:
         self.open_relays([(line, tap)])
@@ -216,37 +348,40 @@ class QSwitch(VisaInstrument):
     OneOrMore = Union[str, Sequence[str]]
 
     def ground(self, lines: OneOrMore) -> None:
-        connections: List[Tuple[int, int]] = []
-        if isinstance(lines, str):
-            line = self._to_line(lines)
-            self.close_relay(line, 0)
-            taps = range(1, relays_per_line + 1)
-            connections = list(itertools.zip_longest([], taps, fillvalue=line))
-            self.open_relays(connections)
-        else:
-            numbers = map(self._to_line, lines)
-            grounds = list(itertools.zip_longest(numbers, [], fillvalue=0))
-            self.close_relays(grounds)
-            for tap in range(1, relays_per_line + 1):
-                connections += itertools.zip_longest(
-                                    map(self._to_line, lines), [], fillvalue=tap)
-            self.open_relays(connections)
+        with self.transaction():
+            connections: List[Tuple[int, int]] = []
+            if isinstance(lines, str):
+                line = self._to_line(lines)
+                self.close_relay(line, 0)
+                taps = range(1, relays_per_line + 1)
+                connections = list(itertools.zip_longest([], taps, fillvalue=line))
+                self.open_relays(connections)
+            else:
+                numbers = map(self._to_line, lines)
+                grounds = list(itertools.zip_longest(numbers, [], fillvalue=0))
+                self.close_relays(grounds)
+                for tap in range(1, relays_per_line + 1):
+                    connections += itertools.zip_longest(
+                                        map(self._to_line, lines), [], fillvalue=tap)
+                self.open_relays(connections)
 
     def connect(self, lines: OneOrMore) -> None:
-        if isinstance(lines, str):
-            self.close_relay(self._to_line(lines), 9)
-            self.open_relay(self._to_line(lines), 0)
-        else:
-            numbers = map(self._to_line, lines)
-            pairs = list(itertools.zip_longest(numbers, [], fillvalue=9))
-            self.close_relays(pairs)
-            numbers = map(self._to_line, lines)
-            connections = list(itertools.zip_longest(numbers, [], fillvalue=0))
-            self.open_relays(connections)
+        with self.transaction():
+            if isinstance(lines, str):
+                self.close_relay(self._to_line(lines), 9)
+                self.open_relay(self._to_line(lines), 0)
+            else:
+                numbers = map(self._to_line, lines)
+                pairs = list(itertools.zip_longest(numbers, [], fillvalue=9))
+                self.close_relays(pairs)
+                numbers = map(self._to_line, lines)
+                connections = list(itertools.zip_longest(numbers, [], fillvalue=0))
+                self.open_relays(connections)
 
     def breakout(self, line: str, tap: str) -> None:
-        self.close_relay(self._to_line(line), self._to_tap(tap))
-        self.open_relay(self._to_line(line), 0)
+        with self.transaction():
+            self.close_relay(self._to_line(line), self._to_tap(tap))
+            self.open_relay(self._to_line(line), 0)
 
     def arrange(self, breakouts: Optional[Dict[str, int]] = None,
                 lines: Optional[Dict[str, int]] = None) -> None:
@@ -284,6 +419,28 @@ class QSwitch(VisaInstrument):
         self._scpi_sent = list()
         return commands
 
+    def start_profiling(self) -> Scpi_Profile:
+        """Profile all communication with the instrument
+
+        Every message sent is recorded with its latency, size and the driver
+        operation it came from.  Any previous profile is discarded.
+
+        Returns:
+            Scpi_Profile: The profile being recorded
+        """
+        self._profile: Optional[Scpi_Profile] = Scpi_Profile()
+        return self._profile
+
+    def stop_profiling(self) -> Optional[Scpi_Profile]:
+        """Stop profiling the communication with the instrument
+
+        Returns:
+            Optional[Scpi_Profile]: The recorded profile, if any
+        """
+        profile = self._profile
+        self._profile = None
+        return profile
+
     def clear_read_queue(self) -> Sequence[str]:
         """Flush the VISA message queue of the instrument
 
@@ -293,16 +450,17 @@ class QSwitch(VisaInstrument):
             Sequence[str]: Messages lingering in queue
         """
         lingering = list()
-        original_timeout = self.visa_handle.timeout
-        self.visa_handle.timeout = self._message_flush_timeout_ms
-        while True:
-            try:
-                message = self.visa_handle.read()
-            except VisaIOError:
-                break
-            else:
-                lingering.append(message)
-        self.visa_handle.timeout = original_timeout
+        with self._lock:
+            original_timeout = self.visa_handle.timeout
+            self.visa_handle.timeout = self._message_flush_timeout_ms
+            while True:
+                try:
+                    message = self.visa_handle.read()
+                except VisaIOError:
+                    break
+                else:
+                    lingering.append(message)
+            self.visa_handle.timeout = original_timeout
         return lingering
 
     # -----------------------------------------------------------------------
@@ -315,15 +473,18 @@ class QSwitch(VisaInstrument):
         Args:
             cmd (str): SCPI command
         """
-        try:
-            self._write(cmd)
-            self.ask('*opc?')
-            errors = super().ask('all?')
-        except Exception as error:
-            raise ValueError(f'Error: {repr(error)} after executing {cmd}')
-        if errors == '0,"No error"':
-            return
-        raise ValueError(f'Error: {errors} after executing {cmd}')
+        with self._lock:
+            try:
+                self._write(cmd)
+                self.ask('*opc?')
+                errors = self._communicate('all?', functools.partial(super().ask, 'all?'))
+            except Exception as error:
+                self._state_stale = True
+                raise ValueError(f'Error: {repr(error)} after executing {cmd}')
+            if errors == '0,"No error"':
+                return
+            self._state_stale = True
+            raise ValueError(f'Error: {errors} after executing {cmd}')
 
     def ask(self, cmd: str) -> str:
         """Send SCPI query to instrument
@@ -334,17 +495,23 @@ class QSwitch(VisaInstrument):
         Returns:
             str: SCPI answer
         """
-        if self._record_commands:
-            self._scpi_sent.append(cmd)
-        answer = super().ask(cmd)
-        return answer
+        with self._lock:
+            if self._record_commands:
+                self._scpi_sent.append(cmd)
+            return self._communicate(cmd, functools.partial(super().ask, cmd))
 
     # -----------------------------------------------------------------------
 
     def _write(self, cmd: str) -> None:
-        if self._record_commands:
-            self._scpi_sent.append(cmd)
-        super().write(cmd)
+        with self._lock:
+            if self._record_commands:
+                self._scpi_sent.append(cmd)
+            self._communicate(cmd, functools.partial(super().write, cmd))
+
+    def _communicate(self, message: str, call: Callable[[], Any]) -> Any:
+        if not self._profile:
+            return call()
+        return self._profile.measure(message, call)
 
     def _channel_list_to_overview(self, channel_list: str) -> dict[str, List[str]]:
         state = channel_list_to_state(channel_list)
@@ -382,29 +549,87 @@ class QSwitch(VisaInstrument):
             raise ValueError(f'Unknown tap "{name}"')
 
     def _get_state(self) -> str:
-        self.state_force_update()
+        if self._state_needs_refresh():
+            self.state_force_update()
+        return self._state_channel_list()
+
+    def _state_needs_refresh(self) -> bool:
+        policy = self._state_cache_policy
+        if policy == 'off':
+            return True
+        if policy == 'trust':
+            return False
+        if self._state_stale:
+            return True
+        if policy == 'ttl':
+            return monotonic_s() - self._state_read_s > self._state_ttl_s
+        return False
+
+    def _state_channel_list(self) -> str:
+        # The channel list is only regenerated when the state has changed
+        if self._state is None:
+            self._state: Optional[str] = bitmask_to_compressed_list(
+                self._state_mask)
         return self._state
 
     def _set_state_raw(self, channel_list: str) -> None:
+        self._state_mask = channel_list_to_bitmask(channel_list)
         self._state = channel_list
+        self._state_read_s = monotonic_s()
+        self._state_stale = False
 
     def _set_state(self, channel_list: str) -> None:
-        self._effectuate(channel_list_to_state(channel_list))
-
-    def _effectuate(self, state: State) -> None:
-        currently = channel_list_to_state(self._state)
-        positive, negative, total = _state_diff(currently, state)
-        if positive:
-            self.write(f'clos {state_to_compressed_list(positive)}')
-        if negative:
-            self.write(f'open {state_to_compressed_list(negative)}')
-        self._set_state_raw(state_to_compressed_list(total))
+        self._effectuate(channel_list_to_bitmask(channel_list))
+
+    def _intended_mask(self) -> int:
+        # The state including changes of a pending transaction
+        if self._transaction and self._transaction._target is not None:
+            return self._transaction._target
+        return self._state_mask
+
+    def _begin_transaction(self, transaction: Transaction_Context) -> None:
+        # Held until the transaction ends, so that only the thread that
+        # opened the transaction contributes to it
+        self._lock.acquire()
+        if not self._transaction:
+            self._transaction: Optional[Transaction_Context] = transaction
+
+    def _end_transaction(self, transaction: Transaction_Context,
+                         commit: bool) -> None:
+        try:
+            if self._transaction is not transaction:
+                return
+            self._transaction = None
+            if commit and transaction._target is not None:
+                self._effectuate(transaction._target)
+        finally:
+            self._lock.release()
+
+    def _effectuate(self, target: int) -> None:
+        with self._lock:
+            if self._transaction:
+                self._transaction._target = target
+                return
+            positive, negative = _bitmask_diff(self._state_mask, target)
+            if positive:
+                self.write(f'clos {bitmask_to_compressed_list(positive)}')
+            if negative:
+                self.write(f'open {bitmask_to_compressed_list(negative)}')
+            if positive or negative:
+                self._state_mask = target
+                self._state = None
 
     def _set_up_debug_settings(self) -> None:
+        self._lock = threading.RLock()
         self._record_commands = False
         self._scpi_sent = list()
         self._message_flush_timeout_ms = 1
         self._round_off = None
+        self._profile = None
+        self._state_cache_policy = 'off'
+        self._transaction = None
+        self._state_ttl_s = 1.0
+        self._state_stale = True
 
     def _set_up_serial(self) -> None:
         # No harm in setting the speed even if the connection is not serial.
@@ -0,0 +1,189 @@
+'''
+Test digitizer streaming:
+* block delivery by iterator and callback
+* dropped block accounting
+* multiple DAQs started together
+* consumption during acquisition
+* error handling
+'''
+from qcodes_contrib_drivers.drivers.Keysight.SD_common.daq_stream import DaqStream
+
+import threading
+import time
+import unittest
+
+import numpy as np
+
+
+class FakeDigitizer:
+    '''
+    Returns a ramp per DAQ in chunks of `chunk` samples.
+    Acquisition stops after `n_samples` samples. Then a read waits a
+    little and returns no data, like a read timeout.
+    '''
+
+    def __init__(self, chunk, n_samples, fail_on_start=False):
+        self.chunk = chunk
+        self.n_samples = n_samples
+        self.fail_on_start = fail_on_start
+        self.position = {}
+        self.calls = []
+        self.exhausted = threading.Event()
+
+    def daq_buffer_pool_config(self, daq, n_points, timeout):
+        self.calls.append(('config', daq, n_points))
+        self.position[daq] = 0
+
+    def daq_buffer_pool_release(self, daq):
+        self.calls.append(('release', daq))
+
+    def daq_start_multiple(self, mask):
+        if self.fail_on_start:
+            raise Exception('start failed')
+        self.calls.append(('start', mask))
+
+    def daq_stop_multiple(self, mask):
+        self.calls.append(('stop', mask))
+
+    def daq_buffer_get(self, daq):
+        start = self.position[daq]
+        stop = min(start + self.chunk, self.n_samples)
+        if start == stop:
+            self.exhausted.set()
+            time.sleep(0.001)
+            return np.zeros(0, np.int16)
+        self.position[daq] = stop
+        return (np.arange(start, stop) + 1000 * daq).astype(np.int16)
+
+
+class TestDaqStream(unittest.TestCase):
+
+    def test_iterate_blocks(self):
+        digitizer = FakeDigitizer(chunk=30, n_samples=400)
+        stream = DaqStream(digitizer, [0, 2], block_size=100, n_blocks=8)
+        stream.start()
+        self.assertTrue(digitizer.exhausted.wait(5))
+        stream.stop()
+
+        blocks = [(block.daq, block.number, block.data.copy()) for block in stream]
+
+        self.assertEqual([(daq, number) for daq, number, _ in blocks if daq == 2],
+                         [(2, 0), (2, 1), (2, 2), (2, 3)])
+        daq, number, data = blocks[-1]
+        np.testing.assert_array_equal(data, np.arange(300, 400) + 1000 * daq)
+        self.assertIn(('start', 0b101), digitizer.calls)
+        self.assertIn(('stop', 0b101), digitizer.calls)
+        self.assertIn(('release', 2), digitizer.calls)
+        self.assertEqual(stream.stats()[0], {'n_blocks': 4, 'n_dropped': 0, 'n_samples': 400})
+
+
+    def test_dropped_blocks(self):
+        digitizer = FakeDigitizer(chunk=100, n_samples=1000)
+        stream = DaqStream(digitizer, [0], block_size=100, n_blocks=2)
+        stream.start()
+        self.assertTrue(digitizer.exhausted.wait(5))
+        stream.stop()
+
+        numbers = [block.number for block in stream]
+
+        self.assertEqual(numbers, [0, 1])
+        self.assertEqual(stream.stats()[0], {'n_blocks': 2, 'n_dropped': 8, 'n_samples': 1000})
+
+
+    def test_callback(self):
+        digitizer = FakeDigitizer(chunk=50, n_samples=500)
+        received = []
+        stream = DaqStream(digitizer, [1], block_size=100, n_blocks=2,
+                           callback=lambda block: received.append(block.data.sum()))
+        stream.start()
+        self.assertTrue(digitizer.exhausted.wait(5))
+        stream.stop()
+
+        stats = stream.stats()[1]
+        self.assertEqual(len(received), stats['n_blocks'])
+        self.assertEqual(stats['n_blocks'] + stats['n_dropped'], 5)
+
+
+    def test_invalid_arguments(self):
+        digitizer = FakeDigitizer(chunk=1, n_samples=1)
+        with self.assertRaises(Exception):
+            DaqStream(digitizer, [], block_size=100)
+        with self.assertRaises(Exception):
+            DaqStream(digitizer, [0], block_size=100, n_blocks=1)
+
+
+    def test_iterate_during_acquisition(self):
+        digitizer = FakeDigitizer(chunk=100, n_samples=10_000_000)
+        stream = DaqStream(digitizer, [0], block_size=1000, n_blocks=4)
+        stream.start()
+
+        numbers = []
+        for block in stream:
+            # the int16 ramp wraps around
+            start = block.number * 1000
+            expected = np.arange(start, start + 1000).astype(np.int16)
+            np.testing.assert_array_equal(block.data, expected)
+            numbers.append(block.number)
+            if len(numbers) == 5:
+                stream.stop()
+
+        self.assertFalse(stream.running)
+        self.assertFalse(digitizer.exhausted.is_set())
+        self.assertGreaterEqual(len(numbers), 5)
+        self.assertEqual(numbers, sorted(numbers))
+        stats = stream.stats()[0]
+        self.assertEqual(stats['n_blocks'], len(numbers))
+        self.assertEqual(stats['n_blocks'] + stats['n_dropped'], stats['n_samples'] // 1000)
+
+
+    def test_stop_raises_acquisition_error(self):
+        digitizer = FakeDigitizer(chunk=100, n_samples=1000)
+        digitizer.daq_buffer_get = lambda daq: 1 / 0
+        stream = DaqStream(digitizer, [0], block_size=100)
+        stream.start()
+
+        with self.assertRaises(ZeroDivisionError):
+            list(stream)
+        with self.assertRaises(ZeroDivisionError):
+            stream.stop()
+        self.assertIn(('release', 0), digitizer.calls)
+
+
+    def test_stop_twice(self):
+        digitizer = FakeDigitizer(chunk=100, n_samples=1000)
+        digitizer.daq_buffer_get = lambda daq: 1 / 0
+        stream = DaqStream(digitizer, [0], block_size=100)
+        stream.start()
+
+        with self.assertRaises(ZeroDivisionError):
+            stream.stop()
+        stream.stop()
+
+        self.assertEqual(digitizer.calls.count(('stop', 0b1)), 1)
+        self.assertEqual(digitizer.calls.count(('release', 0)), 1)
+
+
+    def test_context_of_started_stream(self):
+        digitizer = FakeDigitizer(chunk=100, n_samples=1000)
+        stream = DaqStream(digitizer, [0], block_size=100, n_blocks=10)
+        stream.start()
+
+        with stream as s:
+            self.assertTrue(digitizer.exhausted.wait(5))
+        numbers = [block.number for block in s]
+
+        self.assertEqual(numbers, list(range(10)))
+        self.assertFalse(stream.running)
+        self.assertEqual(digitizer.calls.count(('start', 0b1)), 1)
+
+
+    def test_start_failure_releases_buffers(self):
+        digitizer = FakeDigitizer(chunk=100, n_samples=1000, fail_on_start=True)
+        stream = DaqStream(digitizer, [0, 1], block_size=100)
+
+        with self.assertRaises(Exception):
+            stream.start()
+
+        self.assertEqual(digitizer.calls, [('config', 0, 100), ('config', 1, 100),
+                                           ('release', 0), ('release', 1)])
+        self.assertFalse(stream.running)
@@ -2,6 +2,7 @@
 Test AWG memory manager:
 * default initialization
 * allocate / release
+* fallback to larger slots and statistics
 '''
 from qcodes_contrib_drivers.drivers.Keysight.SD_common.memory_manager import MemoryManager
 
@@ -94,3 +95,72 @@ class TestMemoryManager(unittest.TestCase):
         mm.set_waveform_limit(VERY_LARGE_SIZE)
         new_slots = mm.get_uninitialized_slots()
         self.assertEqual(len(new_slots), N_VERY_LARGE)
+
+
+    def test_fallback_to_larger_slot(self):
+        mm = MemoryManager(logging, LARGE_SIZE,
+                           memory_sizes=[(10_000, 1), (100_000, 1), (1_000_000, 1)])
+
+        small = mm.allocate(SMALL_SIZE)
+        fallback = mm.allocate(SMALL_SIZE)
+
+        stats = mm.memory_stats()
+        self.assertEqual(stats['n_fallbacks'], 1)
+        self.assertEqual(stats['allocated_samples'], 110_000)
+        self.assertEqual(stats['requested_samples'], 2 * SMALL_SIZE)
+
+        small.release()
+        fallback.release()
+        self.assertEqual(mm.memory_stats()['allocated_samples'], 0)
+
+
+    def test_failures_are_counted(self):
+        mm = MemoryManager(logging, SMALL_SIZE, memory_sizes=[(10_000, 1)])
+        slot = mm.allocate(SMALL_SIZE)
+
+        with self.assertRaises(Exception):
+            mm.allocate(SMALL_SIZE)
+
+        self.assertEqual(mm.memory_stats()['n_failures'], 1)
+        slot.release()
+
+
+    def test_invalid_memory_sizes(self):
+        with self.assertRaises(Exception):
+            MemoryManager(logging, memory_sizes=[(1_000, 10)])
+
+        with self.assertRaises(Exception):
+            MemoryManager(logging, memory_sizes=[(10_000, 1), (10_000, 2)])
+
+
+    def test_suggest_memory_sizes(self):
+        mm = MemoryManager(logging, LARGE_SIZE,
+                           memory_sizes=[(10_000, 10), (100_000, 10), (1_000_000, 10)])
+        slots = [mm.allocate(MEDIUM_SIZE) for i in range(8)]
+        slots += [mm.allocate(SMALL_SIZE) for i in range(2)]
+        for slot in slots:
+            slot.release()
+
+        suggestion = mm.suggest_memory_sizes(headroom=1.5)
+
+        self.assertEqual(suggestion, [(10_000, 3), (100_000, 12), (1_000_000, 9)])
+        MemoryManager(logging, LARGE_SIZE, memory_sizes=suggestion)
+
+
+    def test_suggest_memory_sizes_within_budget(self):
+        memory_sizes = [(10_000, 10), (100_000, 2)]
+        mm = MemoryManager(logging, MEDIUM_SIZE, memory_sizes=memory_sizes)
+        slots = [mm.allocate(MEDIUM_SIZE) for i in range(2)]
+        for slot in slots:
+            slot.release()
+        # 2 small waveforms fall back to the medium slots
+        slots = [mm.allocate(SMALL_SIZE) for i in range(12)]
+        for slot in slots:
+            slot.release()
+
+        with self.assertLogs(level='WARNING'):
+            suggestion = mm.suggest_memory_sizes(headroom=1.5)
+
+        self.assertEqual(suggestion, [(10_000, 18), (100_000, 1)])
+        self.assertLessEqual(sum(size * amount for size, amount in suggestion),
+                             sum(size * amount for size, amount in memory_sizes))
@@ -0,0 +1,179 @@
+'''
+Test SD_AWG_Async with a mock AWG module:
+* waveform cache: sharing, reference counting, disabling
+* int16 uploads: dtype checks, SD1 calls
+'''
+from qcodes_contrib_drivers.drivers.Keysight.SD_common.upload_scheduler import UploadScheduler
+
+import sys
+import unittest
+from typing import Any, Dict
+from unittest.mock import MagicMock, patch
+
+import numpy as np
+
+try:
+    import keysightSD1
+except ImportError:
+    # All SD1 calls are mocked, so a mock module will do. It is only
+    # installed while the driver is imported.
+    keysightSD1 = MagicMock()
+
+with patch.dict(sys.modules, {'keysightSD1': keysightSD1}):
+    from qcodes_contrib_drivers.drivers.Keysight.SD_common.SD_AWG_Async import SD_AWG_Async
+
+SLOT_SIZE = 10_000
+N_SLOTS = 4
+
+
+class AwgTestCase(unittest.TestCase):
+    '''
+    Creates an SD_AWG_Async on a mock AWG module.
+    The SD1 objects and calls are mocks, the memory manager and scheduler are real.
+    '''
+    awg_kwargs: Dict[str, Any] = {}
+
+    def setUp(self):
+        self.module = MagicMock()
+        self.module.getProductNameBySlot.return_value = 'M3202A'
+        self.module.openWithSlot.return_value = 0
+        self.module.getChassis.return_value = 1
+        self.module.getSlot.return_value = 2
+        self.module.waveformLoad.return_value = 0
+        self.module.waveformReLoad.return_value = 0
+        self.module.waveformReLoadArrayInt16.return_value = 0
+        self.module.waveformFlush.return_value = 0
+        for patcher in [patch.object(keysightSD1, 'SD_AOU', return_value=self.module),
+                        patch.object(keysightSD1, 'SD_Wave')]:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+        self.awg = SD_AWG_Async('awg', 1, 2, channels=4, triggers=8,
+                                waveform_size_limit=SLOT_SIZE,
+                                memory_sizes=[(SLOT_SIZE, N_SLOTS)],
+                                upload_scheduler=UploadScheduler(n_workers=1),
+                                **self.awg_kwargs)
+        self.addCleanup(self.awg.close)
+        self.awg.uploader_ready()
+
+    def allocated_slots(self):
+        return self.awg._memory_manager.mem_usage()[str(SLOT_SIZE)][1]
+
+
+class TestWaveformCache(AwgTestCase):
+    awg_kwargs: Dict[str, Any] = {'waveform_cache': True}
+
+    def test_identical_wave_shares_slot(self):
+        wave = np.linspace(-0.5, 0.5, 2000)
+
+        ref1 = self.awg.upload_waveform(wave)
+        ref2 = self.awg.upload_waveform(wave.copy())
+        ref2.wait_uploaded()
+
+        self.assertIs(ref1, ref2)
+        self.assertEqual(self.awg.waveform_cache_size(), 1)
+        self.assertEqual(self.allocated_slots(), 1)
+        self.assertEqual(self.module.waveformReLoad.call_count, 1)
+        ref1.release()
+        ref2.release()
+
+
+    def test_slot_released_by_last_holder(self):
+        wave = np.linspace(-0.5, 0.5, 2000)
+        ref1 = self.awg.upload_waveform(wave)
+        ref2 = self.awg.upload_waveform(wave)
+        ref1.wait_uploaded()
+
+        ref1.release()
+        self.assertEqual(self.allocated_slots(), 1)
+        self.assertEqual(self.awg.waveform_cache_size(), 1)
+
+        ref2.release()
+        self.assertEqual(self.allocated_slots(), 0)
+        self.assertEqual(self.awg.waveform_cache_size(), 0)
+        with self.assertRaises(Exception):
+            ref2.release()
+
+
+    def test_slot_released_when_dequeued(self):
+        wave = np.linspace(-0.5, 0.5, 2000)
+        ref = self.awg.upload_waveform(wave)
+        self.awg.awg_queue_waveform(1, ref, 0, 0, 1, 0)
+
+        ref.release()
+        self.assertEqual(self.allocated_slots(), 1)
+        self.awg.awg_flush(1)
+        self.assertEqual(self.allocated_slots(), 0)
+
+
+    def test_disable_cache_with_live_entries(self):
+        wave = np.linspace(-0.5, 0.5, 2000)
+        ref1 = self.awg.upload_waveform(wave)
+
+        self.awg.set_waveform_cache(False)
+        ref2 = self.awg.upload_waveform(wave)
+        self.awg.set_waveform_cache(True)
+        ref3 = self.awg.upload_waveform(wave)
+        ref3.wait_uploaded()
+
+        self.assertIsNot(ref1, ref2)
+        self.assertIsNot(ref1, ref3)
+        self.assertEqual(len({ref1.wave_number, ref2.wave_number, ref3.wave_number}), 3)
+        self.assertTrue(ref1.is_uploaded())
+        ref1.release()
+        ref2.release()
+        self.assertEqual(self.allocated_slots(), 1)
+        self.assertIs(self.awg.upload_waveform(wave), ref3)
+        ref3.release()
+        ref3.release()
+        self.assertEqual(self.allocated_slots(), 0)
+
+
+    def test_same_bytes_different_type_or_length(self):
+        # 2000 float64 zeros have the same bytes as 4000 int16 zeros
+        float_wave = np.zeros(2000)
+        int16_wave = np.zeros(4000, np.int16)
+        longer_wave = np.zeros(2400)
+
+        refs = [self.awg.upload_waveform(float_wave),
+                self.awg.upload_waveform_int16(int16_wave),
+                self.awg.upload_waveform(longer_wave)]
+        refs[-1].wait_uploaded()
+
+        self.assertEqual(len({ref.wave_number for ref in refs}), 3)
+        self.assertEqual(self.awg.waveform_cache_size(), 3)
+        for ref in refs:
+            ref.release()
+
+
+class TestInt16Upload(AwgTestCase):
+
+    def test_upload_int16_requires_int16_array(self):
+        with self.assertRaises(Exception):
+            self.awg.upload_waveform_int16(np.zeros(2000))
+        with self.assertRaises(Exception):
+            self.awg.upload_waveform_int16([0] * 2000)
+
+
+    def test_upload_int16(self):
+        wave = np.arange(2000, dtype=np.int16)
+
+        ref = self.awg.upload_waveform_int16(wave)
+        ref.wait_uploaded()
+
+        self.module.waveformReLoadArrayInt16.assert_called_once_with(
+                keysightSD1.SD_WaveformTypes.WAVE_ANALOG, list(range(2000)), ref.wave_number, 0)
+        ref.release()
+
+
+class TestFloatUpload(AwgTestCase):
+
+    def test_upload_float_with_sd_wave(self):
+        wave = np.full(2000, 0.5)
+
+        ref = self.awg.upload_waveform(wave)
+        ref.wait_uploaded()
+
+        self.assertEqual(self.module.waveformReLoad.call_count, 1)
+        self.module.waveformReLoadArrayInt16.assert_not_called()
+        ref.release()
@@ -0,0 +1,101 @@
+'''
+Test AWG upload scheduler:
+* execution order per module with priorities and barriers
+* concurrency between modules
+* statistics
+'''
+from qcodes_contrib_drivers.drivers.Keysight.SD_common.upload_scheduler import UploadScheduler
+
+import threading
+import unittest
+
+
+class FakeTask:
+
+    def __init__(self, name, log, priority=None, n_samples=0, block=None):
+        self.name = name
+        self.priority = priority
+        self.n_samples = n_samples
+        self._log = log
+        self._block = block
+        self.done = threading.Event()
+
+    def run(self):
+        if self._block:
+            self._block.wait(5)
+        self._log.append(self.name)
+        self.done.set()
+
+
+class TestUploadScheduler(unittest.TestCase):
+
+    def test_priorities_and_barriers(self):
+        scheduler = UploadScheduler(n_workers=1)
+        scheduler.register('awg1')
+        log = []
+        gate = threading.Event()
+
+        scheduler.submit('awg1', FakeTask('blocker', log, block=gate))
+        scheduler.submit('awg1', FakeTask('prefetch', log, UploadScheduler.PREFETCH))
+        needed = FakeTask('needed', log, UploadScheduler.PREFETCH)
+        scheduler.submit('awg1', needed)
+        scheduler.submit('awg1', FakeTask('normal', log, UploadScheduler.NORMAL))
+        scheduler.submit('awg1', FakeTask('barrier', log))
+        scheduler.submit('awg1', FakeTask('after', log, UploadScheduler.URGENT))
+        scheduler.promote(needed)
+        gate.set()
+
+        self.assertTrue(scheduler.unregister('awg1', 5))
+        self.assertEqual(log, ['blocker', 'needed', 'normal', 'prefetch',
+                               'barrier', 'after'])
+
+
+    def test_modules_run_concurrently(self):
+        scheduler = UploadScheduler(n_workers=2)
+        scheduler.register('awg1')
+        scheduler.register('awg2')
+        log = []
+        gate = threading.Event()
+
+        scheduler.submit('awg1', FakeTask('slow', log, UploadScheduler.NORMAL, block=gate))
+        fast = FakeTask('fast', log, UploadScheduler.NORMAL)
+        scheduler.submit('awg2', fast)
+
+        self.assertTrue(fast.done.wait(5))
+        gate.set()
+        self.assertTrue(scheduler.unregister('awg1', 5))
+        self.assertTrue(scheduler.unregister('awg2', 5))
+        self.assertEqual(log, ['fast', 'slow'])
+
+
+    def test_stats(self):
+        scheduler = UploadScheduler(n_workers=1)
+        scheduler.register('awg1')
+        scheduler.register('awg2')
+        log = []
+        gate = threading.Event()
+
+        scheduler.submit('awg2', FakeTask('blocker', log, block=gate))
+        for i in range(4):
+            scheduler.submit('awg1', FakeTask(f'wave{i}', log, UploadScheduler.NORMAL, 10_000))
+        gate.set()
+        self.assertTrue(scheduler.wait_idle('awg1', 5))
+        self.assertTrue(scheduler.unregister('awg2', 5))
+
+        stats = scheduler.stats()['awg1']
+        self.assertEqual(stats['n_tasks'], 4)
+        self.assertEqual(stats['n_samples'], 40_000)
+        self.assertEqual(stats['queue_depth'], 0)
+        self.assertGreaterEqual(stats['peak_queue_depth'], 3)
+        scheduler.unregister('awg1', 5)
+
+
+    def test_shared_per_chassis(self):
+        self.assertIs(UploadScheduler.for_chassis(7), UploadScheduler.for_chassis(7))
+        self.assertIsNot(UploadScheduler.for_chassis(7), UploadScheduler.for_chassis(8))
+
+
+    def test_default_n_workers(self):
+        self.assertEqual(UploadScheduler().n_workers, UploadScheduler.default_n_workers)
+        self.assertEqual(UploadScheduler.for_chassis(9).n_workers,
+                         UploadScheduler.default_n_workers)
@@ -0,0 +1,32 @@
+"""Measure how long it takes to connect to a simulated QDAC-II
+
+Run from the repository root:
+
+    $ python -m qcodes_contrib_drivers.tests.QDevil.benchmark_qdac2_startup
+"""
+import statistics
+import time
+from qcodes_contrib_drivers.drivers.QDevil.QDAC2 import QDac2
+from .sim_qdac2_fixtures import visalib
+
+
+def startup_s(lazy: bool, index: int) -> float:
+    name = f'benchmark_{"lazy" if lazy else "eager"}_{index}'
+    begin = time.perf_counter()
+    qdac = QDac2(name, address='GPIB::1::INSTR', visalib=visalib, lazy=lazy)
+    duration = time.perf_counter() - begin
+    qdac.close()
+    return duration
+
+
+def main(repetitions: int = 20) -> None:
+    for lazy in (False, True):
+        durations = [startup_s(lazy, i) for i in range(repetitions)]
+        kind = 'lazy' if lazy else 'eager'
+        print(f'{kind:>5}: median {statistics.median(durations) * 1000:.1f}ms,'
+              f' min {min(durations) * 1000:.1f}ms'
+              f' ({repetitions} connections)')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,103 @@
+import pytest
+import re
+import uuid
+from collections import deque
+from typing import Deque, Dict, List
+import pyvisa
+import pyvisa.constants
+from qcodes.instrument import VisaInstrument
+from qcodes_contrib_drivers.drivers.QDevil import QDAC1
+
+
+class FakeSerialHandle:
+    """
+    Stands in for the serial VISA resource of a 24 channel QDAC.
+
+    Every line written is recorded in `lines`.  Each `;`-separated command
+    in a line queues its response(s), which are served by `read()`.  A read
+    from an empty queue times out like the real thing.
+    """
+
+    def __init__(self) -> None:
+        self.lines: List[str] = []
+        self.responses: Deque[str] = deque()
+        self.voltages: Dict[int, float] = {ch: 0.0 for ch in range(1, 25)}
+        self.errors: Dict[str, str] = {}
+        self.timeout = 2000
+        self.baud_rate = 9600
+        self.parity = pyvisa.constants.Parity(0)
+        self.data_bits = 8
+        self.write_termination = '\n'
+        self.read_termination = '\n'
+
+    def write(self, line: str) -> None:
+        self.lines.append(line)
+        for cmd in line.split(';'):
+            self._respond(cmd)
+
+    def read(self) -> str:
+        if not self.responses:
+            raise pyvisa.VisaIOError(pyvisa.constants.StatusCode.error_timeout)
+        return self.responses.popleft()
+
+    def query(self, cmd: str) -> str:
+        self.write(cmd)
+        return self.read()
+
+    def clear(self) -> None:
+        self.responses.clear()
+
+    def flush(self, mask: int) -> None:
+        self.responses.clear()
+
+    def close(self) -> None:
+        pass
+
+    def _respond(self, cmd: str) -> None:
+        if cmd in self.errors:
+            self.responses.append(self.errors[cmd])
+            return
+        words = cmd.split()
+        if cmd == 'version':
+            self.responses.append('Software Version: 1.07')
+        elif cmd == 'boardNum':
+            self.responses.append('numberOfBoards:3')
+        elif cmd == 'status':
+            self.responses.append('Software Version: 1.07')
+            self.responses.append('Channel\tOut V\t\tVoltage range\tCurrent range')
+            self.responses.append('')
+            for ch, v in self.voltages.items():
+                self.responses.append(f'{ch}\t{v:.6f}\t\tX 1\t\thi cur')
+        elif words[0] == 'rang':
+            limit = 10.0 if words[2] == '0' else 1.1
+            self.responses.append(f'MIN: {-limit} MAX: {limit}')
+        elif words[0] == 'wav' and len(words) == 2:
+            self.responses.append('0,0,0')
+        elif words[0] == 'set' and len(words) == 2:
+            self.responses.append(f'{self.voltages[int(words[1])]:.6f}')
+        elif words[0] == 'set' and len(words) == 3:
+            self.voltages[int(words[1])] = float(words[2])
+            self.responses.append('')
+        elif words[0] == 'get':
+            self.responses.append('0.5')
+        elif re.fullmatch(r'(ver|wav|fun|syn|cal|trig) .*', cmd):
+            self.responses.append('')
+        else:
+            self.responses.append('Error: Unrecognized command')
+
+
+@pytest.fixture(scope='function')
+def qdac1(mocker):
+    handle = FakeSerialHandle()
+    mocker.patch.object(QDAC1, 'SerialInstrument', FakeSerialHandle)
+    mocker.patch.object(VisaInstrument, '_connect_and_handle_error',
+                        return_value=(handle, 'fake', None))
+    name = ('qdac' + str(uuid.uuid4())).replace('-', '')
+    qdac = QDAC1.QDac(name, address='ASRL1::INSTR')
+    handle.lines.clear()
+    yield qdac
+    if QDAC1.QDac.exist(name):
+        qdac.close()
+    if handle.responses:
+        raise ValueError(f'Lingering messages in visa queue: '
+                         f'{list(handle.responses)}')
@@ -51,7 +51,7 @@ class DUT2:
         DUT2._instance = self
         name = ('dac' + str(uuid.uuid4())).replace('-', '')
         try:
-            self.dac = QDAC2.QDac2(name, address='GPIB::1::INSTR', visalib=visalib)
+            self.dac = QDAC2.QDac2(name, address='GPIB::4::INSTR', visalib=visalib)
         except Exception as error:
             # Circumvent Instrument not handling exceptions in constructor.
             Instrument._all_instruments.pop(name)
@@ -64,6 +64,34 @@ class DUT2:
         self.dac.close()
 
 
+class JoinedDUT:
+    """Simulated instruments that match joined SCPI commands as a whole"""
+    _instances: dict = dict()
+
+    @staticmethod
+    def instance(address):
+        if address not in JoinedDUT._instances:
+            name = ('dac' + str(uuid.uuid4())).replace('-', '')
+            try:
+                dac = QDAC2.QDac2(name, address=address, visalib=visalib)
+            except Exception as error:
+                # Circumvent Instrument not handling exceptions in constructor.
+                Instrument._all_instruments.pop(name)
+                print(f'CAUGHT: {error}')
+                raise
+            dac._no_binary_values = True
+            JoinedDUT._instances[address] = dac
+        return JoinedDUT._instances[address]
+
+
+def _checked(dac):
+    dac.start_recording_scpi()
+    yield dac
+    lingering = dac.clear_read_queue()
+    if lingering:
+        raise ValueError(f'Lingering messages in visa queue: {lingering}')
+
+
 @pytest.fixture(scope='function')
 def qdac():
     dac = DUT.instance().dac
@@ -82,3 +110,13 @@ def qdac2():
     lingering = dac.clear_read_queue()
     if lingering:
         raise ValueError(f'Lingering messages in visa queue: {lingering}')
+
+
+@pytest.fixture(scope='function')
+def qdac_joined():
+    yield from _checked(JoinedDUT.instance('GPIB::5::INSTR'))
+
+
+@pytest.fixture(scope='function')
+def qdac2_joined():
+    yield from _checked(JoinedDUT.instance('GPIB::6::INSTR'))
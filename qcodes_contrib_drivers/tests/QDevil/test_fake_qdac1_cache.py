@@ -0,0 +1,118 @@
+import pytest
+import threading
+import time
+from qcodes_contrib_drivers.drivers.QDevil.QDAC1 import Mode, QDac
+from .fake_qdac1_fixtures import qdac1  # noqa
+
+
+def wait_for_refresh(qdac, chan):
+    deadline = time.time() + 5
+    while qdac.cache_age_s(chan) > 0.5 and time.time() < deadline:
+        time.sleep(0.01)
+    with qdac._lock:
+        qdac.visa_handle.lines.clear()
+
+
+def test_refresh_cache_of_all_channels(qdac1):  # noqa
+    qdac1.visa_handle.voltages[7] = 0.7
+    # -----------------------------------------------------------------------
+    qdac1.refresh_cache()
+    # -----------------------------------------------------------------------
+    assert qdac1.visa_handle.lines == ['status']
+    assert qdac1.ch07.v.cache() == 0.7
+    assert qdac1.ch07.mode.cache() == Mode.vhigh_ihigh
+    assert qdac1.cache_age_s(7) < 1
+
+
+def test_refresh_cache_of_some_channels(qdac1):  # noqa
+    qdac1.visa_handle.voltages[2] = 0.2
+    qdac1.visa_handle.voltages[3] = 0.3
+    qdac1.ch02.mode.cache.set(Mode.vlow_ilow)
+    # -----------------------------------------------------------------------
+    qdac1.refresh_cache(channels=[2, 3], update_currents=True)
+    # -----------------------------------------------------------------------
+    assert qdac1.visa_handle.lines == ['set 2;set 3', 'get 2;get 3']
+    assert qdac1.ch02.v.cache() == 0.2
+    assert qdac1.ch03.v.cache() == 0.3
+    assert qdac1.ch03.i.cache() == pytest.approx(0.5e-6)
+    # Modes are only read with the full status
+    assert qdac1.ch02.mode.cache() == Mode.vlow_ilow
+
+
+def test_refresh_cache_rejects_unknown_channel(qdac1):  # noqa
+    with pytest.raises(ValueError):
+        qdac1.refresh_cache(channels=[25])
+
+
+def test_background_refresh_serves_cached_voltage(qdac1):  # noqa
+    qdac1.start_background_refresh(interval_s=100, channels=[1])
+    wait_for_refresh(qdac1, 1)
+    qdac1.visa_handle.voltages[1] = 0.1
+    # -----------------------------------------------------------------------
+    voltage = qdac1.ch01.v()
+    # -----------------------------------------------------------------------
+    assert voltage == 0
+    assert qdac1.visa_handle.lines == []
+    qdac1.stop_background_refresh()
+
+
+def test_background_refresh_reads_ramping_channel_live(qdac1):  # noqa
+    qdac1.start_background_refresh(interval_s=100, channels=[1])
+    wait_for_refresh(qdac1, 1)
+    qdac1.ch01.slope(1)
+    qdac1.visa_handle.voltages[1] = 0.1
+    # -----------------------------------------------------------------------
+    voltage = qdac1.ch01.v()
+    # -----------------------------------------------------------------------
+    assert voltage == 0.1
+    assert qdac1.visa_handle.lines == ['set 1']
+    qdac1.stop_background_refresh()
+
+
+def test_ramp_starts_from_live_voltage(qdac1, mocker):  # noqa
+    ramp = mocker.patch.object(QDac, 'ramp_voltages')
+    qdac1.start_background_refresh(interval_s=100, channels=[1])
+    wait_for_refresh(qdac1, 1)
+    qdac1.visa_handle.voltages[1] = 0.1
+    qdac1._slopes[1] = 1
+    # -----------------------------------------------------------------------
+    qdac1.ch01.v(0.5)
+    # -----------------------------------------------------------------------
+    assert qdac1.visa_handle.lines == ['set 1']
+    ramp.assert_called_once_with([1], [0.1], [0.5], pytest.approx(0.4))
+    qdac1.stop_background_refresh()
+
+
+def test_stop_background_refresh(qdac1):  # noqa
+    qdac1.start_background_refresh(interval_s=100)
+    refresher = qdac1._refresher
+    # -----------------------------------------------------------------------
+    qdac1.stop_background_refresh()
+    # -----------------------------------------------------------------------
+    assert not refresher.is_alive()
+    assert qdac1._refresher is None
+    qdac1.visa_handle.voltages[1] = 0.1
+    assert qdac1.ch01.v() == 0.1
+
+
+def test_close_stops_background_refresh(qdac1):  # noqa
+    qdac1.start_background_refresh(interval_s=100)
+    refresher = qdac1._refresher
+    # -----------------------------------------------------------------------
+    qdac1.close()
+    # -----------------------------------------------------------------------
+    assert not refresher.is_alive()
+
+
+def test_pipeline_does_not_hold_up_other_threads(qdac1):  # noqa
+    voltages = []
+    reader = threading.Thread(target=lambda: voltages.append(qdac1.ch02.v()))
+    qdac1.visa_handle.voltages[2] = 0.2
+    # -----------------------------------------------------------------------
+    with qdac1.pipeline():
+        qdac1.ch01.v(0.1)
+        reader.start()
+        reader.join(5)
+        assert voltages == [0.2]
+    # -----------------------------------------------------------------------
+    assert qdac1.visa_handle.lines == ['set 2', 'wav 1 0 0 0;set 1 0.100000']
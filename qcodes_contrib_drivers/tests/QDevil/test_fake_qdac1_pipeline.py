@@ -0,0 +1,85 @@
+import logging
+import pytest
+import pyvisa
+from .fake_qdac1_fixtures import qdac1  # noqa
+
+
+def test_pipeline_packs_commands_into_lines(qdac1):  # noqa
+    handle = qdac1.visa_handle
+    # -----------------------------------------------------------------------
+    with qdac1.pipeline(max_line_length=60):
+        qdac1.ch01.v(0.1)
+        qdac1.ch02.v(0.2)
+        qdac1.ch03.v(0.3)
+        assert handle.lines == []
+    # -----------------------------------------------------------------------
+    assert handle.lines == [
+        'wav 1 0 0 0;set 1 0.100000;wav 2 0 0 0;set 2 0.200000',
+        'wav 3 0 0 0;set 3 0.300000',
+    ]
+    assert handle.voltages[3] == 0.3
+
+
+def test_pipeline_drains_all_responses(qdac1):  # noqa
+    # -----------------------------------------------------------------------
+    qdac1.set_voltages({ch: 0.01 * ch for ch in range(1, 25)})
+    # -----------------------------------------------------------------------
+    assert len(qdac1.visa_handle.lines) > 1
+    assert not qdac1.visa_handle.responses
+    assert qdac1.ch24.v() == 0.24
+
+
+def test_pipeline_limits_lines_in_flight(qdac1, mocker):  # noqa
+    handle = qdac1.visa_handle
+    pending = []
+    write = handle.write
+    mocker.patch.object(handle, 'write', side_effect=lambda line: (
+        pending.append(len(handle.responses)), write(line)))
+    # -----------------------------------------------------------------------
+    with qdac1.pipeline(max_line_length=30, max_lines_in_flight=2):
+        for ch in range(1, 9):
+            qdac1.channels[ch-1].v(0.1)
+    # -----------------------------------------------------------------------
+    # Each line holds one 'wav;set' pair, so before a line is sent at most
+    # one earlier line (two responses) is still unread
+    assert len(pending) == 8
+    assert max(pending) == 2
+    assert not handle.responses
+
+
+def test_pipeline_reads_flush_queued_commands(qdac1):  # noqa
+    # -----------------------------------------------------------------------
+    with qdac1.pipeline():
+        qdac1.ch05.v(0.5)
+        voltage = qdac1.ch05.v()
+    # -----------------------------------------------------------------------
+    assert voltage == 0.5
+    assert qdac1.visa_handle.lines == ['wav 5 0 0 0;set 5 0.500000', 'set 5']
+
+
+def test_pipeline_logs_error_responses(qdac1, caplog):  # noqa
+    qdac1.visa_handle.errors['wav 2 0 0 0'] = 'Error: Channel is ramping'
+    # -----------------------------------------------------------------------
+    with caplog.at_level(logging.WARNING):
+        qdac1.set_voltages({1: 0.1, 2: 0.2})
+    # -----------------------------------------------------------------------
+    assert 'Error: Channel is ramping' in caplog.text
+    assert not qdac1.visa_handle.responses
+
+
+def test_pipeline_ends_when_write_fails(qdac1, mocker):  # noqa
+    mocker.patch.object(qdac1.visa_handle, 'write', side_effect=pyvisa.VisaIOError(
+        pyvisa.constants.StatusCode.error_io))
+    # -----------------------------------------------------------------------
+    with pytest.raises(pyvisa.VisaIOError):
+        qdac1.set_voltages({1: 0.1})
+    # -----------------------------------------------------------------------
+    mocker.stopall()
+    qdac1.ch01.v(0.1)
+    assert qdac1.visa_handle.lines[-1] == 'wav 1 0 0 0;set 1 0.100000'
+
+
+def test_pipeline_rejects_no_lines_in_flight(qdac1):  # noqa
+    with pytest.raises(ValueError, match='max_lines_in_flight'):
+        with qdac1.pipeline(max_lines_in_flight=0):
+            pass
@@ -0,0 +1,104 @@
+import asyncio
+import threading
+import pytest
+from .sim_qdac2_fixtures import qdac  # noqa
+from .sim_qswitch_fixtures import qswitch  # noqa
+from qcodes_contrib_drivers.drivers.QDevil.QDevil_Async import \
+    AsyncQDac2, AsyncQSwitch
+
+
+@pytest.fixture(scope='function')
+def async_qdac(qdac):  # noqa
+    front_end = AsyncQDac2(qdac)
+    yield front_end
+    front_end.close()
+
+
+@pytest.fixture(scope='function')
+def async_qswitch(qswitch):  # noqa
+    front_end = AsyncQSwitch(qswitch)
+    yield front_end
+    front_end.close()
+
+
+def test_async_write_and_ask(qdac, async_qdac):  # noqa
+    async def work():
+        await async_qdac.write('sour1:volt 0.1')
+        return await async_qdac.ask('*idn?')
+    # -----------------------------------------------------------------------
+    answer = asyncio.run(work())
+    # -----------------------------------------------------------------------
+    assert 'QDAC-II' in answer
+    assert qdac.get_recorded_scpi_commands() == ['sour1:volt 0.1', '*idn?']
+
+
+def test_async_calls_run_outside_event_loop_thread(qdac, async_qdac):  # noqa
+    loop_thread = threading.get_ident()
+
+    async def work():
+        return await async_qdac.run(threading.get_ident)
+    # -----------------------------------------------------------------------
+    worker_thread = asyncio.run(work())
+    # -----------------------------------------------------------------------
+    assert worker_thread != loop_thread
+
+
+def test_async_arrangement(qdac, async_qdac):  # noqa
+    arrangement = qdac.arrange({'sensor1': 1, 'plunger2': 2})
+    qdac.start_recording_scpi()
+
+    async def work():
+        await async_qdac.set_virtual_voltages(arrangement, {'plunger2': 0.2})
+        return await async_qdac.currents_A(arrangement, nplc=2)
+    # -----------------------------------------------------------------------
+    currents_A = asyncio.run(work())
+    # -----------------------------------------------------------------------
+    assert currents_A == [0.1, 0.2]  # Hard-coded in simulation
+    assert arrangement.virtual_voltage('plunger2') == 0.2
+
+
+def test_async_available(qdac, async_qdac):  # noqa
+    measurement = qdac.ch02.measurement()
+    # -----------------------------------------------------------------------
+    available = asyncio.run(async_qdac.available_A(measurement))
+    # -----------------------------------------------------------------------
+    assert len(available) == 2  # Hard-coded in simulation
+
+
+def test_async_errors_propagate(async_qdac):  # noqa
+    # -----------------------------------------------------------------------
+    with pytest.raises(ValueError) as error:
+        asyncio.run(async_qdac.set_virtual_voltages(
+            async_qdac.qdac.arrange({'gate': 1}), {'nowhere': 0.1}))
+    # -----------------------------------------------------------------------
+    assert 'No contact named "nowhere"' in repr(error)
+
+
+def test_async_qswitch(qswitch, async_qswitch):  # noqa
+    qswitch.start_recording_scpi()
+
+    async def work():
+        await async_qswitch.arrange(lines={'gate': 15})
+        await async_qswitch.connect('gate')
+        await async_qswitch.ground('gate')
+    # -----------------------------------------------------------------------
+    asyncio.run(work())
+    # -----------------------------------------------------------------------
+    assert qswitch.get_recorded_scpi_commands() == [
+        'clos (@15!9)', '*opc?', 'open (@15!0)', '*opc?',
+        'clos (@15!0)', '*opc?', 'open (@15!9)', '*opc?',
+    ]
+
+
+def test_async_qswitch_relays(qswitch, async_qswitch):  # noqa
+    qswitch.start_recording_scpi()
+
+    async def work():
+        await async_qswitch.close_relays([(15, 9)])
+        await async_qswitch.open_relays([(15, 0)])
+        return await async_qswitch.closed_relays()
+    # -----------------------------------------------------------------------
+    asyncio.run(work())
+    # -----------------------------------------------------------------------
+    assert qswitch.get_recorded_scpi_commands()[:4] == [
+        'clos (@15!9)', '*opc?', 'open (@15!0)', '*opc?']
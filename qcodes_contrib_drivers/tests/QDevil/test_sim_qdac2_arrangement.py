@@ -130,8 +130,70 @@ def test_arrangement_set_virtual_voltage_affects_whole_arrangement(qdac):  # noq
         'sour1:volt 1.5',
         'sour2:volt:mode fix',
         'sour2:volt 5.0',
-        'sour3:volt:mode fix',
-        'sour3:volt 3.0'
+    ]
+
+
+def test_arrangement_only_resends_changed_contacts(qdac):  # noqa
+    arrangement = qdac.arrange(contacts={'gate1': 1, 'gate2': 2, 'gate3': 3})
+    arrangement.set_virtual_voltages({'gate1': 0.1, 'gate2': 0.2, 'gate3': 0.3})
+    qdac.start_recording_scpi()
+    # -----------------------------------------------------------------------
+    arrangement.set_virtual_voltage('gate2', 0.25)
+    arrangement.set_virtual_voltage('gate2', 0.25)
+    # -----------------------------------------------------------------------
+    commands = qdac.get_recorded_scpi_commands()
+    assert commands == [
+        'sour2:volt:mode fix',
+        'sour2:volt 0.25',
+    ]
+
+
+def test_arrangement_resolution_suppresses_small_changes(qdac):  # noqa
+    arrangement = qdac.arrange(contacts={'gate1': 1, 'gate2': 2},
+                               resolution_V=1e-3)
+    arrangement.initiate_correction('gate1', [1.0, 0.001])
+    arrangement.set_virtual_voltages({'gate1': 0.1, 'gate2': 0.2})
+    qdac.start_recording_scpi()
+    # -----------------------------------------------------------------------
+    arrangement.set_virtual_voltage('gate2', 0.7)
+    # -----------------------------------------------------------------------
+    commands = qdac.get_recorded_scpi_commands()
+    assert commands == [
+        'sour2:volt:mode fix',
+        'sour2:volt 0.7',
+    ]
+    assert np.allclose(arrangement.actual_voltages(), [0.1007, 0.7])
+
+
+def test_arrangement_forget_sent_voltages(qdac):  # noqa
+    arrangement = qdac.arrange(contacts={'gate1': 1, 'gate2': 2})
+    arrangement.set_virtual_voltages({'gate1': 0.1, 'gate2': 0.2})
+    arrangement.forget_sent_voltages()
+    qdac.start_recording_scpi()
+    # -----------------------------------------------------------------------
+    arrangement.set_virtual_voltage('gate2', 0.3)
+    # -----------------------------------------------------------------------
+    commands = qdac.get_recorded_scpi_commands()
+    assert commands == [
+        'sour1:volt:mode fix',
+        'sour1:volt 0.1',
+        'sour2:volt:mode fix',
+        'sour2:volt 0.3',
+    ]
+
+
+def test_arrangement_restores_channel_changed_directly(qdac):  # noqa
+    arrangement = qdac.arrange(contacts={'gate1': 1, 'gate2': 2})
+    arrangement.set_virtual_voltages({'gate1': 0.1, 'gate2': 0.2})
+    qdac.ch01.dc_constant_V(0.5)
+    qdac.start_recording_scpi()
+    # -----------------------------------------------------------------------
+    arrangement.set_virtual_voltages({'gate1': 0.1, 'gate2': 0.2})
+    # -----------------------------------------------------------------------
+    commands = qdac.get_recorded_scpi_commands()
+    assert commands == [
+        'sour1:volt:mode fix',
+        'sour1:volt 0.1',
     ]
 
 
@@ -2,10 +2,12 @@ import pytest
 from unittest.mock import call
 from qcodes_contrib_drivers.drivers.QDevil.QDAC2 import QDac2
 from qcodes_contrib_drivers.drivers.QDevil.QDAC2_Array import QDac2_Array
-from .sim_qdac2_fixtures import qdac, qdac2  # noqa
+from .sim_qdac2_fixtures import qdac, qdac2, qdac_joined, qdac2_joined  # noqa
 from typing import Tuple
 import numpy as np
+import gc
 import math
+import threading
 
 
 # User Story 1
@@ -156,7 +158,8 @@ def test_sync_square_waves(qdac, qdac2):  # noqa
     assert 'tint 1' in controller_commands
 
 
-def test_set_virtual_voltages_goes_to_correct_qdac(qdac, qdac2):  # noqa
+def test_set_virtual_voltages_goes_to_correct_qdac(qdac_joined, qdac2_joined):  # noqa
+    qdac, qdac2 = qdac_joined, qdac2_joined
     qdacs, controller, listener = two_qdacs(qdac, qdac2)
     contacts = {controller: {'A': 1}, listener: {'B': 1, 'C': 2}}
     arrangement = qdacs.arrange(contacts)
@@ -168,6 +171,71 @@ def test_set_virtual_voltages_goes_to_correct_qdac(qdac, qdac2):  # noqa
     assert arrangement.virtual_voltage('C') == 0.3
 
 
+def test_correction_across_qdacs(qdac_joined, qdac2_joined):  # noqa
+    qdac, qdac2 = qdac_joined, qdac2_joined
+    qdacs, controller, listener = two_qdacs(qdac, qdac2)
+    contacts = {controller: {'A': 1}, listener: {'B': 1, 'C': 2}}
+    arrangement = qdacs.arrange(contacts)
+    arrangement.initiate_correction('B', [0.5, 1.0, 0.0])
+    arrangement.set_virtual_voltages({'A': 0.0, 'B': 0.0, 'C': 0.0})
+    qdac.start_recording_scpi()
+    qdac2.start_recording_scpi()
+    # -----------------------------------------------------------------------
+    arrangement.set_virtual_voltage('A', 0.2)
+    # -----------------------------------------------------------------------
+    assert qdac.get_recorded_scpi_commands() == [
+        'sour1:volt:mode fix',
+        'sour1:volt 0.2',
+    ]
+    assert qdac2.get_recorded_scpi_commands() == [
+        'sour1:volt:mode fix',
+        'sour1:volt 0.1',
+    ]
+    assert arrangement.virtual_voltage('B') == 0.0
+    assert arrangement.actual_voltages() == [0.2, 0.1, 0.0]
+
+
+def test_add_correction_across_qdacs(qdac, qdac2):  # noqa
+    qdacs, controller, listener = two_qdacs(qdac, qdac2)
+    contacts = {controller: {'A': 1}, listener: {'B': 1}}
+    arrangement = qdacs.arrange(contacts)
+    # -----------------------------------------------------------------------
+    arrangement.add_correction('A', [1.0, -0.1])
+    arrangement.add_correction('B', [0.2, 1.0])
+    # -----------------------------------------------------------------------
+    assert np.allclose(arrangement.correction_matrix,
+                       [[1.0, -0.1], [0.2, 0.98]])
+
+
+def test_correction_needs_factor_per_contact(qdac, qdac2):  # noqa
+    qdacs, controller, listener = two_qdacs(qdac, qdac2)
+    contacts = {controller: {'A': 1}, listener: {'B': 1}}
+    arrangement = qdacs.arrange(contacts)
+    # -----------------------------------------------------------------------
+    with pytest.raises(ValueError) as error:
+        arrangement.initiate_correction('A', [1.0])
+    # -----------------------------------------------------------------------
+    assert 'exactly one factor per contact' in repr(error)
+
+
+def test_only_changed_voltages_are_sent(qdac_joined, qdac2_joined):  # noqa
+    qdac, qdac2 = qdac_joined, qdac2_joined
+    qdacs, controller, listener = two_qdacs(qdac, qdac2)
+    contacts = {controller: {'A': 1}, listener: {'B': 1, 'C': 2}}
+    arrangement = qdacs.arrange(contacts)
+    arrangement.set_virtual_voltages({'A': 0.1, 'B': 0.2, 'C': 0.3})
+    qdac.start_recording_scpi()
+    qdac2.start_recording_scpi()
+    # -----------------------------------------------------------------------
+    arrangement.set_virtual_voltages({'A': 0.1, 'B': 0.2, 'C': 0.4})
+    # -----------------------------------------------------------------------
+    assert qdac.get_recorded_scpi_commands() == []
+    assert qdac2.get_recorded_scpi_commands() == [
+        'sour2:volt:mode fix',
+        'sour2:volt 0.4',
+    ]
+
+
 # User Story 2
 #
 # To assess the usability of my quantum chip sample, as a QCoDeS user, I want to
@@ -207,7 +275,8 @@ def test_sync_steady_state(qdac, qdac2, mocker):  # noqa
     sleep_s.assert_has_calls([call(measure_s)])
 
 
-def test_sync_leakage(qdac, qdac2, mocker):  # noqa
+def test_sync_leakage(qdac_joined, qdac2_joined, mocker):  # noqa
+    qdac, qdac2 = qdac_joined, qdac2_joined
     mocker.patch('qcodes_contrib_drivers.drivers.QDevil.QDAC2_Array.sleep_s')  # Don't sleep
     qdacs, controller, listener = two_qdacs(qdac, qdac2)
     contacts = {controller: {'A': 3}, listener: {'B': 1, 'C': 2}}
@@ -263,27 +332,19 @@ def test_sync_leakage(qdac, qdac2, mocker):  # noqa
         # Second modulation
         'sour1:volt:mode fix',
         'sour1:volt 0.202',
-        'sour2:volt:mode fix',
-        'sour2:volt 0.0',
         'sens:rang low,(@1,2)',
         '*stb?',
         'sens:nplc 2,(@1,2)',
         'read? (@1,2)',
         'sour1:volt:mode fix',
         'sour1:volt 0.2',
-        'sour2:volt:mode fix',
-        'sour2:volt 0.0',
         # Third modulation
-        'sour1:volt:mode fix',
-        'sour1:volt 0.2',
         'sour2:volt:mode fix',
         'sour2:volt 0.002',
         'sens:rang low,(@1,2)',
         '*stb?',
         'sens:nplc 2,(@1,2)',
         'read? (@1,2)',
-        'sour1:volt:mode fix',
-        'sour1:volt 0.2',
         'sour2:volt:mode fix',
         'sour2:volt 0.0'
     ]
@@ -302,3 +363,61 @@ def test_frees_internal_triggers_on_exit(qdac, qdac2):  # noqa
         pass
     # -----------------------------------------------------------------------
     assert qdac.n_triggers() == len(qdac._internal_triggers)
+
+
+def test_work_runs_concurrently_in_instrument_order(qdac, qdac2):  # noqa
+    qdacs, _, _ = two_qdacs(qdac, qdac2)
+    barrier = threading.Barrier(2, timeout=5)
+
+    def work(instrument: QDac2) -> str:
+        # Deadlocks (times out) unless both instruments are served at once
+        barrier.wait()
+        return instrument.full_name
+
+    # -----------------------------------------------------------------------
+    names = qdacs._run_concurrently(work, [qdac, qdac2])
+    # -----------------------------------------------------------------------
+    assert names == [qdac.full_name, qdac2.full_name]
+    qdacs.close()
+
+
+def test_concurrent_work_propagates_errors(qdac, qdac2):  # noqa
+    qdacs, _, _ = two_qdacs(qdac, qdac2)
+
+    def work(instrument: QDac2) -> None:
+        if instrument is qdac2:
+            raise ValueError(f'Broken {instrument.full_name}')
+
+    # -----------------------------------------------------------------------
+    with pytest.raises(ValueError) as error:
+        qdacs._run_concurrently(work, [qdac, qdac2])
+    # -----------------------------------------------------------------------
+    assert f'Broken {qdac2.full_name}' in repr(error)
+    qdacs.close()
+
+
+def test_work_joins_batch_of_calling_thread(qdac_joined, qdac2_joined, mocker):  # noqa
+    qdac, qdac2 = qdac_joined, qdac2_joined
+    qdacs, controller, listener = two_qdacs(qdac, qdac2)
+    contacts = {controller: {'A': 1}, listener: {'B': 1}}
+    arrangement = qdacs.arrange(contacts)
+    write = mocker.spy(qdac2.visa_handle, 'write')
+    # -----------------------------------------------------------------------
+    with qdac2.batch():
+        arrangement.set_virtual_voltages({'A': 0.1, 'B': 0.2})
+        assert write.call_count == 0
+    # -----------------------------------------------------------------------
+    sent = [args[0] for args, _ in write.call_args_list]
+    assert sent == ['sour1:volt:mode fix;:sour1:volt 0.2']
+    assert qdacs._executor is None
+
+
+def test_threads_stopped_when_array_collected(qdac, qdac2):  # noqa
+    qdacs, _, _ = two_qdacs(qdac, qdac2)
+    qdacs._run_concurrently(lambda instrument: None, [qdac, qdac2])
+    executor = qdacs._executor
+    # -----------------------------------------------------------------------
+    del qdacs
+    gc.collect()
+    # -----------------------------------------------------------------------
+    assert executor._shutdown
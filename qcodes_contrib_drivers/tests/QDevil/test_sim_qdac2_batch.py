@@ -0,0 +1,164 @@
+import pytest
+import threading
+from .sim_qdac2_fixtures import qdac_joined  # noqa
+from qcodes_contrib_drivers.drivers.QDevil.QDAC2 import _join_scpi_commands
+
+
+def test_join_commands_from_root():
+    # -----------------------------------------------------------------------
+    message = _join_scpi_commands(['sour1:volt 0.1', 'sour2:volt 0.2', '*trg'])
+    # -----------------------------------------------------------------------
+    assert message == 'sour1:volt 0.1;:sour2:volt 0.2;*trg'
+
+
+def test_batch_coalesces_arrangement_writes(qdac_joined, mocker):  # noqa
+    qdac = qdac_joined
+    arrangement = qdac.arrange(contacts={'gate1': 1, 'gate2': 2})
+    write = mocker.spy(qdac.visa_handle, 'write')
+    qdac.start_recording_scpi()
+    # -----------------------------------------------------------------------
+    with qdac.batch() as transaction:
+        arrangement.set_virtual_voltages({'gate1': 0.1, 'gate2': 0.2})
+    # -----------------------------------------------------------------------
+    assert qdac.get_recorded_scpi_commands() == [
+        'sour1:volt:mode fix',
+        'sour1:volt 0.1',
+        'sour2:volt:mode fix',
+        'sour2:volt 0.2',
+    ]
+    assert transaction.n_commands == 4
+    assert transaction.n_messages == 1
+    sent = [args[0] for args, _ in write.call_args_list]
+    assert sent == [
+        'sour1:volt:mode fix;:sour1:volt 0.1;:sour2:volt:mode fix;:sour2:volt 0.2'
+    ]
+
+
+def test_batch_flushes_before_query(qdac_joined, mocker):  # noqa
+    qdac = qdac_joined
+    write = mocker.spy(qdac.visa_handle, 'write')
+    # -----------------------------------------------------------------------
+    with qdac.batch() as transaction:
+        qdac.start_all()
+        qdac.write('tint 1')
+        n_errors = qdac.n_errors()
+        qdac.write('tint 2')
+    # -----------------------------------------------------------------------
+    assert n_errors == 0
+    sent = [args[0] for args, _ in write.call_args_list]
+    assert sent == ['*trg;:tint 1', 'syst:err:coun?', 'tint 2']
+    assert transaction.n_commands == 3
+    assert transaction.n_messages == 2
+
+
+def test_batch_splits_long_messages(qdac_joined, mocker):  # noqa
+    qdac = qdac_joined
+    write = mocker.spy(qdac.visa_handle, 'write')
+    # -----------------------------------------------------------------------
+    with qdac.batch(max_message_length=10) as transaction:
+        qdac.write('tint 1')
+        qdac.write('tint 2')
+    # -----------------------------------------------------------------------
+    sent = [args[0] for args, _ in write.call_args_list]
+    assert sent == ['tint 1', 'tint 2']
+    assert transaction.n_messages == 2
+
+
+def test_batch_nested_is_absorbed(qdac_joined, mocker):  # noqa
+    qdac = qdac_joined
+    write = mocker.spy(qdac.visa_handle, 'write')
+    # -----------------------------------------------------------------------
+    with qdac.batch() as outer:
+        qdac.start_all()
+        with qdac.batch() as inner:
+            qdac.write('tint 1')
+        assert write.call_count == 0
+    # -----------------------------------------------------------------------
+    sent = [args[0] for args, _ in write.call_args_list]
+    assert sent == ['*trg;:tint 1']
+    assert outer.n_commands == 2
+    assert inner.n_commands == 1
+
+
+def test_batch_empty_sends_nothing(qdac_joined, mocker):  # noqa
+    qdac = qdac_joined
+    write = mocker.spy(qdac.visa_handle, 'write')
+    # -----------------------------------------------------------------------
+    with qdac.batch() as transaction:
+        pass
+    # -----------------------------------------------------------------------
+    assert write.call_count == 0
+    assert transaction.n_messages == 0
+
+
+def test_batch_discarded_on_exception(qdac_joined, mocker):  # noqa
+    qdac = qdac_joined
+    write = mocker.spy(qdac.visa_handle, 'write')
+    # -----------------------------------------------------------------------
+    with pytest.raises(RuntimeError):
+        with qdac.batch():
+            qdac.write('tint 1')
+            raise RuntimeError('abort')
+    # -----------------------------------------------------------------------
+    assert write.call_count == 0
+    assert qdac._batch is None
+
+
+def test_batch_nested_exception_discards_inner_commands(qdac_joined, mocker):  # noqa
+    qdac = qdac_joined
+    write = mocker.spy(qdac.visa_handle, 'write')
+    # -----------------------------------------------------------------------
+    with qdac.batch():
+        qdac.start_all()
+        with pytest.raises(RuntimeError):
+            with qdac.batch():
+                qdac.write('tint 2')
+                raise RuntimeError('abort')
+        qdac.write('tint 1')
+    # -----------------------------------------------------------------------
+    sent = [args[0] for args, _ in write.call_args_list]
+    assert sent == ['*trg;:tint 1']
+
+
+def test_batch_write_returns_nothing(qdac_joined):  # noqa
+    qdac = qdac_joined
+    # -----------------------------------------------------------------------
+    with qdac.batch():
+        result = qdac.write('tint 1')
+    # -----------------------------------------------------------------------
+    assert result is None
+
+
+def test_batch_does_not_capture_other_threads(qdac_joined, mocker):  # noqa
+    qdac = qdac_joined
+    write = mocker.spy(qdac.visa_handle, 'write')
+    # -----------------------------------------------------------------------
+    with qdac.batch() as transaction:
+        qdac.start_all()
+        thread = threading.Thread(target=qdac.write, args=('tint 2',))
+        thread.start()
+        thread.join()
+        qdac.write('tint 1')
+    # -----------------------------------------------------------------------
+    sent = [args[0] for args, _ in write.call_args_list]
+    assert sent == ['tint 2', '*trg;:tint 1']
+    assert transaction.n_commands == 2
+
+
+def test_batch_discarded_arrangement_voltage_is_resent(qdac_joined):  # noqa
+    qdac = qdac_joined
+    arrangement = qdac.arrange(contacts={'gate1': 1})
+    qdac.start_recording_scpi()
+    # -----------------------------------------------------------------------
+    with pytest.raises(RuntimeError):
+        with qdac.batch():
+            arrangement.set_virtual_voltage('gate1', 0.3)
+            raise RuntimeError('abort')
+    # -----------------------------------------------------------------------
+    assert qdac.get_recorded_scpi_commands() == []
+    assert not qdac.ch01.dc_constant_V.cache.valid
+    arrangement.set_virtual_voltage('gate1', 0.3)
+    assert qdac.get_recorded_scpi_commands() == [
+        'sour1:volt:mode fix',
+        'sour1:volt 0.3',
+    ]
@@ -1,4 +1,5 @@
 import pytest
+import numpy as np
 from .sim_qdac2_fixtures import qdac  # noqa
 from qcodes_contrib_drivers.drivers.QDevil.QDAC2 import ExternalInput
 
@@ -178,6 +179,63 @@ def test_measurement_remove_two(qdac):  # noqa
     assert isinstance(available[1], float)
 
 
+def test_binary_readback_enable(qdac):  # noqa
+    # -----------------------------------------------------------------------
+    qdac.use_binary_readback()
+    qdac.use_binary_readback(False)
+    # -----------------------------------------------------------------------
+    assert qdac.get_recorded_scpi_commands() == [
+        'form:data real,64',
+        'form:data asc',
+    ]
+
+
+def test_measurement_remove_binary(qdac, mocker):  # noqa
+    measurement = qdac.ch02.measurement()
+    query = mocker.patch.object(qdac.visa_handle, 'query_binary_values',
+                                return_value=np.array([0.01, 0.02]))
+    qdac.use_binary_readback()
+    qdac.start_recording_scpi()
+    # -----------------------------------------------------------------------
+    try:
+        available = measurement.available_A()
+    finally:
+        qdac.use_binary_readback(False)
+    # -----------------------------------------------------------------------
+    assert qdac.get_recorded_scpi_commands() == [
+        'sens2:data:poin?',
+        'sens2:data:rem?',
+        'form:data asc',
+    ]
+    query.assert_called_once_with('sens2:data:rem?', datatype='d',
+                                  container=np.ndarray)
+    assert isinstance(available, np.ndarray)
+    assert np.allclose(available, [0.01, 0.02])
+
+
+def test_measurement_remove_binary_block(qdac):  # noqa
+    measurement = qdac.ch03.measurement()
+    qdac.use_binary_readback()
+    # -----------------------------------------------------------------------
+    try:
+        available = measurement.available_A()
+    finally:
+        qdac.use_binary_readback(False)
+    # -----------------------------------------------------------------------
+    assert isinstance(available, np.ndarray)
+    assert np.allclose(available, [10.0, 20.0])
+
+
+def test_reset_reverts_to_ascii_readback(qdac):  # noqa
+    measurement = qdac.ch02.measurement()
+    qdac.use_binary_readback()
+    # -----------------------------------------------------------------------
+    qdac.write('*rst')
+    available = measurement.available_A()
+    # -----------------------------------------------------------------------
+    assert available == [0.01, 0.02]
+
+
 def test_measurement_last(qdac):  # noqa
     measurement = qdac.ch02.measurement()
     qdac.start_recording_scpi()
@@ -49,3 +49,42 @@ def test_refuse_qcodes_incompatible_name():
     # -----------------------------------------------------------------------
     assert 'QDAC-II' in repr(error)
     assert 'incompatible with QCoDeS parameter' in repr(error)
+
+
+def test_lazy_channels_constructed_on_first_use():
+    qdac = QDac2('lazy_qdac', address='GPIB::1::INSTR', visalib=visalib,
+                 lazy=True)
+    try:
+        assert 'ch05' not in qdac.submodules
+        # -------------------------------------------------------------------
+        channel = qdac.ch05
+        # -------------------------------------------------------------------
+        assert qdac.submodules['ch05'] is channel
+        assert qdac.channel(5) is channel
+        assert 'ch06' not in qdac.submodules
+        assert len(qdac.channels) == qdac.n_channels()
+        assert qdac.channels[4] is channel
+        assert qdac.ext2 is qdac.external_triggers[1]
+    finally:
+        qdac.close()
+
+
+def test_eager_channels_constructed_at_startup():
+    qdac = QDac2('eager_qdac', address='GPIB::1::INSTR', visalib=visalib)
+    try:
+        # -------------------------------------------------------------------
+        names = set(qdac.submodules)
+        # -------------------------------------------------------------------
+        assert {'ch01', 'ch24', 'channels', 'ext5', 'external_triggers'} <= names
+        assert len(qdac.channels) == qdac.n_channels()
+    finally:
+        qdac.close()
+
+
+def test_instrument_checked_once_per_session(mocker):
+    QDac2('first_qdac', address='GPIB::1::INSTR', visalib=visalib).close()
+    check = mocker.spy(QDac2, '_check_for_incompatiable_firmware')
+    # -----------------------------------------------------------------------
+    QDac2('second_qdac', address='GPIB::1::INSTR', visalib=visalib).close()
+    # -----------------------------------------------------------------------
+    check.assert_not_called()
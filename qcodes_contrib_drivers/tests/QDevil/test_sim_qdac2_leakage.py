@@ -1,9 +1,11 @@
 import pytest
+import itertools
 from unittest.mock import call
 import numpy as np
 import math
 from .sim_qdac2_fixtures import qdac  # noqa
-from qcodes_contrib_drivers.drivers.QDevil.QDAC2 import diff_matrix
+from qcodes_contrib_drivers.drivers.QDevil.QDAC2 import diff_matrix, \
+    Measurement_Context
 
 
 def test_diff_matrix():
@@ -56,52 +58,28 @@ def test_arrangement_leakage(qdac, mocker):  # noqa
         # First modulation
         'sour1:volt:mode fix',
         'sour1:volt 0.305',
-        'sour2:volt:mode fix',
-        'sour2:volt 0.0',
-        'sour3:volt:mode fix',
-        'sour3:volt 0.4',
         'sens:rang low,(@1,2,3)',
         '*stb?',
         'sens:nplc 2,(@1,2,3)',
         'read? (@1,2,3)',
         'sour1:volt:mode fix',
         'sour1:volt 0.3',
-        'sour2:volt:mode fix',
-        'sour2:volt 0.0',
-        'sour3:volt:mode fix',
-        'sour3:volt 0.4',
         # Second modulation
-        'sour1:volt:mode fix',
-        'sour1:volt 0.3',
         'sour2:volt:mode fix',
         'sour2:volt 0.005',
-        'sour3:volt:mode fix',
-        'sour3:volt 0.4',
         'sens:rang low,(@1,2,3)',
         '*stb?',
         'sens:nplc 2,(@1,2,3)',
         'read? (@1,2,3)',
-        'sour1:volt:mode fix',
-        'sour1:volt 0.3',
         'sour2:volt:mode fix',
         'sour2:volt 0.0',
-        'sour3:volt:mode fix',
-        'sour3:volt 0.4',
         # Third modulation
-        'sour1:volt:mode fix',
-        'sour1:volt 0.3',
-        'sour2:volt:mode fix',
-        'sour2:volt 0.0',
         'sour3:volt:mode fix',
         'sour3:volt 0.405',
         'sens:rang low,(@1,2,3)',
         '*stb?',
         'sens:nplc 2,(@1,2,3)',
         'read? (@1,2,3)',
-        'sour1:volt:mode fix',
-        'sour1:volt 0.3',
-        'sour2:volt:mode fix',
-        'sour2:volt 0.0',
         'sour3:volt:mode fix',
         'sour3:volt 0.4',
     ]
@@ -109,3 +87,90 @@ def test_arrangement_leakage(qdac, mocker):  # noqa
     inf = math.inf
     expected = [[inf, inf, inf], [inf, inf, inf], [inf, inf, inf]]
     assert np.allclose(leakage_matrix, np.array(expected))
+
+
+def test_arrangement_leakage_triggered(qdac, mocker):  # noqa
+    sleep_s = mocker.patch('qcodes_contrib_drivers.drivers.QDevil.QDAC2.sleep_s')
+    qdac.free_all_triggers()
+    # The simulation only has buffered measurements on channel 2
+    arrangement = qdac.arrange({'plunger2': 2})
+    arrangement.set_virtual_voltages({'plunger2': 0.3})
+    qdac.start_recording_scpi()
+    # -----------------------------------------------------------------------
+    leakage_matrix = arrangement.leakage(modulation_V=0.005, nplc=2,
+                                         triggered=True)
+    # -----------------------------------------------------------------------
+    commands = qdac.get_recorded_scpi_commands()
+    assert commands == [
+        # Measure on each step
+        'sens2:del 0.001',
+        'sens2:rang low',
+        'sens2:nplc 2',
+        'sens2:coun 1',
+        'sens2:trig:sour bus',
+        'sens2:init',
+        'sens2:trig:sour int1',
+        'sens2:init:cont on',
+        '*stb?',
+        # Steady state followed by modulation
+        'sour2:dc:mark:sst 1',
+        'sour2:dc:trig:sour hold',
+        'sour2:volt:mode list',
+        'sour2:list:volt 0.3,0.305',
+        'sour2:list:tmod auto',
+        'sour2:list:dwel 0.061',
+        'sour2:dc:del 0',
+        'sour2:list:dir up',
+        'sour2:list:coun 1',
+        'sour2:dc:trig:sour bus',
+        'sour2:dc:init:cont on',
+        'sour2:dc:trig:sour int2',
+        'sour2:dc:init:cont on',
+        'sour2:dc:init',
+        'tint 2',
+        # Single readback
+        'sens2:data:poin?',
+        'sens2:data:rem?',
+        # Clean up
+        'sour2:dc:mark:sst 0',
+        'sour2:dc:abor',
+        'sour2:dc:trig:sour imm',
+        'sens2:abor',
+        'sens2:trig:sour imm',
+        'sour2:volt:mode fix',
+        'sour2:volt 0.3',
+    ]
+    # The simulation has all measurements available immediately
+    sleep_s.assert_not_called()
+    assert len(qdac._internal_triggers) == qdac.n_triggers()
+    # The current readings are fixed by the simulation.
+    assert np.allclose(leakage_matrix, np.array([[0.5]]))
+
+
+def test_arrangement_leakage_triggered_times_out(qdac, mocker):  # noqa
+    sleep_s = mocker.patch('qcodes_contrib_drivers.drivers.QDevil.QDAC2.sleep_s')
+    mocker.patch('qcodes_contrib_drivers.drivers.QDevil.QDAC2.monotonic_s',
+                 side_effect=itertools.count(step=0.5))
+    mocker.patch.object(Measurement_Context, 'n_available', return_value=0)
+    qdac.free_all_triggers()
+    arrangement = qdac.arrange({'plunger2': 2})
+    arrangement.set_virtual_voltages({'plunger2': 0.3})
+    qdac.start_recording_scpi()
+    # -----------------------------------------------------------------------
+    with pytest.raises(ValueError, match='Expected 2 measurements on channel 2, got 0'):
+        arrangement.leakage(modulation_V=0.005, nplc=2, triggered=True)
+    # -----------------------------------------------------------------------
+    # Polled every step until the timeout of 2 * 2 * 0.061 + 1 seconds
+    assert sleep_s.call_count == 2
+    sleep_s.assert_called_with(0.061)
+    commands = qdac.get_recorded_scpi_commands()
+    assert commands[-7:] == [
+        'sour2:dc:mark:sst 0',
+        'sour2:dc:abor',
+        'sour2:dc:trig:sour imm',
+        'sens2:abor',
+        'sens2:trig:sour imm',
+        'sour2:volt:mode fix',
+        'sour2:volt 0.3',
+    ]
+    assert len(qdac._internal_triggers) == qdac.n_triggers()
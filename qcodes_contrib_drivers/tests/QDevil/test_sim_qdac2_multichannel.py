@@ -0,0 +1,79 @@
+import pytest
+from qcodes.utils import validators
+from .sim_qdac2_fixtures import qdac, qdac_joined  # noqa
+
+
+def test_set_dc_voltages(qdac_joined, mocker):  # noqa
+    qdac = qdac_joined
+    write = mocker.spy(qdac.visa_handle, 'write')
+    # -----------------------------------------------------------------------
+    qdac.set_dc_voltages({1: 0.1, 2: 0.2, 3: 0.1})
+    # -----------------------------------------------------------------------
+    assert qdac.get_recorded_scpi_commands() == [
+        'sour:volt:mode fix,(@1,2,3)',
+        'sour:volt 0.1,(@1,3)',
+        'sour:volt 0.2,(@2)',
+    ]
+    assert write.call_count == 1
+    assert qdac.ch03.dc_constant_V.cache() == 0.1
+
+
+def test_set_dc_voltages_nothing(qdac):  # noqa
+    # -----------------------------------------------------------------------
+    qdac.set_dc_voltages({})
+    # -----------------------------------------------------------------------
+    assert qdac.get_recorded_scpi_commands() == []
+
+
+def test_set_dc_voltages_out_of_range(qdac):  # noqa
+    # -----------------------------------------------------------------------
+    with pytest.raises(ValueError) as error:
+        qdac.set_dc_voltages({1: 0.1, 2: 10.5})
+    # -----------------------------------------------------------------------
+    assert 'Voltage 10.5 on channel 2 is out of range' in repr(error)
+    assert qdac.get_recorded_scpi_commands() == []
+
+
+def test_set_dc_voltages_uses_channel_validator(qdac):  # noqa
+    qdac.ch02.dc_constant_V.vals = validators.Numbers(-1.0, 1.0)
+    try:
+        # -------------------------------------------------------------------
+        with pytest.raises(ValueError) as error:
+            qdac.set_dc_voltages({1: 1.5, 2: 1.5})
+        # -------------------------------------------------------------------
+    finally:
+        qdac.ch02.dc_constant_V.vals = validators.Numbers(-10.0, 10.0)
+    assert 'Voltage 1.5 on channel 2 is out of range' in repr(error)
+    assert qdac.get_recorded_scpi_commands() == []
+
+
+def test_set_dc_voltages_rounded_off(qdac_joined):  # noqa
+    qdac = qdac_joined
+    qdac._round_off = 4
+    try:
+        # -------------------------------------------------------------------
+        qdac.set_dc_voltages({1: 0.100004, 2: 0.099996})
+        # -------------------------------------------------------------------
+    finally:
+        qdac._round_off = None
+    assert qdac.get_recorded_scpi_commands() == [
+        'sour:volt:mode fix,(@1,2)',
+        'sour:volt 0.1,(@1,2)',
+    ]
+
+
+def test_set_dc_voltages_unknown_channel(qdac):  # noqa
+    # -----------------------------------------------------------------------
+    with pytest.raises(ValueError) as error:
+        qdac.set_dc_voltages({25: 0.1})
+    # -----------------------------------------------------------------------
+    assert 'Unknown channel 25' in repr(error)
+
+
+def test_get_dc_voltages(qdac):  # noqa
+    # -----------------------------------------------------------------------
+    voltages = qdac.get_dc_voltages([1, 2, 3])
+    # -----------------------------------------------------------------------
+    assert qdac.get_recorded_scpi_commands() == ['sour:volt? (@1,2,3)']
+    assert voltages == {1: 0.1, 2: 0.2, 3: 0.1}
+    assert qdac.ch02.dc_constant_V.cache() == 0.2
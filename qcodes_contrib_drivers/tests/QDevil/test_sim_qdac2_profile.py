@@ -0,0 +1,89 @@
+import pytest
+from .sim_qdac2_fixtures import qdac, qdac_joined  # noqa
+
+
+@pytest.fixture(scope='function')
+def profile(qdac):  # noqa
+    yield qdac.start_profiling()
+    qdac.stop_profiling()
+
+
+def test_profiling_off_by_default(qdac):  # noqa
+    # -----------------------------------------------------------------------
+    profile = qdac.stop_profiling()
+    # -----------------------------------------------------------------------
+    assert profile is None
+
+
+def test_profile_records_messages(qdac, profile):  # noqa
+    # -----------------------------------------------------------------------
+    qdac.ask('*idn?')
+    # -----------------------------------------------------------------------
+    records = profile.records()
+    assert [record.message for record in records] == ['*idn?']
+    assert records[0].operation == 'QDac2.ask'
+    assert records[0].n_bytes_sent == len('*idn?\n')
+    assert records[0].n_bytes_received > 0
+    assert records[0].latency_s >= 0
+    assert records[0].timestamp_s > 0
+
+
+def test_profile_names_parameter_operations(qdac, profile):  # noqa
+    # -----------------------------------------------------------------------
+    qdac.ch01.dc_constant_V(0.1)
+    qdac.ch01.dc_constant_V()
+    # -----------------------------------------------------------------------
+    operations = [record.operation for record in profile.records()]
+    assert operations == [
+        f'{qdac.ch01.dc_constant_V.full_name}.set',
+        f'{qdac.ch01.dc_constant_V.full_name}.set',
+        f'{qdac.ch01.dc_constant_V.full_name}.get',
+    ]
+
+
+def test_profile_names_outermost_driver_call(qdac, profile):  # noqa
+    arrangement = qdac.arrange({'sensor1': 1, 'plunger2': 2})
+    profile.clear()
+    # -----------------------------------------------------------------------
+    arrangement.currents_A()
+    # -----------------------------------------------------------------------
+    operations = {record.operation for record in profile.records()}
+    assert operations == {'Arrangement_Context.currents_A'}
+
+
+def test_profile_counts_batched_messages_once(qdac_joined):  # noqa
+    qdac = qdac_joined
+    profile = qdac.start_profiling()
+    # -----------------------------------------------------------------------
+    qdac.set_dc_voltages({1: 0.1, 2: 0.2, 3: 0.1})
+    # -----------------------------------------------------------------------
+    qdac.stop_profiling()
+    records = profile.records()
+    assert len(records) == 1
+    assert records[0].operation == 'QDac2.set_dc_voltages'
+
+
+def test_profile_summary(qdac, profile):  # noqa
+    qdac.ask('*idn?')
+    qdac.ask('*idn?')
+    qdac.ch01.dc_constant_V(0.1)
+    # -----------------------------------------------------------------------
+    summary = profile.summary()
+    # -----------------------------------------------------------------------
+    assert summary['QDac2.ask']['n_messages'] == 2
+    assert summary['QDac2.ask']['n_bytes_sent'] == 2 * len('*idn?\n')
+    stats = summary['QDac2.ask']
+    assert stats['p50_s'] <= stats['p90_s'] <= stats['p99_s'] <= stats['total_s']
+
+
+def test_profile_report(qdac, profile):  # noqa
+    qdac.ask('*idn?')
+    # -----------------------------------------------------------------------
+    report = profile.report()
+    # -----------------------------------------------------------------------
+    lines = report.split('\n')
+    assert lines[0].split() == [
+        'operation', 'msgs', 'sent', 'recv', 'total', 'ms', 'p50', 'ms',
+        'p90', 'ms', 'p99', 'ms']
+    assert lines[1].split()[:4] == ['QDac2.ask', '1', '6', str(
+        profile.records()[0].n_bytes_received)]
@@ -0,0 +1,169 @@
+import pytest
+from unittest.mock import call
+from pyvisa.errors import VisaIOError
+from .sim_qdac2_fixtures import qdac  # noqa
+from qcodes_contrib_drivers.drivers.QDevil.QDAC2 import setting_to_registers
+
+
+@pytest.fixture(scope='function')
+def shadowed(qdac):  # noqa
+    qdac.use_shadow_registers()
+    yield qdac
+    qdac.use_shadow_registers(False)
+
+
+def test_setting_to_registers_single_channel():
+    # -----------------------------------------------------------------------
+    registers = setting_to_registers('sens2:rang low')
+    # -----------------------------------------------------------------------
+    assert registers == {'sens2:rang': 'low'}
+
+
+def test_setting_to_registers_channel_list():
+    # -----------------------------------------------------------------------
+    registers = setting_to_registers('sens:nplc 2,(@1,3:4)')
+    # -----------------------------------------------------------------------
+    assert registers == {
+        'sens1:nplc': '2',
+        'sens3:nplc': '2',
+        'sens4:nplc': '2',
+    }
+
+
+def test_setting_to_registers_ignores_non_settings():
+    # -----------------------------------------------------------------------
+    registers = [setting_to_registers(cmd) for cmd in
+                 ('sens2:init', 'sour1:volt 0.1', 'sens:rang low', '*rst',
+                  'sour1:volt:mode fix')]
+    # -----------------------------------------------------------------------
+    assert registers == [None, None, None, None, None]
+
+
+def test_shadow_registers_off_by_default(qdac):  # noqa
+    # -----------------------------------------------------------------------
+    qdac.ch02.measurement()
+    qdac.ch02.measurement()
+    # -----------------------------------------------------------------------
+    assert qdac.n_shadow_hits() == 0
+    assert qdac.n_shadow_misses() == 0
+    assert len(qdac.get_recorded_scpi_commands()) == 12
+
+
+def test_shadow_registers_skip_unchanged_settings(shadowed):
+    shadowed.ch02.measurement()
+    shadowed.start_recording_scpi()
+    # -----------------------------------------------------------------------
+    shadowed.ch02.measurement(current_range='low')
+    # -----------------------------------------------------------------------
+    assert shadowed.get_recorded_scpi_commands() == [
+        'sens2:rang low',
+        'sens2:init',
+    ]
+    assert shadowed.n_shadow_hits() == 4
+    assert shadowed.n_shadow_misses() == 5 + 1
+
+
+def test_shadow_registers_aperture_invalidates_nplc(shadowed):
+    shadowed.ch02.measurement(nplc=2)
+    shadowed.ch02.measurement(aperture_s=1e-3)
+    shadowed.start_recording_scpi()
+    # -----------------------------------------------------------------------
+    shadowed.ch02.measurement(nplc=2)
+    # -----------------------------------------------------------------------
+    assert shadowed.get_recorded_scpi_commands() == [
+        'sens2:nplc 2',
+        'sens2:init',
+    ]
+
+
+def test_shadow_registers_forgotten_on_reset(shadowed, mocker):
+    mocker.patch('qcodes_contrib_drivers.drivers.QDevil.QDAC2.sleep_s')
+    shadowed.ch02.measurement()
+    shadowed.reset()
+    shadowed.start_recording_scpi()
+    # -----------------------------------------------------------------------
+    shadowed.ch02.measurement()
+    # -----------------------------------------------------------------------
+    assert shadowed.get_recorded_scpi_commands() == [
+        'sens2:del 0.0',
+        'sens2:rang high',
+        'sens2:nplc 1',
+        'sens2:coun 1',
+        'sens2:trig:sour bus',
+        'sens2:init',
+    ]
+
+
+def test_shadow_registers_not_updated_by_failed_write(shadowed, mocker):
+    shadowed.write('sens2:rang high')
+    mocker.patch.object(shadowed.visa_handle, 'write',
+                        side_effect=VisaIOError(-1073807339))
+    with pytest.raises(VisaIOError):
+        shadowed.write('sens2:rang low')
+    mocker.stopall()
+    shadowed.start_recording_scpi()
+    # -----------------------------------------------------------------------
+    shadowed.write('sens2:rang low')
+    shadowed.write('sens2:rang high')
+    # -----------------------------------------------------------------------
+    assert shadowed.get_recorded_scpi_commands() == [
+        'sens2:rang low',
+        'sens2:rang high',
+    ]
+
+
+def test_shadow_registers_forgotten_on_discarded_batch(shadowed):
+    with pytest.raises(ValueError):
+        with shadowed.batch():
+            shadowed.write('sens2:rang low')
+            raise ValueError('abandon')
+    shadowed.start_recording_scpi()
+    # -----------------------------------------------------------------------
+    shadowed.write('sens2:rang low')
+    # -----------------------------------------------------------------------
+    assert shadowed.get_recorded_scpi_commands() == ['sens2:rang low']
+
+
+def test_shadow_registers_channel_list_invalidates_channel(shadowed):
+    shadowed.ch02.measurement()
+    shadowed.write('sens:rang low,(@1,2)')
+    shadowed.start_recording_scpi()
+    # -----------------------------------------------------------------------
+    shadowed.ch02.measurement()
+    # -----------------------------------------------------------------------
+    assert shadowed.get_recorded_scpi_commands() == [
+        'sens2:rang high',
+        'sens2:init',
+    ]
+
+
+def test_arrangement_currents_skip_settling_when_unchanged(shadowed, mocker):
+    sleep_s = mocker.patch('qcodes_contrib_drivers.drivers.QDevil.QDAC2.sleep_s')
+    arrangement = shadowed.arrange({'sensor1': 1, 'plunger2': 2})
+    arrangement.currents_A(nplc=2)
+    shadowed.start_recording_scpi()
+    sleep_s.reset_mock()
+    # -----------------------------------------------------------------------
+    currents_A = arrangement.currents_A(nplc=2)
+    # -----------------------------------------------------------------------
+    assert currents_A == [0.1, 0.2]  # Hard-coded in simulation
+    assert shadowed.get_recorded_scpi_commands() == [
+        'read? (@1,2)',
+    ]
+    sleep_s.assert_not_called()
+
+
+def test_arrangement_currents_settle_when_nplc_changed(shadowed, mocker):
+    sleep_s = mocker.patch('qcodes_contrib_drivers.drivers.QDevil.QDAC2.sleep_s')
+    arrangement = shadowed.arrange({'sensor1': 1, 'plunger2': 2})
+    arrangement.currents_A(nplc=2)
+    shadowed.start_recording_scpi()
+    sleep_s.reset_mock()
+    # -----------------------------------------------------------------------
+    arrangement.currents_A(nplc=1)
+    # -----------------------------------------------------------------------
+    assert shadowed.get_recorded_scpi_commands() == [
+        'sens:nplc 1,(@1,2)',
+        'read? (@1,2)',
+    ]
+    sleep_s.assert_has_calls([call((1 + 1) / 50)])
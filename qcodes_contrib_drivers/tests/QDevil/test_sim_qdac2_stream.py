@@ -0,0 +1,79 @@
+import pytest
+import time
+import numpy as np
+from .sim_qdac2_fixtures import qdac  # noqa
+
+
+def wait_until(condition, timeout_s=2.0):
+    deadline = time.monotonic() + timeout_s
+    while not condition():
+        if time.monotonic() > deadline:
+            raise TimeoutError('condition not met')
+        time.sleep(0.001)
+
+
+def test_stream_ring_buffer_wraps_around(qdac):  # noqa
+    # The simulated instrument always has two measurements available.
+    with qdac.ch02.measurement(repetitions=-1) as measurement:
+        stream = measurement.stream(buffer_size=3, poll_interval_s=0)
+        # -------------------------------------------------------------------
+        wait_until(lambda: stream.n_buffered == 2)
+        first = stream.read()
+        wait_until(lambda: stream.n_buffered == 2)
+        second = stream.read()
+        # -------------------------------------------------------------------
+    assert list(first) == [0.01, 0.02]
+    assert list(second) == [0.01, 0.02]
+    assert stream.n_overruns == 0
+
+
+def test_stream_reads_in_background(qdac):  # noqa
+    # The simulated instrument always has two measurements available.
+    with qdac.ch02.measurement(repetitions=-1) as measurement:
+        stream = measurement.stream(buffer_size=100, poll_interval_s=0)
+        currents = stream.read(timeout_s=2)
+        assert stream.is_running
+    # -----------------------------------------------------------------------
+    assert not stream.is_running
+    assert qdac._stream_reader is None
+    assert len(currents) >= 2
+    assert np.allclose(currents[:2], [0.01, 0.02])
+    remaining = np.concatenate([np.empty(0), *stream])
+    assert stream.n_received == len(currents) + len(remaining)
+
+
+def test_stream_back_pressure(qdac):  # noqa
+    with qdac.ch02.measurement(repetitions=-1) as measurement:
+        stream = measurement.stream(buffer_size=3, poll_interval_s=0)
+        wait_until(lambda: stream.n_buffered == 2)
+        # The next two measurements do not fit, so they stay on the instrument
+        time.sleep(0.05)
+        n_received = stream.n_received
+    # -----------------------------------------------------------------------
+    assert n_received == 2
+    assert stream.n_overruns == 0
+    assert np.allclose(stream.read(), [0.01, 0.02])
+
+
+def test_stream_overruns_when_batch_exceeds_buffer(qdac):  # noqa
+    with qdac.ch02.measurement(repetitions=-1) as measurement:
+        stream = measurement.stream(buffer_size=1, poll_interval_s=0)
+        wait_until(lambda: stream.n_buffered == 1)
+    # -----------------------------------------------------------------------
+    assert stream.n_received == 2
+    assert stream.n_overruns == 1
+    assert np.allclose(stream.read(), [0.01])
+
+
+def test_stream_reader_stops_after_error(qdac, mocker):  # noqa
+    with qdac.ch02.measurement(repetitions=-1) as measurement:
+        mocker.patch.object(measurement, '_ask_channel_floats',
+                            side_effect=ValueError('broken'))
+        stream = measurement.stream(buffer_size=100, poll_interval_s=0)
+        # -------------------------------------------------------------------
+        wait_until(lambda: qdac._stream_reader is None)
+        # -------------------------------------------------------------------
+        assert not stream.is_running
+        assert qdac._streams == []
+        with pytest.raises(ValueError, match='broken'):
+            stream.read()
@@ -0,0 +1,187 @@
+import pytest
+import numpy
+from .sim_qdac2_fixtures import qdac  # noqa
+from qcodes_contrib_drivers.drivers.QDevil.QDAC2 import trace_name_from_values
+
+
+@pytest.fixture(scope='function')
+def library(qdac):  # noqa
+    yield qdac.trace_library(max_values=10)
+    qdac._trace_library = None
+
+
+def test_trace_name_depends_on_values_only():
+    # -----------------------------------------------------------------------
+    names = [
+        trace_name_from_values([0, 0.5, 1]),
+        trace_name_from_values(numpy.array([0.0, 0.5, 1.0])),
+        trace_name_from_values([0, 0.5, 1.1]),
+    ]
+    # -----------------------------------------------------------------------
+    assert names[0] == names[1]
+    assert names[0] != names[2]
+    assert names[0].startswith('h')
+
+
+def test_library_uploads_new_trace(qdac, library):  # noqa
+    qdac.start_recording_scpi()
+    # -----------------------------------------------------------------------
+    name = library.trace([0, 0.5, 1])
+    # -----------------------------------------------------------------------
+    assert qdac.get_recorded_scpi_commands() == [
+        f'trac:def "{name}",3',
+        f'trac:data "{name}",0,0.5,1',
+    ]
+    assert library.n_uploads == 1
+    assert library.n_values == 3
+
+
+def test_library_reuses_trace(qdac, library):  # noqa
+    name = library.trace([0, 0.5, 1])
+    qdac.start_recording_scpi()
+    # -----------------------------------------------------------------------
+    again = library.trace(numpy.array([0, 0.5, 1]))
+    # -----------------------------------------------------------------------
+    assert again == name
+    assert qdac.get_recorded_scpi_commands() == []
+    assert library.n_hits == 1
+    assert library.n_uploads == 1
+
+
+def test_library_is_shared(qdac, library):  # noqa
+    # -----------------------------------------------------------------------
+    again = qdac.trace_library(max_values=20)
+    # -----------------------------------------------------------------------
+    assert again is library
+
+
+def test_library_reuses_resident_trace(qdac, mocker):  # noqa
+    values = [1, 2, 3]
+    name = trace_name_from_values(values)
+    mocker.patch.object(qdac, 'traces', return_value=[name])
+    library = qdac.trace_library()
+    qdac.start_recording_scpi()
+    try:
+        # -------------------------------------------------------------------
+        library.trace(values)
+        # -------------------------------------------------------------------
+        assert qdac.get_recorded_scpi_commands() == []
+        assert library.names() == [name]
+        assert library.n_hits == 1
+    finally:
+        qdac._trace_library = None
+
+
+def test_library_counts_resident_traces(qdac, mocker):  # noqa
+    resident = trace_name_from_values([1, 2, 3])
+    mocker.patch.object(qdac, 'traces', return_value=['wave', resident])
+    qdac.start_recording_scpi()
+    library = qdac.trace_library(max_values=9)
+    try:
+        # -------------------------------------------------------------------
+        name = library.trace([4, 5])
+        # -------------------------------------------------------------------
+        assert qdac.get_recorded_scpi_commands() == [
+            'trac:poin? "wave"',
+            f'trac:poin? "{resident}"',
+            f'trac:rem "{resident}"',
+            f'trac:def "{name}",2',
+            f'trac:data "{name}",4,5',
+        ]
+        # The trace named by the user is kept
+        assert library.n_values == 5 + 2
+        assert library.names() == [name]
+    finally:
+        qdac._trace_library = None
+
+
+def test_library_evicts_least_recently_used(qdac, library):  # noqa
+    first = library.trace([1, 2, 3, 4])
+    second = library.trace([5, 6, 7, 8])
+    library.trace([1, 2, 3, 4])
+    qdac.start_recording_scpi()
+    # -----------------------------------------------------------------------
+    third = library.trace([9, 10, 11])
+    # -----------------------------------------------------------------------
+    assert qdac.get_recorded_scpi_commands() == [
+        f'trac:rem "{second}"',
+        f'trac:def "{third}",3',
+        f'trac:data "{third}",9,10,11',
+    ]
+    assert library.names() == [first, third]
+    assert library.n_evictions == 1
+
+
+def test_library_keeps_traces_in_use(qdac, library):  # noqa
+    first = library.trace([1, 2, 3, 4])
+    second = library.trace([5, 6, 7, 8])
+    awg = qdac.ch01.arbitrary_wave(first)
+    qdac.start_recording_scpi()
+    # -----------------------------------------------------------------------
+    library.trace([9, 10, 11])
+    # -----------------------------------------------------------------------
+    assert qdac.get_recorded_scpi_commands()[0] == f'trac:rem "{second}"'
+    assert library.n_references(first) == 1
+    awg.close()
+    assert library.n_references(first) == 0
+
+
+def test_library_full_of_traces_in_use(qdac, library):  # noqa
+    name = library.trace(range(8))
+    with qdac.ch01.arbitrary_wave(name):
+        # -------------------------------------------------------------------
+        with pytest.raises(ValueError) as error:
+            library.trace([1, 2, 3])
+        # -------------------------------------------------------------------
+    assert 'No room for trace of 3 values' in repr(error)
+
+
+def test_library_trace_too_large(qdac, library):  # noqa
+    # -----------------------------------------------------------------------
+    with pytest.raises(ValueError) as error:
+        library.trace(range(11))
+    # -----------------------------------------------------------------------
+    assert 'larger than the library' in repr(error)
+
+
+def test_library_forgotten_on_remove_traces(qdac, library):  # noqa
+    library.trace([1, 2, 3])
+    qdac.remove_traces()
+    qdac.start_recording_scpi()
+    # -----------------------------------------------------------------------
+    name = library.trace([1, 2, 3])
+    # -----------------------------------------------------------------------
+    assert qdac.get_recorded_scpi_commands() == [
+        f'trac:def "{name}",3',
+        f'trac:data "{name}",1,2,3',
+    ]
+
+
+def test_trace_upload_in_chunks(qdac, mocker):  # noqa
+    trace = qdac.allocate_trace('chunky', 5)
+    handle = qdac.visa_handle
+    send_end = list()
+    write_raw = mocker.patch.object(
+        handle, 'write_raw',
+        side_effect=lambda data: send_end.append(handle.send_end))
+    progress = mocker.MagicMock()
+    qdac._no_binary_values = False
+    try:
+        # -------------------------------------------------------------------
+        trace.waveform([1, 2, 3, 4, 5], chunk_size=2, progress=progress)
+        # -------------------------------------------------------------------
+    finally:
+        qdac._no_binary_values = True
+    data = numpy.array([1, 2, 3, 4, 5], dtype='<f4').tobytes()
+    assert [c.args[0] for c in write_raw.call_args_list] == [
+        b'trac:data "chunky",#220',
+        data[0:8],
+        data[8:16],
+        data[16:20],
+        b'\n',
+    ]
+    assert [c.args for c in progress.call_args_list] == [
+        (2, 5), (4, 5), (5, 5)]
+    # END is only asserted with the termination, after the whole block
+    assert send_end == [False, False, False, False, True]
+    assert handle.send_end
@@ -1,6 +1,7 @@
 import pytest
 from .sim_qdac2_fixtures import qdac  # noqa
 import numpy as np
+from qcodes_contrib_drivers.drivers.QDevil.QDAC2 import compress_sweep_column
 
 
 def test_arrangement_default_actuals_1d(qdac):  # noqa
@@ -34,6 +35,23 @@ def test_arrangement_default_actuals_2d(qdac):  # noqa
                        np.repeat([-0.7, -0.4875, -0.275, -0.0625, 0.15], 5))
 
 
+def test_arrangement_sweep_values_leave_arrangement_unchanged(qdac):  # noqa
+    arrangement = qdac.arrange(contacts={'plunger1': 1, 'plunger2': 2})
+    arrangement.initiate_correction('plunger1', [1.0, 0.5])
+    arrangement.set_virtual_voltages({'plunger1': 0.1, 'plunger2': 0.2})
+    # -----------------------------------------------------------------------
+    sweep = arrangement.virtual_detune(
+        contacts=('plunger1', 'plunger2'),
+        start_V=(-0.3, 0.6),
+        end_V=(0.3, -0.6),
+        steps=3)
+    # -----------------------------------------------------------------------
+    assert arrangement.virtual_voltage('plunger1') == 0.1
+    assert arrangement.virtual_voltage('plunger2') == 0.2
+    assert np.allclose(sweep.actual_values_V('plunger1'), [0.0, 0.0, 0.0, 0.0])
+    assert np.allclose(sweep.actual_values_V('plunger2'), [0.6, 0, -0.6, 0])
+
+
 def test_arrangement_sweep(qdac):  # noqa
     qdac.free_all_triggers()
     arrangement = qdac.arrange(contacts={'plunger1': 1, 'plunger2': 2, 'plunger3': 3})
@@ -240,7 +258,7 @@ def test_stability_diagram_external(qdac):  # noqa
         # Plunger 4
         'sour8:dc:trig:sour hold',
         'sour8:volt:mode list',
-        'sour8:list:volt -0.48821,-0.27633,-0.06445,0.14743,0.35931,-0.371441,-0.159561,0.0523187,0.264199,0.476079,-0.254672,-0.0427925,0.169088,0.380968,0.592847,-0.137904,0.0739763,0.285856,0.497736,0.709616,-0.021135,0.190745,0.402625,0.614505,0.826385',
+        'sour8:list:volt -0.48821,-0.27633,-0.06445,0.14743,0.35931,-0.371441,-0.159561,0.0523188,0.264199,0.476079,-0.254672,-0.0427925,0.169088,0.380968,0.592847,-0.137904,0.0739763,0.285856,0.497736,0.709616,-0.021135,0.190745,0.402625,0.614505,0.826385',
         'sour8:list:tmod auto',
         'sour8:list:dwel 1e-06',
         'sour8:dc:del 0',
@@ -348,3 +366,132 @@ def test_arrangement_sweep_outer_trigger(qdac):  # noqa
         # Internal to external
         'sour1:sine:mark:pstart 1',
     ]
+
+
+def test_compress_sweep_column_repeated_pattern():
+    # -----------------------------------------------------------------------
+    voltages, n_hold, n_repeats = compress_sweep_column(
+        np.tile([0.1, 0.3, 0.2], 4))
+    # -----------------------------------------------------------------------
+    assert np.allclose(voltages, [0.1, 0.3, 0.2])
+    assert n_hold == 1
+    assert n_repeats == 4
+
+
+def test_compress_sweep_column_staircase():
+    # -----------------------------------------------------------------------
+    voltages, n_hold, n_repeats = compress_sweep_column(
+        np.repeat([0.1, 0.3, 0.2], 4))
+    # -----------------------------------------------------------------------
+    assert np.allclose(voltages, [0.1, 0.3, 0.2])
+    assert n_hold == 4
+    assert n_repeats == 1
+
+
+def test_compress_sweep_column_irregular():
+    column = np.array([0.1, 0.3, 0.2, 0.1, 0.3, 0.25])
+    # -----------------------------------------------------------------------
+    voltages, n_hold, n_repeats = compress_sweep_column(column)
+    # -----------------------------------------------------------------------
+    assert np.allclose(voltages, column)
+    assert n_hold == 1
+    assert n_repeats == 1
+
+
+def test_compress_sweep_column_without_hold():
+    # -----------------------------------------------------------------------
+    voltages, n_hold, n_repeats = compress_sweep_column(
+        np.zeros(6), hold=False)
+    # -----------------------------------------------------------------------
+    assert np.allclose(voltages, [0])
+    assert n_hold == 1
+    assert n_repeats == 6
+
+
+def test_arrangement_sweep_compressed(qdac):  # noqa
+    qdac.free_all_triggers()
+    arrangement = qdac.arrange(contacts={'plunger1': 1, 'plunger2': 2, 'plunger3': 3})
+    sweep = arrangement.virtual_sweep2d(
+        inner_contact='plunger2',
+        inner_voltages=np.linspace(-0.2, 0.6, 5),
+        outer_contact='plunger3',
+        outer_voltages=[-0.7, -0.4, 0.1, 0.15],
+        inner_step_time_s=2e-6,
+        repetitions=2,
+        compress=True)
+    qdac.start_recording_scpi()
+    # -----------------------------------------------------------------------
+    sweep.start()
+    # -----------------------------------------------------------------------
+    commands = qdac.get_recorded_scpi_commands()
+    assert commands == [
+        # Plunger 1, constant
+        'sour1:dc:trig:sour hold',
+        'sour1:volt:mode list',
+        'sour1:list:volt 0',
+        'sour1:list:tmod auto',
+        'sour1:list:dwel 4e-05',
+        'sour1:dc:del 0',
+        'sour1:list:dir up',
+        'sour1:list:coun 2',
+        'sour1:dc:trig:sour bus',
+        'sour1:dc:init:cont on',
+        'sour1:dc:trig:sour int1',
+        'sour1:dc:init:cont on',
+        # Plunger 2, inner linear sweep
+        'sour2:dc:trig:sour hold',
+        'sour2:volt:mode swe',
+        'sour2:swe:star -0.2',
+        'sour2:swe:stop 0.6',
+        'sour2:swe:poin 5',
+        'sour2:swe:gen step',
+        'sour2:swe:dwel 2e-06',
+        'sour2:dc:del 0',
+        'sour2:swe:dir up',
+        'sour2:swe:coun 8',
+        'sour2:dc:trig:sour bus',
+        'sour2:dc:init:cont on',
+        'sour2:dc:trig:sour int1',
+        'sour2:dc:init:cont on',
+        # Plunger 3, outer irregular staircase
+        'sour3:dc:trig:sour hold',
+        'sour3:volt:mode list',
+        'sour3:list:volt -0.7,-0.4,0.1,0.15',
+        'sour3:list:tmod auto',
+        'sour3:list:dwel 1e-05',
+        'sour3:dc:del 0',
+        'sour3:list:dir up',
+        'sour3:list:coun 2',
+        'sour3:dc:trig:sour bus',
+        'sour3:dc:init:cont on',
+        'sour3:dc:trig:sour int1',
+        'sour3:dc:init:cont on',
+        # Start sweep
+        'tint 1'
+    ]
+
+
+def test_arrangement_sweep_compressed_marks_steps(qdac):  # noqa
+    qdac.free_all_triggers()
+    arrangement = qdac.arrange(
+        contacts={'sensor1': 1, 'plunger2': 2},
+        output_triggers={'dmm': 4})
+    arrangement.set_virtual_voltage('sensor1', 0.1)
+    qdac.start_recording_scpi()
+    # -----------------------------------------------------------------------
+    with arrangement.virtual_sweep(
+            'plunger2', [0.1, 0.5, 0.2], step_trigger='dmm',
+            repetitions=-1, compress=True):
+        pass
+    # -----------------------------------------------------------------------
+    commands = qdac.get_recorded_scpi_commands()
+    assert commands[0] == 'sour2:dc:mark:sst 1'
+    assert 'sour1:list:coun -1' in commands
+    assert 'sour2:list:volt 0.1,0.5,0.2' in commands
+    assert commands[-5:] == [
+        'sour2:dc:mark:sst 0',
+        'sour1:dc:abor',
+        'sour1:dc:trig:sour imm',
+        'sour2:dc:abor',
+        'sour2:dc:trig:sour imm',
+    ]
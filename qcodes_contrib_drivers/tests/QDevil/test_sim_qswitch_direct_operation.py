@@ -145,3 +145,52 @@ def test_autosave_state_can_be_queried(qswitch):  # noqa
     commands = qswitch.get_recorded_scpi_commands()
     assert commands == ['aut?']
     assert state == 'off'
+
+
+def test_trusted_state_is_not_read_back(qswitch):  # noqa
+    qswitch.cache_state('trust')
+    qswitch.connect('15')
+    qswitch.start_recording_scpi()
+    # -----------------------------------------------------------------------
+    state = qswitch.state()
+    # -----------------------------------------------------------------------
+    assert qswitch.get_recorded_scpi_commands() == []
+    assert state == '(@1!0:14!0,16!0:24!0,15!9)'
+
+
+def test_cached_state_is_read_back_when_too_old(qswitch, mocker):  # noqa
+    qswitch.cache_state('ttl', ttl_s=10)
+    monotonic_s = mocker.patch(
+        'qcodes_contrib_drivers.drivers.QDevil.QSwitch.monotonic_s')
+    monotonic_s.return_value = 100
+    qswitch.state_force_update()
+    qswitch.state()
+    monotonic_s.return_value = 111
+    qswitch.start_recording_scpi()
+    # -----------------------------------------------------------------------
+    qswitch.state()
+    # -----------------------------------------------------------------------
+    assert qswitch.get_recorded_scpi_commands() == ['stat?']
+
+
+def test_cached_state_is_read_back_after_error(qswitch, mocker):  # noqa
+    qswitch.cache_state('on_error')
+    qswitch.state_force_update()
+    mocker.patch.object(qswitch, '_write', side_effect=ValueError('boom'))
+    with pytest.raises(ValueError):
+        qswitch.connect('15')
+    mocker.stopall()
+    qswitch.start_recording_scpi()
+    # -----------------------------------------------------------------------
+    qswitch.state()
+    qswitch.state()
+    # -----------------------------------------------------------------------
+    assert qswitch.get_recorded_scpi_commands() == ['stat?']
+
+
+def test_unknown_state_cache_policy(qswitch):  # noqa
+    # -----------------------------------------------------------------------
+    with pytest.raises(ValueError) as error:
+        qswitch.cache_state('sometimes')
+    # -----------------------------------------------------------------------
+    assert 'Unknown state cache policy' in repr(error)
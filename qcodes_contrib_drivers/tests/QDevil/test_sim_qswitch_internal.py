@@ -1,7 +1,11 @@
 import pytest
 from qcodes_contrib_drivers.drivers.QDevil.QSwitch import (
     _state_diff,
+    bitmask_to_compressed_list,
+    bitmask_to_state,
     channel_list_to_state,
+    state_to_bitmask,
+    state_to_compressed_list,
     compress_channel_list,
     expand_channel_list)
 
@@ -52,3 +56,26 @@ def test_state_diff(before, after, positive, negative):  # noqa
     # -----------------------------------------------------------------------
     assert pos == positive
     assert neg == negative
+
+
+@pytest.mark.parametrize('state', [
+    [],
+    [(1, 0)],
+    [(24, 9)],
+    [(1, 0), (2, 0), (3, 0), (23, 7), (24, 7), (4, 9)],
+    [(1, 1), (3, 1), (5, 1), (24, 1), (1, 8)],
+])
+def test_bitmask_round_trip(state):  # noqa
+    # -----------------------------------------------------------------------
+    mask = state_to_bitmask(state)
+    # -----------------------------------------------------------------------
+    assert bitmask_to_state(mask) == state
+    assert bitmask_to_compressed_list(mask) == state_to_compressed_list(state)
+
+
+@pytest.mark.parametrize(('line', 'tap'), [(0, 0), (25, 0), (1, 10), (1, -1)])
+def test_bitmask_rejects_unknown_relays(line, tap):  # noqa
+    # -----------------------------------------------------------------------
+    with pytest.raises(ValueError):
+        state_to_bitmask([(line, tap)])
+    # -----------------------------------------------------------------------
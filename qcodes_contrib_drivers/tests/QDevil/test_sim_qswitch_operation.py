@@ -1,4 +1,5 @@
 import pytest
+import threading
 from unittest.mock import call
 from .sim_qswitch_fixtures import qswitch  # noqa
 
@@ -99,3 +100,58 @@ def test_ground_disconnects_multiple(qswitch):  # noqa
     assert commands == [
         'clos (@14!0:15!0)', '*opc?',
         'open (@14!1:15!1,14!9:15!9)', '*opc?']
+
+
+def test_transaction_sends_net_change_once(qswitch):  # noqa
+    # -----------------------------------------------------------------------
+    with qswitch.transaction():
+        qswitch.connect('14')
+        qswitch.breakout('15', '3')
+        qswitch.connect('16')
+    # -----------------------------------------------------------------------
+    commands = qswitch.get_recorded_scpi_commands()
+    assert commands == [
+        'clos (@15!3,14!9,16!9)', '*opc?',
+        'open (@14!0:16!0)', '*opc?']
+
+
+def test_transaction_cancelling_changes_sends_nothing(qswitch):  # noqa
+    # -----------------------------------------------------------------------
+    with qswitch.transaction():
+        qswitch.connect('15')
+        qswitch.ground('15')
+    # -----------------------------------------------------------------------
+    assert qswitch.get_recorded_scpi_commands() == []
+
+
+def test_transaction_keeps_other_threads_out(qswitch):  # noqa
+    transaction_open = threading.Event()
+
+    def other_thread():
+        transaction_open.wait(5)
+        qswitch.connect('16')
+
+    thread = threading.Thread(target=other_thread)
+    thread.start()
+    # -----------------------------------------------------------------------
+    with qswitch.transaction():
+        qswitch.connect('14')
+        transaction_open.set()
+        thread.join(0.1)
+        waiting = thread.is_alive()
+    thread.join(5)
+    # -----------------------------------------------------------------------
+    assert waiting
+    assert qswitch.get_recorded_scpi_commands() == [
+        'clos (@14!9)', '*opc?', 'open (@14!0)', '*opc?',
+        'clos (@16!9)', '*opc?', 'open (@16!0)', '*opc?']
+
+
+def test_transaction_discarded_on_error(qswitch):  # noqa
+    # -----------------------------------------------------------------------
+    with pytest.raises(ValueError):
+        with qswitch.transaction():
+            qswitch.connect('15')
+            qswitch.connect('plunger')
+    # -----------------------------------------------------------------------
+    assert qswitch.get_recorded_scpi_commands() == []
@@ -0,0 +1,14 @@
+from .sim_qswitch_fixtures import qswitch  # noqa
+
+
+def test_profile_records_messages(qswitch):  # noqa
+    profile = qswitch.start_profiling()
+    # -----------------------------------------------------------------------
+    qswitch.connect('15')
+    # -----------------------------------------------------------------------
+    qswitch.stop_profiling()
+    records = profile.records()
+    assert [record.message for record in records] == [
+        'clos (@15!9)', '*opc?', 'all?', 'open (@15!0)', '*opc?', 'all?']
+    assert {record.operation for record in records} == {'QSwitch.connect'}
+    assert profile.summary()['QSwitch.connect']['n_messages'] == 6